@@ -0,0 +1,97 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+
+class UserCache:
+    """
+    Per-process, short-TTL cache of users (with their role) keyed by id.
+
+    Saves in this process invalidate entries through signals in authservice.models;
+    other worker processes pick changes up once the TTL runs out. Holds at most
+    AUTH_USER_CACHE_MAX_SIZE users, evicting the least recently used.
+
+    Users handed out carry ``_cached_values`` (their column values when cached), so that
+    User.save() on ``request.user`` writes only the columns the request changed instead of
+    reverting newer writes with the cached snapshot.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'AUTH_USER_CACHE_TTL', 30)
+
+    @property
+    def max_size(self):
+        return getattr(settings, 'AUTH_USER_CACHE_MAX_SIZE', 10000)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+        # Hand out a copy so a request mutating request.user cannot leak into other requests
+        user = copy.copy(entry[1])
+        user._cached_values = entry[2]
+        return user
+
+    def set(self, user_id, user):
+        values = {field.attname: getattr(user, field.attname) for field in user._meta.concrete_fields}
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, copy.copy(user), values)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication that resolves the user and role from user_cache before hitting the database."""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        user = user_cache.get(user_id)
+        if user is None:
+            try:
+                user = self.user_model.objects.select_related('role').get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.set(user_id, user)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
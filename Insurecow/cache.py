@@ -0,0 +1,32 @@
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.utils.connection import ConnectionProxy
+
+# How long data cached per process may lag behind writes made in other processes
+PROCESS_LOCAL_TIMEOUT = 60
+
+
+def is_shared_cache(cache):
+    """Whether ``cache`` is seen by every worker (Redis, Memcached, database) rather than one process."""
+    if isinstance(cache, ConnectionProxy):
+        # django.core.cache.cache forwards attribute access but is not an instance of the backend
+        cache = caches[cache._alias]
+    return not isinstance(cache, (LocMemCache, DummyCache))
+
+
+def bounded_timeout(cache, timeout):
+    """
+    ``timeout`` on a shared cache. On a per-process cache other workers never see an invalidation,
+    so entries there live at most PROCESS_LOCAL_TIMEOUT seconds.
+    """
+    if is_shared_cache(cache):
+        return timeout
+    return PROCESS_LOCAL_TIMEOUT if timeout is None else min(timeout, PROCESS_LOCAL_TIMEOUT)
+
+
+def new_version():
+    """A cache version that is never handed out twice, even after the version key is evicted."""
+    return time.time_ns()
@@ -0,0 +1,242 @@
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import SuspiciousFileOperation
+from django.db.models import Q
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+
+from Insurecow.authentication import CachedJWTAuthentication
+from assetservice.models import ASSET_MEDIA_FIELDS
+
+DEFAULT_MEDIA_SERVING_SETTINGS = {
+    # None = stream from Django, 'x-accel-redirect' = hand off to nginx, 'x-sendfile' = Apache/lighttpd
+    'OFFLOAD': None,
+    'MEDIA_ACCEL_LOCATION': '/protected-media/',  # internal nginx locations aliased to MEDIA_ROOT/STATIC_ROOT
+    'STATIC_ACCEL_LOCATION': '/protected-static/',
+    'ACCESS_CACHE_SECONDS': 300,
+    'CHUNK_SIZE': 64 * 1024,
+}
+
+# Stored media and who may read it: (model, file fields, lookups giving the user ids allowed)
+MEDIA_ACCESS = (
+    ('assetservice.Asset', ASSET_MEDIA_FIELDS, ('owner_id',)),
+    ('authservice.UserPersonalInfo', ('profile_image', 'nid_front', 'nid_back'), ('user_id',)),
+    ('insuranceservice.AssetInsurance', ('insurance_certificate',),
+     ('asset__owner_id', 'insurance_provider__user_id')),
+    ('insuranceservice.InsuranceClaim', ('claim_documents', 'settlement_documents'),
+     ('asset_insurance__asset__owner_id', 'asset_insurance__insurance_provider__user_id')),
+)
+# Readable without logging in
+PUBLIC_MEDIA = (
+    ('insuranceservice.InsuranceCompany', ('logo',)),
+    ('authservice.OrganizationInfo', ('logo',)),
+)
+
+CAS_NAME = re.compile(r'^[0-9a-f]{64}$')
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_media_serving_setting(name):
+    return getattr(settings, 'MEDIA_SERVING', {}).get(name, DEFAULT_MEDIA_SERVING_SETTINGS[name])
+
+
+def media_access(name):
+    """
+    (public, user ids) for a stored file: whether anyone may read it, and the users it belongs to.
+    A rendition answers for its source image. Cached for ACCESS_CACHE_SECONDS.
+    """
+    key = 'media_access:' + hashlib.sha256(name.encode()).hexdigest()
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    from administrator.models import ImageRendition
+
+    source = ImageRendition.objects.filter(name=name).values_list('source', flat=True).first() or name
+    public = any(
+        apps.get_model(model)._default_manager.filter(_any_field(fields, source)).exists()
+        for model, fields in PUBLIC_MEDIA
+    )
+    owners = set()
+    if not public:
+        for model, fields, lookups in MEDIA_ACCESS:
+            for row in apps.get_model(model)._default_manager.filter(_any_field(fields, source)).values_list(*lookups):
+                owners.update(user_id for user_id in row if user_id is not None)
+    result = (public, owners)
+    cache.set(key, result, get_media_serving_setting('ACCESS_CACHE_SECONDS'))
+    return result
+
+
+def _any_field(fields, name):
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{field: name})
+    return condition
+
+
+def can_access_media(user, name):
+    public, owners = media_access(name)
+    if public:
+        return True
+    if user is None:
+        return False
+    if user.is_superuser or user.pk in owners:
+        return True
+    # Managers may read their farmers' files, at any depth
+    from authservice.models import UserHierarchy
+
+    return bool(owners) and UserHierarchy.objects.filter(ancestor_id=user.pk, descendant_id__in=owners).exists()
+
+
+def get_request_user(request):
+    """The session user (Django admin) or the user of a Bearer token; None when neither is present."""
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    result = CachedJWTAuthentication().authenticate(request)
+    return result[0] if result else None
+
+
+def content_digest(name):
+    """The SHA-256 a content-addressed name is made of, or None for other names."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return stem if CAS_NAME.match(stem) else None
+
+
+def file_etag(name, st):
+    # A content-addressed name is the hash of the content, the strongest validator there is
+    digest = content_digest(name)
+    return f'"{digest}"' if digest else f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single byte range, None to send the whole file, 'invalid' if unsatisfiable."""
+    match = RANGE_HEADER.match(header.strip())
+    if not match:
+        return None  # malformed or multiple ranges: ignoring Range is always allowed
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    if first == '':
+        length = int(last)
+        if length == 0:
+            return 'invalid'
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'invalid'
+    return start, end
+
+
+def iter_file_range(path, start, length, chunk_size):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            block = f.read(min(chunk_size, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def serve_file(request, path, document_root, accel_location=None, public=False):
+    """
+    Serve ``path`` under ``document_root`` with ETag/If-None-Match, single byte ranges (If-Range
+    aware) and, when MEDIA_SERVING['OFFLOAD'] is set, X-Accel-Redirect or X-Sendfile.
+    """
+    try:
+        fullpath = safe_join(document_root, path)
+    except SuspiciousFileOperation:
+        raise Http404("File not found.")
+    try:
+        st = os.stat(fullpath)
+    except (FileNotFoundError, NotADirectoryError):
+        raise Http404("File not found.")
+    if not stat.S_ISREG(st.st_mode):
+        raise Http404("File not found.")
+
+    etag = file_etag(path, st)
+    last_modified = http_date(st.st_mtime)
+    content_type, encoding = mimetypes.guess_type(fullpath)
+    content_type = content_type or 'application/octet-stream'
+    # Content at a content-addressed name never changes; anything else is revalidated with the ETag
+    cache_control = 'public' if public else 'private'
+    cache_control += ', max-age=31536000, immutable' if content_digest(path) else ', no-cache'
+
+    def with_headers(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = last_modified
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = cache_control
+        if encoding:
+            response['Content-Encoding'] = encoding
+        return response
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        if '*' in etags or etag in etags or f'W/{etag}' in etags:
+            return with_headers(HttpResponseNotModified())
+
+    offload = get_media_serving_setting('OFFLOAD')
+    if offload:
+        # The web server takes care of Range itself
+        response = HttpResponse(content_type=content_type)
+        if offload == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = accel_location.rstrip('/') + '/' + path.lstrip('/')
+        else:
+            response['X-Sendfile'] = fullpath
+        return with_headers(response)
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and (not if_range or if_range.strip() in (etag, last_modified)):
+        byte_range = parse_range(range_header, st.st_size)
+
+    if byte_range == 'invalid':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{st.st_size}'
+        return with_headers(response)
+
+    if byte_range is None:
+        # FileResponse lets the WSGI server use sendfile() where it can
+        return with_headers(FileResponse(open(fullpath, 'rb'), content_type=content_type))
+
+    start, end = byte_range
+    length = end - start + 1
+    response = StreamingHttpResponse(
+        iter_file_range(fullpath, start, length, get_media_serving_setting('CHUNK_SIZE')),
+        status=206, content_type=content_type,
+    )
+    response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+    response['Content-Length'] = str(length)
+    return with_headers(response)
+
+
+def serve_media(request, path):
+    """Uploaded media, readable by the owning user, their managers and superusers (logos are public)."""
+    try:
+        user = get_request_user(request)
+    except (AuthenticationFailed, InvalidToken, TokenError):
+        return HttpResponse("Invalid or expired token.", status=401)
+
+    if not can_access_media(user, path):
+        return HttpResponse("Authentication required.", status=401) if user is None else \
+            HttpResponse("You do not have access to this file.", status=403)
+    return serve_file(request, path, settings.MEDIA_ROOT, get_media_serving_setting('MEDIA_ACCEL_LOCATION'))
+
+
+def serve_static(request, path):
+    return serve_file(request, path, settings.STATIC_ROOT, get_media_serving_setting('STATIC_ACCEL_LOCATION'),
+                      public=True)
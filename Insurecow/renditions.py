@@ -0,0 +1,223 @@
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import default_storage
+from django.db import transaction
+from rest_framework import serializers
+
+DEFAULT_RENDITION_SETTINGS = {
+    'SIZES': {'thumbnail': 320, 'medium': 1280},  # longest side in pixels; images are never upscaled
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    'WORKERS': None,  # None = one per CPU, 0 = render in the calling process
+}
+
+PIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+
+def get_rendition_setting(name):
+    return getattr(settings, 'IMAGE_RENDITIONS', {}).get(name, DEFAULT_RENDITION_SETTINGS[name])
+
+
+def render_image(data, sizes, formats, quality):
+    """
+    Resize image bytes to each of ``sizes`` ({rendition: longest side}) in each of ``formats``.
+
+    Returns [(rendition, format, bytes, width, height)]. Orientation from EXIF is applied to the
+    pixels and no metadata (EXIF, GPS, XMP) is written to the output.
+    """
+    from PIL import Image, ImageOps
+
+    largest = max(sizes.values())
+    with Image.open(io.BytesIO(data)) as image:
+        # JPEG decoders can scale by 1/2..1/8 while decoding, far cheaper than resizing afterwards
+        image.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+    results = []
+    # Largest first, each size resized from the previous one
+    for rendition, side in sorted(sizes.items(), key=lambda item: -item[1]):
+        image = image.copy()
+        image.thumbnail((side, side), Image.Resampling.LANCZOS)
+        image.info = {}
+        for file_format in formats:
+            output = image
+            if file_format == 'jpeg' and has_alpha:
+                output = Image.new('RGB', image.size, (255, 255, 255))
+                output.paste(image, mask=image.getchannel('A'))
+            buffer = io.BytesIO()
+            options = {'quality': quality}
+            if file_format == 'jpeg':
+                options.update(optimize=True, progressive=True)
+            else:
+                options.update(method=4)
+            output.save(buffer, PIL_FORMATS[file_format], **options)
+            results.append((rendition, file_format, buffer.getvalue(), *image.size))
+    return results
+
+
+def generate_renditions(sources):
+    """Render and store every missing rendition of the stored images ``sources``. Returns the number written."""
+    from PIL import UnidentifiedImageError
+    from administrator.models import ImageRendition
+
+    sizes = get_rendition_setting('SIZES')
+    formats = tuple(get_rendition_setting('FORMATS'))
+    quality = get_rendition_setting('QUALITY')
+    done = set(ImageRendition.objects.filter(source__in=sources).values_list('source', flat=True).distinct())
+
+    written = 0
+    for source in sources:
+        if source in done or not default_storage.exists(source):
+            continue
+        with default_storage.open(source, 'rb') as f:
+            data = f.read()
+        try:
+            results = render_image(data, sizes, formats, quality)
+        except (UnidentifiedImageError, OSError, ValueError) as e:
+            print(f"Error rendering {source}: {str(e)}")
+            continue
+
+        stem = os.path.splitext(os.path.basename(source))[0]
+        rows = []
+        for rendition, file_format, content, width, height in results:
+            name = default_storage.save(f"renditions/{stem}_{rendition}.{file_format}", ContentFile(content))
+            rows.append(ImageRendition(source=source, rendition=rendition, format=file_format,
+                                       name=name, width=width, height=height))
+        ImageRendition.objects.bulk_create(rows, ignore_conflicts=True)
+        written += len(rows)
+    return written
+
+
+def _init_worker():
+    django.setup()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                workers = get_rendition_setting('WORKERS') or os.cpu_count() or 1
+                # spawn, not fork: a forked worker would share the parent's database connections
+                _pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                            mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+
+def _report_failure(future):
+    if future.exception() is not None:
+        print(f"Error generating image renditions: {str(future.exception())}")
+
+
+def schedule_renditions(sources):
+    """Generate renditions for ``sources`` once the current transaction commits, off the request path."""
+    sources = sorted({source for source in sources if source})
+    if not sources:
+        return
+
+    def submit():
+        from administrator.models import ImageRendition
+
+        done = set(ImageRendition.objects.filter(source__in=sources).values_list('source', flat=True))
+        missing = [source for source in sources if source not in done]
+        if not missing:
+            return
+        if get_rendition_setting('WORKERS') == 0:
+            generate_renditions(missing)
+        else:
+            get_pool().submit(generate_renditions, missing).add_done_callback(_report_failure)
+
+    transaction.on_commit(submit)
+
+
+def get_renditions(sources):
+    """{source: {rendition: {format: stored name}}} for the given stored images, in one query."""
+    from administrator.models import ImageRendition
+
+    renditions = {}
+    rows = ImageRendition.objects.filter(source__in=list(sources)).values_list('source', 'rendition', 'format', 'name')
+    for source, rendition, file_format, name in rows:
+        renditions.setdefault(source, {}).setdefault(rendition, {})[file_format] = name
+    return renditions
+
+
+class RenditionsField(serializers.Field):
+    """
+    Read-only URLs of an image field's renditions, ``{"thumbnail": {"webp": url, "jpeg": url}, ...}``,
+    or None until they have been generated. With many=True the whole page is looked up at once.
+    """
+
+    def __init__(self, image_field, **kwargs):
+        kwargs.update(source='*', read_only=True)
+        super().__init__(**kwargs)
+        self.image_field = image_field
+
+    def source_name(self, instance):
+        return getattr(getattr(instance, self.image_field, None), 'name', None) or None
+
+    def batch_instances(self):
+        """
+        What this field's serializer is given for each item of the nearest many=True serializer
+        above it, following nested serializers' sources (``personal_info`` in UserSerializer).
+        """
+        attrs = []
+        node = self.parent
+        while node.parent is not None and not isinstance(node.parent, serializers.ListSerializer):
+            attrs[:0] = node.source_attrs
+            node = node.parent
+        items = getattr(node.parent, 'instance', None)
+        if items is None:
+            return []
+        instances = []
+        for instance in items:
+            for attr in attrs:
+                try:
+                    instance = getattr(instance, attr)
+                except ObjectDoesNotExist:
+                    instance = None
+                if instance is None:
+                    break
+            if instance is not None:
+                instances.append(instance)
+        return instances
+
+    def load(self, name):
+        cache = self.root.__dict__.setdefault('_renditions', {})
+        if name not in cache:
+            names = {name}
+            fields = [field for field in self.parent.fields.values() if isinstance(field, RenditionsField)]
+            for instance in self.batch_instances():
+                names.update(field.source_name(instance) for field in fields)
+            names = {n for n in names if n and n not in cache}
+            found = get_renditions(names)
+            for n in names:
+                cache[n] = found.get(n)
+        return cache[name]
+
+    def to_representation(self, instance):
+        name = self.source_name(instance)
+        renditions = self.load(name) if name else None
+        if not renditions:
+            return None
+        request = self.context.get('request')
+        urls = {}
+        for rendition, formats in renditions.items():
+            urls[rendition] = {}
+            for file_format, stored in formats.items():
+                url = default_storage.url(stored)
+                urls[rendition][file_format] = request.build_absolute_uri(url) if request else url
+        return urls
@@ -61,7 +61,7 @@ MIDDLEWARE = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'Insurecow.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -159,6 +159,17 @@ MEDIA_DIRS = [
     BASE_DIR / "media",
 ]
 
+# Uploaded media is stored by content hash (MEDIA_ROOT/cas/ab/cd/<sha256>.<ext>), so the same
+# document or photo uploaded twice is kept once. Run `manage.py dedupe_media` to move older files.
+STORAGES = {
+    "default": {
+        "BACKEND": "Insurecow.storage.ContentAddressedStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -178,6 +189,118 @@ SIMPLE_JWT = {
     'JWK_URL': None,
 }
 
+# Audit log buffering: 'sync' writes inline (tests), 'on_commit' batches per
+# request after the transaction commits, 'background' adds a flusher thread.
+AUDIT_LOG = {
+    'MODE': 'on_commit',
+    'BATCH_SIZE': 200,
+    'MAX_QUEUE_SIZE': 10000,
+    'FLUSH_INTERVAL': 2,
+}
+
+# Replace with a shared backend (Redis/Memcached) when running several workers. With this
+# per-process cache, cached data that other workers invalidate (insurance catalog, reference
+# data, OTP limits) is kept at most Insurecow.cache.PROCESS_LOCAL_TIMEOUT seconds.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    }
+}
+
+# OTP request limiting. CacheRateLimiter needs a shared CACHES backend
+# (Redis/Memcached) to enforce limits across processes and uses DatabaseRateLimiter,
+# which counts OTPRequestLog rows, while CACHES is per-process. MemoryRateLimiter
+# is per-process.
+OTP_RATE_LIMIT = {
+    'BACKEND': 'authservice.ratelimit.CacheRateLimiter',
+    'CACHE_ALIAS': 'default',
+    'BUCKETS': 10,
+}
+
+# OTP SMS delivery. Messages are queued in OTPOutbox and sent by
+# `manage.py run_otp_outbox`; add real providers under PROVIDERS.
+SMS = {
+    'DEFAULT_PROVIDER': 'fake',
+    'PROVIDERS': {
+        'fake': {'BACKEND': 'authservice.sms.FakeSMSGateway', 'OPTIONS': {}},
+    },
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF': 10,
+    'MAX_RETRY_BACKOFF': 600,
+    'CLAIM_TIMEOUT': 300,
+}
+
+# Seconds an authenticated user (and role) stays in the per-process cache
+AUTH_USER_CACHE_TTL = 30
+# Users kept in that cache at most; the least recently used are evicted
+AUTH_USER_CACHE_MAX_SIZE = 10000
+
+# How LoginSerializer handles the Token table: 'sync' reuses/refreshes the
+# stored row in the request, 'async' stores freshly minted tokens from a
+# background thread, 'off' never writes it.
+LOGIN_TOKEN_STORE = 'async'
+
+# Bulk farmer onboarding (authservice.onboarding): rows per API request, rows per bulk_create
+# chunk and processes used for password hashing (None = one per CPU, 0 = inline)
+ONBOARDING = {
+    'MAX_ROWS': 5000,
+    'CHUNK_SIZE': 500,
+    'HASH_WORKERS': None,
+    'MIN_POOL_ROWS': 8,
+}
+
+# Resumable chunked uploads (assetservice.uploads). Partial files live in TEMP_DIR
+# (default: FILE_UPLOAD_TEMP_DIR or the system temp dir), outside MEDIA_ROOT.
+CHUNKED_UPLOAD = {
+    'TEMP_DIR': None,
+    'MAX_SIZE': 200 * 1024 * 1024,
+    'CHUNK_SIZE': 1024 * 1024,
+    'EXPIRY_HOURS': 24,
+}
+
+# Thumbnail/medium copies of uploaded photos (Insurecow.renditions), rendered in a process
+# pool after the upload commits. WORKERS: None = one per CPU, 0 = render inline.
+IMAGE_RENDITIONS = {
+    'SIZES': {'thumbnail': 320, 'medium': 1280},
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    'WORKERS': None,
+}
+
+# /media/ and /static/ (Insurecow.media). OFFLOAD = 'x-accel-redirect' lets nginx send the file
+# from an `internal` location aliased to MEDIA_ROOT / STATIC_ROOT; 'x-sendfile' for Apache.
+MEDIA_SERVING = {
+    'OFFLOAD': None,
+    'MEDIA_ACCEL_LOCATION': '/protected-media/',
+    'STATIC_ACCEL_LOCATION': '/protected-static/',
+    'ACCESS_CACHE_SECONDS': 300,
+}
+
+# Near-duplicate asset photo check (assetservice.duplicates): Hamming distance between 64-bit
+# dHashes at which another asset is reported as a possible re-registration.
+DUPLICATE_PHOTOS = {
+    'MAX_DISTANCE': 6,
+    'MAX_CANDIDATES': 10,
+}
+
+# Muzzle-print matching (assetservice.muzzle): vectors are mirrored into memory-mapped files
+# in DIR (default BASE_DIR/muzzle_index), searched BLOCK_ROWS rows at a time.
+MUZZLE_INDEX = {
+    'DIR': None,
+    'DIMENSIONS': 128,
+    'BLOCK_ROWS': 65536,
+}
+
+# Bulk asset registration (assetservice.bulk): rows per request and rows per INSERT.
+BULK_ASSETS = {
+    'MAX_ROWS': 500,
+    'BATCH_SIZE': 100,
+}
+
 # CORS Configuration
 CORS_ALLOW_ALL_ORIGINS = True
 AUTH_USER_MODEL = 'authservice.User'
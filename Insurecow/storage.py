@@ -0,0 +1,100 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    FileSystemStorage that names files by their SHA-256, so identical uploads are written once.
+
+    ``invoice.pdf`` is stored as ``cas/ab/cd/abcd...ef.pdf`` whatever upload_to asked for. Every
+    save of the same content returns that name and bumps MediaBlob.ref_count; delete() drops a
+    reference and removes the file with the last one. Files saved before this backend keep their
+    old names and are handled like FileSystemStorage until ``manage.py dedupe_media`` moves them.
+
+    Rows release their references when deleted or when a file is replaced (receivers in
+    administrator.models). queryset.update() and files written by a transaction that rolled back
+    are not seen there; ``manage.py dedupe_media --delete-orphans``, run periodically, recounts
+    references from the rows and removes blobs nothing uses.
+    """
+
+    def __init__(self, prefix='cas', shard_depth=2, shard_width=2, **kwargs):
+        super().__init__(**kwargs)
+        self.prefix = prefix
+        self.shard_depth = shard_depth
+        self.shard_width = shard_width
+
+    def blob_name(self, digest, name):
+        shards = [digest[i * self.shard_width:(i + 1) * self.shard_width] for i in range(self.shard_depth)]
+        extension = os.path.splitext(name)[1].lower()
+        return '/'.join([self.prefix, *shards, digest + extension])
+
+    def is_blob_name(self, name):
+        return bool(name) and name.replace('\\', '/').startswith(self.prefix + '/')
+
+    def get_available_name(self, name, max_length=None):
+        # The final name comes from the content in _save(); no need to probe for a free one
+        return name
+
+    def _save(self, name, content):
+        temp_dir = self.path(os.path.join(self.prefix, 'tmp'))
+        os.makedirs(temp_dir, exist_ok=True)
+
+        hasher = hashlib.sha256()
+        size = 0
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as temp:
+            for chunk in content.chunks():
+                hasher.update(chunk)
+                temp.write(chunk)
+                size += len(chunk)
+
+        digest = hasher.hexdigest()
+        name = self.blob_name(digest, name)
+        path = self.path(name)
+        if os.path.exists(path):
+            os.remove(temp.name)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                file_move_safe(temp.name, path, allow_overwrite=False)
+            except FileExistsError:
+                os.remove(temp.name)  # Someone stored the same content meanwhile
+            if self.file_permissions_mode is not None:
+                os.chmod(path, self.file_permissions_mode)
+
+        self.add_reference(name, digest, size)
+        return name
+
+    def add_reference(self, name, digest, size, count=1):
+        from administrator.models import MediaBlob
+
+        with transaction.atomic():
+            blob, created = MediaBlob.objects.get_or_create(
+                name=name, defaults={'sha256': digest, 'size': size, 'ref_count': count}
+            )
+            if not created:
+                MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + count)
+
+    def delete(self, name):
+        if not self.is_blob_name(name):
+            return super().delete(name)
+
+        from administrator.models import MediaBlob
+
+        with transaction.atomic():
+            blob = MediaBlob.objects.select_for_update().filter(name=name).first()
+            if blob is not None and blob.ref_count > 1:
+                MediaBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+                return
+            if blob is not None:
+                blob.delete()
+        super().delete(name)
@@ -1,7 +1,7 @@
-from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include, re_path
-from django.views.static import serve
+
+from Insurecow.media import serve_media, serve_static
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -9,8 +9,8 @@ urlpatterns = [
     path('api/v1/insurance/', include('insuranceservice.urls'), name='insurance-api'),
     path('api/v1/asset/', include('assetservice.urls'), name='assetservice-api'),
     path('api/v1/administrator/', include('administrator.urls'), name='administrator-api'),
-    re_path(r'^media/(?P<path>.*)$', serve, {'document_root': settings.MEDIA_ROOT}),
-    re_path(r'^static/(?P<path>.*)$', serve, {'document_root': settings.STATIC_ROOT})
+    re_path(r'^media/(?P<path>.*)$', serve_media),
+    re_path(r'^static/(?P<path>.*)$', serve_static)
 
 
 ]
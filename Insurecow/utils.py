@@ -7,7 +7,8 @@ def generate_otp():
     return str(random.randint(100000, 999999))
 
 def send_otp(mobile_number, otp_code):
-    print(f"Sending OTP {otp_code} to {mobile_number}")
+    from authservice.sms import enqueue_otp
+    return enqueue_otp(mobile_number, otp_code)
 
 # def success_response(message="", data=None, status_code=status.HTTP_200_OK):
 #     return Response({
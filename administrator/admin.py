@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from administrator.models import AuditLog
+from administrator.models import AuditLog, ImageRendition, MediaBlob
 
 # Register your models here.
-admin.site.register(AuditLog)
\ No newline at end of file
+admin.site.register(AuditLog)
+admin.site.register(MediaBlob)
+admin.site.register(ImageRendition)
@@ -0,0 +1,157 @@
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import transaction, close_old_connections
+
+DEFAULT_AUDIT_SETTINGS = {
+    'MODE': 'on_commit',
+    'BATCH_SIZE': 200,
+    'MAX_QUEUE_SIZE': 10000,
+    'FLUSH_INTERVAL': 2,
+}
+
+logger = logging.getLogger(__name__)
+
+
+def get_audit_setting(name):
+    return getattr(settings, 'AUDIT_LOG', {}).get(name, DEFAULT_AUDIT_SETTINGS[name])
+
+
+class AuditBuffer:
+    """
+    Collects unsaved AuditLog rows and writes them with bulk_create.
+
+    Modes:
+      - 'sync': write immediately inside the caller's transaction (tests).
+      - 'on_commit': queue entries once the surrounding transaction commits and
+        flush when a batch fills up, at the end of each request and at exit.
+      - 'background': like 'on_commit', but a daemon thread also flushes every
+        FLUSH_INTERVAL seconds.
+
+    The queue is bounded; when it is full the caller flushes synchronously
+    rather than dropping entries. A batch that fails to insert is retried row by
+    row, and any row that still fails is logged at error level with its contents.
+    """
+
+    def __init__(self):
+        self._queue = None
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+    @property
+    def mode(self):
+        return get_audit_setting('MODE')
+
+    @property
+    def queue(self):
+        if self._queue is None:
+            self._queue = queue.Queue(maxsize=get_audit_setting('MAX_QUEUE_SIZE'))
+        return self._queue
+
+    def enqueue(self, entry):
+        if self.mode == 'sync':
+            self._write([entry])
+            return
+
+        if self.mode == 'background':
+            self._ensure_thread()
+
+        transaction.on_commit(lambda: self._put(entry))
+
+    def _put(self, entry):
+        try:
+            self.queue.put_nowait(entry)
+        except queue.Full:
+            self.flush()
+            try:
+                self.queue.put_nowait(entry)
+            except queue.Full:
+                # Other threads refilled it meanwhile; write this entry now rather than raise in the caller
+                self._write([entry])
+                return
+
+        if self.queue.qsize() >= get_audit_setting('BATCH_SIZE'):
+            if self.mode == 'background':
+                self._wakeup.set()
+            else:
+                self.flush()
+
+    def _drain(self):
+        entries = []
+        while True:
+            try:
+                entries.append(self.queue.get_nowait())
+            except queue.Empty:
+                return entries
+
+    def flush(self):
+        """Write everything currently buffered. Returns the number of rows written."""
+        with self._flush_lock:
+            entries = self._drain()
+            if entries:
+                self._write(entries)
+            return len(entries)
+
+    def _write(self, entries):
+        from .models import AuditLog
+
+        try:
+            # A savepoint, so a failure inside the caller's transaction ('sync' mode) can be retried
+            with transaction.atomic():
+                AuditLog.objects.bulk_create(entries, batch_size=get_audit_setting('BATCH_SIZE'))
+            return
+        except Exception:
+            logger.exception("Writing %d audit log entries in bulk failed; writing them one by one", len(entries))
+
+        for entry in entries:
+            try:
+                with transaction.atomic():
+                    entry.pk = None
+                    entry.save(force_insert=True)
+            except Exception:
+                logger.exception(
+                    "Audit log entry lost: user=%s model=%s instance=%s action=%s changes=%r",
+                    entry.user_id, entry.model_name, entry.instance_id, entry.action, entry.changes,
+                )
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name='audit-log-flusher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        interval = get_audit_setting('FLUSH_INTERVAL')
+        while not self._stopped.is_set():
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            self.flush()
+            close_old_connections()
+
+    def shutdown(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+
+audit_buffer = AuditBuffer()
+
+
+def flush_audit_buffer(**kwargs):
+    if audit_buffer.mode == 'on_commit' and audit_buffer.flush():
+        # request_finished already ran close_old_connections before this receiver
+        close_old_connections()
+
+
+request_finished.connect(flush_audit_buffer, dispatch_uid='administrator.flush_audit_buffer')
+atexit.register(audit_buffer.shutdown)
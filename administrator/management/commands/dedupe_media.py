@@ -0,0 +1,153 @@
+import hashlib
+import os
+import time
+from collections import defaultdict
+
+from django.apps import apps
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models, transaction
+
+from Insurecow.storage import ContentAddressedStorage
+from administrator.models import ImageRendition, MediaBlob
+
+
+def file_digest(path):
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def collect_references():
+    """
+    {stored name: [(model, field, pk), ...]} over every file field kept in the content-addressed
+    storage and every image rendition.
+    """
+    references = defaultdict(list)
+    for model in apps.get_models():
+        for field in model._meta.concrete_fields:
+            if not isinstance(field, models.FileField) or not isinstance(field.storage, ContentAddressedStorage):
+                continue
+            rows = model._default_manager.exclude(**{f'{field.attname}__isnull': True}).exclude(**{field.attname: ''})
+            for pk, name in rows.values_list('pk', field.attname).iterator():
+                references[name].append((model, field, pk))
+    # Renditions are saved through the same storage but recorded by name in a CharField
+    name_field = ImageRendition._meta.get_field('name')
+    for pk, name in ImageRendition.objects.exclude(name='').values_list('pk', 'name').iterator():
+        references[name].append((ImageRendition, name_field, pk))
+    return references
+
+
+def find_untracked_blobs(storage, referenced, min_age):
+    """
+    Files under the content-addressed prefix that no row uses and no MediaBlob records, such as
+    blobs written by a transaction that rolled back, untouched for at least ``min_age`` hours.
+    """
+    tracked = set(MediaBlob.objects.values_list('name', flat=True))
+    cutoff = time.time() - min_age * 3600
+    untracked = []
+    for directory, _, files in os.walk(storage.path(storage.prefix)):
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, storage.location).replace(os.sep, '/')
+            if name in referenced or name in tracked:
+                continue
+            # ctime moves on link and rename, so a blob being stored right now is never old enough
+            stat = os.stat(path)
+            if max(stat.st_mtime, stat.st_ctime) > cutoff:
+                continue
+            untracked.append(path)
+    return untracked
+
+
+class Command(BaseCommand):
+    help = ("Move media saved before ContentAddressedStorage into the content-addressed store, keeping one "
+            "copy per distinct content, and recount MediaBlob references from the rows that use them. "
+            "Run it periodically with --delete-orphans to reclaim files nothing uses.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would change without touching anything.")
+        parser.add_argument('--delete-orphans', action='store_true',
+                            help="Delete stored blobs that no row references any more, and untracked files.")
+        parser.add_argument('--min-age', type=float, default=24,
+                            help="Hours an untracked file must be untouched before it counts (default 24).")
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("STORAGES['default'] is not Insurecow.storage.ContentAddressedStorage.")
+        storage = default_storage
+        dry_run = options['dry_run']
+
+        references = collect_references()
+        moved = merged = missing = saved = 0
+        for name, refs in list(references.items()):
+            if storage.is_blob_name(name):
+                continue
+            path = storage.path(name)
+            if not os.path.exists(path):
+                self.stderr.write(f"{name} is missing ({len(refs)} references), left as is")
+                missing += 1
+                continue
+
+            blob_name = storage.blob_name(file_digest(path), name)
+            blob_path = storage.path(blob_name)
+            duplicate = blob_name in references or os.path.exists(blob_path)
+            if duplicate:
+                merged += 1
+                saved += os.path.getsize(path)
+            else:
+                moved += 1
+            self.stdout.write(f"{name} -> {blob_name}{' (duplicate)' if duplicate else ''}")
+            references[blob_name].extend(refs)
+            if dry_run:
+                continue
+
+            if not os.path.exists(blob_path):
+                os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+                file_move_safe(path, blob_path, allow_overwrite=False)
+            grouped = defaultdict(list)
+            for model, field, pk in refs:
+                grouped[(model, field)].append(pk)
+            # Plain updates: changing where a file lives is not an edit worth a save() or audit entry
+            with transaction.atomic():
+                for (model, field), pks in grouped.items():
+                    model._default_manager.filter(pk__in=pks).update(**{field.attname: blob_name})
+            if os.path.exists(path):
+                os.remove(path)
+
+        blob_refs = {name: len(refs) for name, refs in references.items() if storage.is_blob_name(name)}
+        orphans = MediaBlob.objects.exclude(name__in=list(blob_refs))
+        orphan_count = orphans.count()
+        if not dry_run:
+            # The rows are the source of truth, which also repairs counts that drifted
+            with transaction.atomic():
+                for name, count in blob_refs.items():
+                    blob_path = storage.path(name)
+                    if not os.path.exists(blob_path):
+                        continue
+                    MediaBlob.objects.update_or_create(name=name, defaults={
+                        'sha256': os.path.splitext(os.path.basename(name))[0],
+                        'size': os.path.getsize(blob_path),
+                        'ref_count': count,
+                    })
+                if options['delete_orphans']:
+                    for orphan in list(orphans):
+                        orphan.delete()
+                        if storage.exists(orphan.name):
+                            os.remove(storage.path(orphan.name))
+                else:
+                    orphans.update(ref_count=0)
+
+        untracked = find_untracked_blobs(storage, blob_refs, options['min_age'])
+        if options['delete_orphans'] and not dry_run:
+            for path in untracked:
+                os.remove(path)
+
+        self.stdout.write(
+            f"{'Would move' if dry_run else 'Moved'} {moved} files and merged {merged} duplicates "
+            f"({saved} bytes saved); {missing} missing, {orphan_count} unreferenced blobs, "
+            f"{len(untracked)} untracked files"
+        )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from Insurecow.renditions import generate_renditions
+from administrator.models import RENDITION_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Render thumbnail/medium copies of stored images that do not have them yet (e.g. uploaded before renditions)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        sources = set()
+        for model, fields in RENDITION_FIELDS.items():
+            for field in fields:
+                sources.update(model._default_manager.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''})
+                               .values_list(field, flat=True).iterator())
+        sources = sorted(sources)
+
+        written = 0
+        for start in range(0, len(sources), options['batch_size']):
+            written += generate_renditions(sources[start:start + options['batch_size']])
+        self.stdout.write(f"Wrote {written} renditions for {len(sources)} images")
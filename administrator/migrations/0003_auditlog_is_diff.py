@@ -0,0 +1,24 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('administrator', '0002_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='auditlog',
+            name='is_diff',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='auditlog',
+            index=models.Index(fields=['model_name', 'instance_id', 'timestamp'], name='auditlog_instance_time_idx'),
+        ),
+    ]
@@ -1,13 +1,16 @@
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
-from django.forms.models import model_to_dict
 
+from Insurecow.renditions import schedule_renditions
+from Insurecow.storage import ContentAddressedStorage
 from Insurecow.utils import  convert_non_serializable_fields
-from assetservice.models import Asset
-from insuranceservice.models import AssetInsurance, InsuranceClaim
+from administrator.audit import audit_buffer
+from assetservice.models import Asset, ASSET_IMAGE_FIELDS, ASSET_MEDIA_FIELDS
+from authservice.models import OrganizationInfo, UserPersonalInfo
+from insuranceservice.models import AssetInsurance, InsuranceClaim, InsuranceCompany
 
 
 class AuditLog(models.Model):
@@ -23,42 +26,255 @@ class AuditLog(models.Model):
     action = models.CharField(max_length=10, choices=ACTION_CHOICES)
     timestamp = models.DateTimeField(default=timezone.now)
     changes = models.JSONField(blank=True, null=True)
+    # Update entries written as {field: {"old": ..., "new": ...}}; older rows hold full snapshots
+    is_diff = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['model_name', 'instance_id', 'timestamp'], name='auditlog_instance_time_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_action_display()} {self.model_name} ID {self.instance_id}"
 
+    @classmethod
+    def state_at(cls, model_name, instance_id, timestamp=None):
+        """Rebuild an instance's field values at ``timestamp`` by replaying its audit entries.
 
-def create_audit_log(user, model_name, instance_id, action, changes=None):
+        Returns None if the instance did not exist (or had been deleted) at that time.
+        """
+        entries = cls.objects.filter(model_name=model_name, instance_id=instance_id)
+        if timestamp is not None:
+            entries = entries.filter(timestamp__lte=timestamp)
+
+        state = None
+        for entry in entries.order_by('timestamp', 'id').only('action', 'changes', 'is_diff'):
+            changes = entry.changes or {}
+            if entry.action == 'delete':
+                state = None
+            elif entry.action == 'create' or not entry.is_diff:
+                state = dict(changes)
+            else:
+                state = dict(state or {})
+                for field, change in changes.items():
+                    state[field] = change['new']
+        return state
+
+
+class MediaBlob(models.Model):
+    """
+    One stored file of Insurecow.storage.ContentAddressedStorage. ``ref_count`` is the number of
+    saves pointing at it; the file is removed when deletes bring it to zero.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    size = models.PositiveBigIntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} refs)"
+
+
+class ImageRendition(models.Model):
+    """
+    A resized copy of a stored image (see Insurecow.renditions). Keyed by the source's stored
+    name, which with content-addressed storage is shared by every upload of the same picture.
+    """
+    source = models.CharField(max_length=255)
+    rendition = models.CharField(max_length=20)
+    format = models.CharField(max_length=10)
+    name = models.CharField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source', 'rendition', 'format'], name='image_rendition_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.source} {self.rendition} {self.format}"
+
+
+# Image fields that get thumbnail/medium renditions after upload
+RENDITION_FIELDS = {
+    Asset: ASSET_IMAGE_FIELDS,
+    UserPersonalInfo: ('profile_image', 'nid_front', 'nid_back'),
+    InsuranceCompany: ('logo',),
+}
+
+# File fields whose MediaBlob references are released when the row is deleted or the file replaced
+MEDIA_FIELDS = {
+    Asset: ASSET_MEDIA_FIELDS,
+    UserPersonalInfo: ('profile_image', 'nid_front', 'nid_back'),
+    OrganizationInfo: ('logo',),
+    InsuranceCompany: ('logo',),
+    AssetInsurance: ('insurance_certificate',),
+    InsuranceClaim: ('claim_documents', 'settlement_documents'),
+}
+
+
+def take_snapshot(instance):
+    """Raw values of the instance's loaded concrete fields, keyed by field name."""
+    deferred = instance.get_deferred_fields()
+    snapshot = {}
+    for field in instance._meta.concrete_fields:
+        if field.attname in deferred:
+            continue
+        value = instance.__dict__.get(field.attname)
+        if isinstance(field, models.FileField):
+            value = getattr(value, 'name', value) or None
+        snapshot[field.name] = value
+    return snapshot
+
+
+def diff_snapshots(old, new, model):
+    changes = {}
+    for name, value in new.items():
+        if getattr(model._meta.get_field(name), 'auto_now', False):
+            continue
+        if name not in old:
+            # Deferred when the instance was loaded, so the old value is unknown; not a change
+            continue
+        if old[name] != value:
+            changes[name] = {"old": old[name], "new": value}
+    return changes
+
+
+def create_audit_log(user, model_name, instance_id, action, changes=None, is_diff=False):
     # Convert any non-serializable fields (Decimal, date, datetime, FieldFile) in the changes dictionary
     changes = convert_non_serializable_fields(changes or {})
-    AuditLog.objects.create(
+    # Buffered and written in batches; see administrator.audit for the flush modes
+    audit_buffer.enqueue(AuditLog(
         user=user,
         model_name=model_name,
         instance_id=instance_id,
         action=action,
         changes=changes,
-    )
+        is_diff=is_diff,
+    ))
+
+@receiver(post_init, sender=Asset)
+@receiver(post_init, sender=AssetInsurance)
+@receiver(post_init, sender=InsuranceClaim)
+def capture_audit_snapshot(sender, instance, **kwargs):
+    # Only rows loaded from the database have a prior state worth diffing against
+    if instance.pk is not None:
+        instance._audit_snapshot = take_snapshot(instance)
 
 @receiver(post_save, sender=Asset)
 @receiver(post_save, sender=AssetInsurance)
 @receiver(post_save, sender=InsuranceClaim)
 def create_update_audit(sender, instance, created, **kwargs):
     user = getattr(instance, 'updated_by', None) or getattr(instance, 'created_by', None)
-    changes = model_to_dict(instance)
-    action = 'create' if created else 'update'
-    # Convert non-serializable fields (Decimal, date, datetime, FieldFile) before logging
-    changes = convert_non_serializable_fields(changes)
-    create_audit_log(user, sender.__name__, instance.pk, action, changes)
+    snapshot = take_snapshot(instance)
+    previous = getattr(instance, '_audit_snapshot', None)
+    instance._audit_snapshot = snapshot
+
+    if created or previous is None:
+        create_audit_log(user, sender.__name__, instance.pk, 'create' if created else 'update', dict(snapshot))
+        return
+
+    changes = diff_snapshots(previous, snapshot, sender)
+    if changes:
+        create_audit_log(user, sender.__name__, instance.pk, 'update', changes, is_diff=True)
 
 @receiver(post_delete, sender=Asset)
 @receiver(post_delete, sender=AssetInsurance)
 @receiver(post_delete, sender=InsuranceClaim)
 def delete_audit(sender, instance, **kwargs):
     user = getattr(instance, 'updated_by', None) or getattr(instance, 'created_by', None)
-    changes = model_to_dict(instance)
-    # Convert non-serializable fields (Decimal, date, datetime, FieldFile) before logging
-    changes = convert_non_serializable_fields(changes)
-    create_audit_log(user, sender.__name__, instance.pk, 'delete', changes)
+    create_audit_log(user, sender.__name__, instance.pk, 'delete', take_snapshot(instance))
+
+@receiver(post_save, sender=Asset)
+@receiver(post_save, sender=UserPersonalInfo)
+@receiver(post_save, sender=InsuranceCompany)
+def schedule_image_renditions(sender, instance, **kwargs):
+    deferred = instance.get_deferred_fields()
+    schedule_renditions(
+        getattr(instance, field).name for field in RENDITION_FIELDS[sender] if field not in deferred
+    )
+
+
+def stored_media(instance, fields):
+    """{field: stored name} for the loaded, non-empty file fields of ``instance`` kept in content-addressed storage."""
+    deferred = instance.get_deferred_fields()
+    names = {}
+    for field in fields:
+        if field in deferred or not isinstance(instance._meta.get_field(field).storage, ContentAddressedStorage):
+            continue
+        value = instance.__dict__.get(field)
+        name = value if isinstance(value, str) else getattr(value, 'name', None)
+        if name:
+            names[field] = name
+    return names
+
+
+def is_media_referenced(name):
+    """Whether any row still uses the stored file ``name``."""
+    for model, fields in MEDIA_FIELDS.items():
+        condition = models.Q()
+        for field in fields:
+            condition |= models.Q(**{field: name})
+        if model._default_manager.filter(condition).exists():
+            return True
+    return ImageRendition.objects.filter(name=name).exists()
+
+
+def release_media(model, names):
+    """Drop one MediaBlob reference per (field, name) once the transaction commits."""
+    names = [(field, name) for field, name in names if name]
+    if not names:
+        return
+
+    def release():
+        for field, name in names:
+            storage = model._meta.get_field(field).storage
+            if not storage.is_blob_name(name):
+                continue
+            # Some rows copy a name without a reference of their own (a company's logo is its
+            # organization's): never remove the last reference of a file still in use
+            blob = MediaBlob.objects.filter(name=name).first()
+            if blob is not None and blob.ref_count <= 1 and is_media_referenced(name):
+                continue
+            storage.delete(name)
+
+    transaction.on_commit(release)
+
+@receiver(post_init, sender=Asset)
+@receiver(post_init, sender=UserPersonalInfo)
+@receiver(post_init, sender=OrganizationInfo)
+@receiver(post_init, sender=InsuranceCompany)
+@receiver(post_init, sender=AssetInsurance)
+@receiver(post_init, sender=InsuranceClaim)
+def capture_stored_media(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._stored_media = stored_media(instance, MEDIA_FIELDS[sender])
+
+@receiver(post_save, sender=Asset)
+@receiver(post_save, sender=UserPersonalInfo)
+@receiver(post_save, sender=OrganizationInfo)
+@receiver(post_save, sender=InsuranceCompany)
+@receiver(post_save, sender=AssetInsurance)
+@receiver(post_save, sender=InsuranceClaim)
+def release_replaced_media(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_stored_media', None) or {}
+    current = stored_media(instance, MEDIA_FIELDS[sender])
+    instance._stored_media = current
+    if not created:
+        release_media(sender, [
+            (field, name) for field, name in previous.items()
+            if field not in instance.get_deferred_fields() and current.get(field) != name
+        ])
+
+@receiver(post_delete, sender=Asset)
+@receiver(post_delete, sender=UserPersonalInfo)
+@receiver(post_delete, sender=OrganizationInfo)
+@receiver(post_delete, sender=InsuranceCompany)
+@receiver(post_delete, sender=AssetInsurance)
+@receiver(post_delete, sender=InsuranceClaim)
+def release_deleted_media(sender, instance, **kwargs):
+    release_media(sender, stored_media(instance, MEDIA_FIELDS[sender]).items())
@@ -1,3 +1,179 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from Insurecow.renditions import generate_renditions
+from authservice.models import Role, User, UserPersonalInfo
+from .audit import AuditBuffer
+from .models import AuditLog, ImageRendition, MediaBlob
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class UserListQueriesTest(TestCase):
+    url = '/api/v1/administrator/users/list/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('farmer', 'manager', 'insurer'):
+            Role.objects.create(name=name)
+        cls.admin = User.objects.create_superuser(mobile_number='01000000000', password='x', role_id=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def add_farmers(self, count):
+        start = User.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create_user(mobile_number=f'019{i:08d}', password='x', role_id=1)
+            UserPersonalInfo.objects.filter(user=user).update(
+                profile_image=f'profile/{i}.jpg', nid_front=f'nid/{i}.jpg', nid_back=f'nid/{i}b.jpg'
+            )
+
+    def test_renditions_are_loaded_once_per_page(self):
+        self.add_farmers(5)
+        ImageRendition.objects.create(source='profile/1.jpg', rendition='thumbnail', format='webp',
+                                      name='renditions/1.webp', width=320, height=240)
+        # The page, then one rendition lookup for the personal info images of every user on it
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        users = {user['mobile_number']: user for user in response.json()['data']['results']}
+        self.assertIn('thumbnail', users['01900000001']['personal_info']['profile_image_renditions'])
+        self.assertIsNone(users['01900000002']['personal_info']['profile_image_renditions'])
+
+        self.add_farmers(15)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   IMAGE_RENDITIONS={'SIZES': {'thumbnail': 32}, 'FORMATS': ('webp', 'jpeg'), 'WORKERS': 0})
+class DedupeMediaTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        Role.objects.create(name='farmer')
+        user = User.objects.create_user(mobile_number='01900000001', password='x', role_id=1)
+        self.info = UserPersonalInfo.objects.get(user=user)
+        self.info.profile_image.save('me.jpg', ContentFile(self.photo('red')))
+
+    def photo(self, color):
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new('RGB', (64, 48), color).save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def test_delete_orphans_keeps_renditions(self):
+        self.assertEqual(generate_renditions([self.info.profile_image.name]), 2)
+        names = list(ImageRendition.objects.values_list('name', flat=True))
+
+        call_command('dedupe_media', delete_orphans=True, stdout=io.StringIO(), stderr=io.StringIO())
+
+        for name in names + [self.info.profile_image.name]:
+            self.assertTrue(default_storage.exists(name), name)
+            self.assertEqual(MediaBlob.objects.get(name=name).ref_count, 1)
+
+    def test_replacing_and_deleting_release_references(self):
+        old = self.info.profile_image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            UserPersonalInfo.objects.get(pk=self.info.pk).profile_image.save('new.jpg', ContentFile(self.photo('blue')))
+        self.assertFalse(default_storage.exists(old))
+        self.assertFalse(MediaBlob.objects.filter(name=old).exists())
+
+        info = UserPersonalInfo.objects.get(pk=self.info.pk)
+        new = info.profile_image.name
+        with self.captureOnCommitCallbacks(execute=True):
+            info.delete()
+        self.assertFalse(default_storage.exists(new))
+
+    def test_delete_orphans_removes_untracked_files(self):
+        untracked = default_storage.path('cas/00/00/untracked.jpg')
+        os.makedirs(os.path.dirname(untracked))
+        with open(untracked, 'wb') as f:
+            f.write(b'left over by a rolled back transaction')
+
+        # Too recent with the default --min-age: it may belong to a transaction still running
+        call_command('dedupe_media', delete_orphans=True, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertTrue(os.path.exists(untracked))
+
+        call_command('dedupe_media', delete_orphans=True, min_age=0, stdout=io.StringIO(), stderr=io.StringIO())
+        self.assertFalse(os.path.exists(untracked))
+        self.assertTrue(default_storage.exists(self.info.profile_image.name))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   ONBOARDING={'MAX_ROWS': 3, 'HASH_WORKERS': 0})
+class BulkOnboardFarmersTest(TestCase):
+    url = '/api/v1/administrator/create-user/bulk/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('farmer', 'manager', 'insurer'):
+            Role.objects.create(name=name)
+        cls.manager = User.objects.create_user(mobile_number='01700000000', password='x', role_id=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def row(self, mobile_number, password):
+        return {'mobile_number': mobile_number, 'password': password,
+                'personal_info': {'first_name': 'Rahima', 'last_name': 'Begum'}}
+
+    def test_passwords_are_validated_per_row(self):
+        rows = [self.row('01900000001', 'pasture-42'), self.row('01900000002', 'abc'),
+                self.row('01900000003', 'password'), self.row('01900000004', 'rahimabegum')]
+        response = self.client.post(self.url, {'users': rows[:3]}, format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([row['status'] for row in response.json()['data']['rows']], ['created', 'failed', 'failed'])
+        self.assertIn('password', response.json()['data']['rows'][1]['errors'])
+        self.assertTrue(User.objects.get(mobile_number='01900000001').check_password('pasture-42'))
+
+        response = self.client.post(self.url, {'users': rows[3:]}, format='json')
+        self.assertEqual(response.json()['data']['rows'][0]['status'], 'failed')
+
+    def test_rows_over_the_limit_are_rejected(self):
+        rows = [self.row(f'0190000000{i}', 'pasture-42') for i in range(4)]
+        response = self.client.post(self.url, {'users': rows}, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(role_id=1).exists())
+
+
+class AuditBufferTest(TestCase):
+    def entry(self, instance_id):
+        return AuditLog(model_name='Asset', instance_id=instance_id, action='update', changes={})
+
+    def test_failed_bulk_write_falls_back_to_single_rows(self):
+        buffer = AuditBuffer()
+        with mock.patch.object(AuditLog.objects, 'bulk_create', side_effect=DatabaseError('down')), \
+                self.assertLogs('administrator.audit', level='ERROR'):
+            buffer._write([self.entry(1), self.entry(2)])
+        self.assertEqual(sorted(AuditLog.objects.values_list('instance_id', flat=True)), [1, 2])
+
+    @override_settings(AUDIT_LOG={'MODE': 'on_commit', 'MAX_QUEUE_SIZE': 1, 'BATCH_SIZE': 10})
+    def test_full_queue_writes_instead_of_raising(self):
+        buffer = AuditBuffer()
+        buffer._put(self.entry(1))
+        # Another thread refills the queue as soon as it is flushed
+        with mock.patch.object(buffer, 'flush'):
+            buffer._put(self.entry(2))
+        self.assertEqual(list(AuditLog.objects.values_list('instance_id', flat=True)), [2])
+        self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(AuditLog.objects.count(), 2)
@@ -4,6 +4,7 @@ from .views import *
 app_name = 'administrator'
 urlpatterns = [
     path('create-user/', CreateUserByAdminView.as_view(), name='admin-create-user'),
+    path('create-user/bulk/', BulkOnboardFarmersView.as_view(), name='admin-bulk-create-users'),
     path('users/<int:pk>/set-managed-by/', SetManagedByView.as_view(), name='set-managed-by'),
     path('users/list/', UserListView.as_view(), name='user-list'),
 ]
@@ -7,7 +7,9 @@ from rest_framework.permissions import IsAdminUser, BasePermission, IsAuthentica
 from rest_framework import status, permissions, serializers
 
 from Insurecow.utils import success_response, handle_serializer_error, validation_error_from_serializer,error_response
+from Insurecow.pagination import KeysetPagination
 from authservice.models import User
+from authservice.onboarding import get_onboarding_setting, import_farmers, parse_rows
 from authservice.serializers import UserSerializer, ChangePasswordSerializer
 
 
@@ -47,6 +49,51 @@ class CreateUserByAdminView(APIView):
 
 
 
+class BulkOnboardFarmersView(APIView):
+    """
+    Create many farmer accounts in one request. Accepts an uploaded CSV/JSON ``file`` or a JSON
+    body ({"users": [...]}) and reports the outcome of every row.
+    """
+    permission_classes = [IsAllowedToCreateUser]
+
+    def post(self, request):
+        try:
+            upload = request.FILES.get('file')
+            if upload:
+                file_format = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+                rows = parse_rows(upload.read(), file_format)
+            else:
+                rows = request.data if isinstance(request.data, list) else request.data.get('users')
+                if not isinstance(rows, list):
+                    return error_response("Provide a file or a list of users", status_code=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return error_response(f"Could not read the import: {str(e)}", status_code=status.HTTP_400_BAD_REQUEST)
+        if len(rows) > get_onboarding_setting('MAX_ROWS'):
+            return error_response(f"At most {get_onboarding_setting('MAX_ROWS')} users can be onboarded per request.",
+                                  status_code=status.HTTP_400_BAD_REQUEST)
+
+        # Managers onboard into their own team; staff may pick the manager
+        if request.user.role_id == 2:
+            managed_by = request.user
+        else:
+            managed_by = None
+            managed_by_id = None if isinstance(request.data, list) else request.data.get('managed_by')
+            if managed_by_id:
+                managed_by = User.objects.filter(pk=managed_by_id, role_id=2).first()
+                if managed_by is None:
+                    return error_response("managed_by must be a user with role_id = 2.",
+                                          status_code=status.HTTP_400_BAD_REQUEST)
+        onboarded_by = request.user if (request.user.is_staff or request.user.is_superuser) else None
+
+        results = import_farmers(rows, managed_by=managed_by, onboarded_by=onboarded_by, context={'request': request})
+        created = sum(1 for result in results if result['status'] == 'created')
+        return success_response(
+            f"{created} of {len(results)} users created",
+            data={"created": created, "failed": len(results) - created, "rows": results},
+            status_code=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
 class IsSuperUser(permissions.BasePermission):
     def has_permission(self, request, view):
         return request.user and request.user.is_superuser
@@ -71,18 +118,44 @@ class SetManagedByView(APIView):
         return validation_error_from_serializer(serializer)
 
 
+class UserKeysetPagination(KeysetPagination):
+    ordering = ('-date_joined', 'id')
+
+
 class UserListView(APIView):
+    """
+    Paginated user list for the admin panel.
+
+    Filters: role, ekyc_status, is_active, managed_by (ids / values) and mobile_number (prefix).
+    """
     permission_classes = [IsSuperUser]
 
+    FILTERS = {
+        'role': ('role_id', int),
+        'ekyc_status': ('ekyc_status', int),
+        'is_active': ('is_active', lambda value: {'true': True, '1': True, 'false': False, '0': False}[value.lower()]),
+        'managed_by': ('managed_by_id', int),
+        'mobile_number': ('mobile_number__startswith', str),
+    }
+
     def get(self, request, *args, **kwargs):
-        users = User.objects.all()
-        serializer = UserSerializer(users, many=True)
+        users = User.objects.select_related(
+            'role', 'personal_info', 'financial_info', 'nominee_info', 'organization_info'
+        )
+        for param, (lookup, parse) in self.FILTERS.items():
+            value = request.query_params.get(param)
+            if value in (None, ''):
+                continue
+            try:
+                users = users.filter(**{lookup: parse(value)})
+            except (ValueError, KeyError):
+                return error_response(f"Invalid value for {param}: {value}", status_code=status.HTTP_400_BAD_REQUEST)
+
+        paginator = UserKeysetPagination()
+        page = paginator.paginate_queryset(users, request, view=self)
+        serializer = UserSerializer(page, many=True)
         try:
-            return success_response("User List Retrieved successfully", data=serializer.data,
+            return success_response("User List Retrieved successfully", data=paginator.get_paginated_data(serializer.data),
                                     status_code=status.HTTP_200_OK)
         except serializers.ValidationError as e:
             return handle_serializer_error(e)
-
-
-
-
@@ -9,4 +9,5 @@ admin.site.register(Breed)
 admin.site.register(Color)
 admin.site.register(VaccinationStatus)
 admin.site.register(DewormingStatus)
-admin.site.register(AssetHistory)
\ No newline at end of file
+admin.site.register(AssetHistory)
+admin.site.register(ChunkedUpload)
@@ -0,0 +1,135 @@
+"""
+Bulk asset registration: a manifest of rows whose media are completed chunked uploads.
+
+Rows are validated together (AssetListSerializer.validate_rows), every distinct upload is
+stored once whatever number of rows share it, and the assets go in with bulk_create in
+BATCH_SIZE chunks. bulk_create sends no signals, so what the post_save receivers do for a
+single asset (history, photo fingerprints, renditions, audit entries) is done here in batches.
+"""
+import os
+import shutil
+from collections import Counter
+
+from django.conf import settings
+from django.core.files.move import file_move_safe
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from Insurecow.renditions import schedule_renditions
+from Insurecow.storage import ContentAddressedStorage
+from .duplicates import split_hash, to_signed
+from .models import Asset, AssetHistory, AssetImageHash, ChunkedUpload, ASSET_MEDIA_FIELDS, ASSET_IMAGE_FIELDS
+from .uploads import discard_uploads, open_upload, temp_path
+
+DEFAULT_BULK_ASSET_SETTINGS = {
+    'MAX_ROWS': 500,
+    'BATCH_SIZE': 100,
+}
+
+
+def get_bulk_asset_setting(name):
+    return getattr(settings, 'BULK_ASSETS', {}).get(name, DEFAULT_BULK_ASSET_SETTINGS[name])
+
+
+def store_upload(upload, field, asset, count):
+    """Store a completed upload once for ``count`` assets and return the stored name."""
+    storage = default_storage
+    if isinstance(storage, ContentAddressedStorage) and upload.checksum:
+        # The upload's SHA-256 was verified as it completed, so the blob name is known without rehashing
+        name = storage.blob_name(upload.checksum, upload.filename)
+        path = storage.path(name)
+        if not os.path.exists(path):
+            temp_dir = storage.path(os.path.join(storage.prefix, 'tmp'))
+            os.makedirs(temp_dir, exist_ok=True)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp = os.path.join(temp_dir, f"{upload.pk}{os.path.splitext(name)[1]}")
+            # Link (or copy) rather than move, so the upload survives if the transaction rolls back
+            try:
+                os.link(temp_path(upload), temp)
+            except OSError:
+                shutil.copyfile(temp_path(upload), temp)
+            try:
+                file_move_safe(temp, path, allow_overwrite=False)
+            except FileExistsError:
+                os.remove(temp)  # Someone stored the same content meanwhile
+            if storage.file_permissions_mode is not None:
+                os.chmod(path, storage.file_permissions_mode)
+        storage.add_reference(name, upload.checksum, upload.size, count)
+        return name
+
+    with open_upload(upload) as file:
+        return storage.save(Asset._meta.get_field(field).generate_filename(asset, upload.filename), file)
+
+
+def register_assets(validated_rows, user):
+    """Create the assets of ``validated_rows`` (validated AssetSerializer data) and return them, in order."""
+    from administrator.models import create_audit_log, take_snapshot
+
+    assets = []
+    for attrs in validated_rows:
+        attrs = dict(attrs)
+        attrs['created_by'] = user
+        attrs['updated_by'] = user
+        assets.append(Asset(**attrs))
+
+    uploads = {}
+    usage = Counter()
+    for asset in assets:
+        for field in ASSET_MEDIA_FIELDS:
+            upload = asset.__dict__.get(field)
+            if isinstance(upload, ChunkedUpload):
+                uploads[(upload.pk, field)] = upload
+                usage[(upload.pk, field)] += 1
+
+    with transaction.atomic():
+        stored = {}
+        # Content-addressed names do not depend on the field, so a file used by several fields is stored once
+        blobs = {}
+        for (upload_id, field), upload in uploads.items():
+            count = usage[(upload_id, field)]
+            if upload_id in blobs:
+                default_storage.add_reference(blobs[upload_id], upload.checksum, upload.size, count)
+                stored[(upload_id, field)] = blobs[upload_id]
+                continue
+            stored[(upload_id, field)] = store_upload(upload, field, assets[0], count)
+            if isinstance(default_storage, ContentAddressedStorage) and upload.checksum:
+                blobs[upload_id] = stored[(upload_id, field)]
+
+        fingerprints = {}
+        for asset in assets:
+            for field in ASSET_MEDIA_FIELDS:
+                upload = asset.__dict__.get(field)
+                if isinstance(upload, ChunkedUpload):
+                    if field in ASSET_IMAGE_FIELDS:
+                        fingerprints[(id(asset), field)] = upload._dhash
+                    setattr(asset, field, stored[(upload.pk, field)])
+
+        Asset.objects.bulk_create(assets, batch_size=get_bulk_asset_setting('BATCH_SIZE'))
+
+        AssetHistory.objects.bulk_create([
+            AssetHistory(asset=asset, changed_by=user, weight_kg=asset.weight_kg,
+                         vaccination_status_id=asset.vaccination_status_id,
+                         deworming_status_id=asset.deworming_status_id, remarks="Asset registered")
+            for asset in assets
+        ], batch_size=get_bulk_asset_setting('BATCH_SIZE'))
+
+        hashes = []
+        for asset in assets:
+            for field in ASSET_IMAGE_FIELDS:
+                fingerprint = fingerprints.get((id(asset), field))
+                if fingerprint is not None:
+                    hashes.append(AssetImageHash(
+                        asset_id=asset.pk, field=field, image=getattr(asset, field).name, hash=to_signed(fingerprint),
+                        **{f'chunk{i}': chunk for i, chunk in enumerate(split_hash(fingerprint))}
+                    ))
+        AssetImageHash.objects.bulk_create(hashes, batch_size=get_bulk_asset_setting('BATCH_SIZE'))
+
+        for asset in assets:
+            asset._audit_snapshot = take_snapshot(asset)
+            # Queued and written in batches by the audit buffer
+            create_audit_log(user, 'Asset', asset.pk, 'create', dict(asset._audit_snapshot))
+
+        schedule_renditions(getattr(asset, field).name for asset in assets for field in ASSET_IMAGE_FIELDS)
+        used = list({upload.pk: upload for upload in uploads.values()}.values())
+        transaction.on_commit(lambda: discard_uploads(used))
+    return assets
@@ -0,0 +1,165 @@
+"""
+Perceptual fingerprints of asset photos, for spotting the same animal registered twice.
+
+Each image gets a 64-bit difference hash (dHash): near-identical photos (re-encoded, resized,
+slightly cropped or recoloured) differ in a few bits. The hash is stored as four 16-bit chunks,
+each indexed (multi-index hashing): two hashes within Hamming distance d must agree to within
+d // 4 bits on at least one chunk, so a lookup is a handful of index probes, not a table scan.
+"""
+from itertools import combinations
+
+from django.conf import settings
+from django.db.models import Q
+
+CHUNKS = 4
+CHUNK_BITS = 16
+
+DEFAULT_DUPLICATE_PHOTO_SETTINGS = {
+    'MAX_DISTANCE': 6,  # bits out of 64
+    'MAX_CANDIDATES': 10,
+}
+
+
+def get_duplicate_setting(name):
+    return getattr(settings, 'DUPLICATE_PHOTOS', {}).get(name, DEFAULT_DUPLICATE_PHOTO_SETTINGS[name])
+
+
+def dhash(file):
+    """64-bit difference hash of an image file (uploaded file, FieldFile or path)."""
+    from PIL import Image, ImageOps
+
+    if hasattr(file, 'seek'):
+        file.seek(0)
+    with Image.open(file) as image:
+        # Decode JPEGs at 1/8 scale; the hash only needs 9x8 pixels
+        image.draft('L', (64, 64))
+        image = ImageOps.exif_transpose(image).convert('L').resize((9, 8), Image.Resampling.BOX)
+    if hasattr(file, 'seek'):
+        file.seek(0)
+
+    pixels = list(image.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def image_fingerprint(file):
+    """dhash() remembered on the file object, so validation and saving hash an upload once."""
+    fingerprint = getattr(file, '_dhash', None)
+    if fingerprint is None:
+        fingerprint = file._dhash = dhash(file)
+    return fingerprint
+
+
+def split_hash(value):
+    return [(value >> (CHUNK_BITS * i)) & 0xFFFF for i in range(CHUNKS)]
+
+
+def to_signed(value):
+    """The unsigned hash as a value that fits a BigIntegerField."""
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+def chunk_neighbours(chunk, radius):
+    """Every 16-bit value within ``radius`` bits of ``chunk``."""
+    values = [chunk]
+    for distance in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), distance):
+            flipped = chunk
+            for bit in bits:
+                flipped ^= 1 << bit
+            values.append(flipped)
+    return values
+
+
+def find_duplicate_candidates(fingerprints, max_distance=None, exclude_asset_id=None, limit=None):
+    """
+    Assets with a photo within ``max_distance`` bits of any of ``fingerprints``
+    ({field: hash}), closest first: [{asset_id, field, matched_field, distance}].
+    """
+    from .models import AssetImageHash
+
+    max_distance = get_duplicate_setting('MAX_DISTANCE') if max_distance is None else max_distance
+    limit = get_duplicate_setting('MAX_CANDIDATES') if limit is None else limit
+    radius = max_distance // CHUNKS
+
+    best = {}
+    for field, fingerprint in fingerprints.items():
+        condition = Q()
+        for i, chunk in enumerate(split_hash(fingerprint)):
+            condition |= Q(**{f'chunk{i}__in': chunk_neighbours(chunk, radius)})
+        rows = AssetImageHash.objects.filter(condition)
+        if exclude_asset_id is not None:
+            rows = rows.exclude(asset_id=exclude_asset_id)
+        for asset_id, matched_field, value in rows.values_list('asset_id', 'field', 'hash'):
+            distance = hamming(fingerprint, to_unsigned(value))
+            if distance <= max_distance and (asset_id not in best or distance < best[asset_id]['distance']):
+                best[asset_id] = {'asset_id': asset_id, 'field': field, 'matched_field': matched_field,
+                                  'distance': distance}
+    return sorted(best.values(), key=lambda candidate: (candidate['distance'], candidate['asset_id']))[:limit]
+
+
+def find_batch_duplicates(fingerprints, earlier, max_distance=None):
+    """
+    Earlier rows of the same batch with a photo within ``max_distance`` bits of any of ``fingerprints``,
+    from ``earlier`` ([(index, {field: hash})]), closest first: [{index, field, matched_field, distance}].
+    """
+    max_distance = get_duplicate_setting('MAX_DISTANCE') if max_distance is None else max_distance
+
+    best = {}
+    for index, hashes in earlier:
+        for field, fingerprint in fingerprints.items():
+            for matched_field, value in hashes.items():
+                distance = hamming(fingerprint, value)
+                if distance <= max_distance and (index not in best or distance < best[index]['distance']):
+                    best[index] = {'index': index, 'field': field, 'matched_field': matched_field,
+                                   'distance': distance}
+    return sorted(best.values(), key=lambda candidate: (candidate['distance'], candidate['index']))
+
+
+def index_asset_images(asset, created=False):
+    """Store fingerprints for the asset's images that changed since they were last indexed."""
+    from .models import AssetImageHash, ASSET_IMAGE_FIELDS
+
+    deferred = asset.get_deferred_fields()
+    fields = [field for field in ASSET_IMAGE_FIELDS if field not in deferred]
+    if not fields:
+        return
+    indexed = {} if created else dict(
+        AssetImageHash.objects.filter(asset_id=asset.pk).values_list('field', 'image')
+    )
+
+    changed, rows = [], []
+    for field in fields:
+        image = getattr(asset, field)
+        if (image.name or None) == indexed.get(field):
+            continue
+        changed.append(field)
+        if not image.name:
+            continue
+        # Reuse the hash computed while validating the upload, if there was one
+        source = getattr(image, '_file', None)
+        try:
+            fingerprint = getattr(source, '_dhash', None)
+            if fingerprint is None:
+                with image.storage.open(image.name, 'rb') as f:
+                    fingerprint = dhash(f)
+        except (OSError, ValueError) as e:
+            print(f"Error fingerprinting {image.name}: {str(e)}")
+            continue
+        rows.append(AssetImageHash(asset_id=asset.pk, field=field, image=image.name, hash=to_signed(fingerprint),
+                                   **{f'chunk{i}': chunk for i, chunk in enumerate(split_hash(fingerprint))}))
+
+    if changed:
+        AssetImageHash.objects.filter(asset_id=asset.pk, field__in=changed).delete()
+        AssetImageHash.objects.bulk_create(rows)
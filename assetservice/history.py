@@ -0,0 +1,58 @@
+"""
+Trend queries over AssetHistory. Every aggregation runs in the database: a timeline is one
+GROUP BY over the (asset, changed_at) index, however many readings an asset has.
+"""
+from django.db.models import Avg, Count, F, FloatField, Max, Min, Q, Sum, Window
+from django.db.models.functions import Cast, Lag, TruncDay, TruncMonth, TruncWeek
+
+BUCKETS = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+
+
+def filter_period(history, start=None, end=None):
+    if start:
+        history = history.filter(changed_at__date__gte=start)
+    if end:
+        history = history.filter(changed_at__date__lte=end)
+    return history
+
+
+def weight_timeline(history, bucket='week'):
+    """Weight readings downsampled to one point per ``bucket``: average, min, max and number of readings."""
+    return list(
+        history.filter(weight_kg__isnull=False)
+        .annotate(period=BUCKETS[bucket]('changed_at'))
+        .values('period')
+        .annotate(average_kg=Avg('weight_kg'), min_kg=Min('weight_kg'), max_kg=Max('weight_kg'),
+                  readings=Count('id'))
+        .order_by('period')
+    )
+
+
+def status_timeline(history, field):
+    """Only the records where ``field`` (a status foreign key) differs from the record before it."""
+    column = f'{field}_id'
+    window = {'partition_by': F('asset_id'), 'order_by': F('changed_at').asc()}
+    # NULL never equals NULL or anything else in SQL, so a status set or cleared is compared explicitly
+    return list(
+        history.annotate(previous_record=Window(Lag('id'), **window), previous=Window(Lag(column), **window))
+        .filter(
+            Q(previous_record__isnull=True) |
+            Q(**{f'{column}__isnull': True}, previous__isnull=False) |
+            Q(**{f'{column}__isnull': False}, previous__isnull=True) |
+            (Q(**{f'{column}__isnull': False}, previous__isnull=False) & ~Q(previous=F(column)))
+        )
+        .order_by('changed_at')
+        .values('changed_at', status_id=F(column), status=F(f'{field}__name'))
+    )
+
+
+def weight_gain_by_breed(history):
+    """Average weight gained per asset, per breed and calendar month."""
+    return list(
+        history.filter(weight_change__isnull=False)
+        .annotate(month=TruncMonth('changed_at'))
+        .values('month', breed_id=F('asset__breed_id'), breed=F('asset__breed__name'))
+        .annotate(assets=Count('asset', distinct=True), total_gain_kg=Sum('weight_change'))
+        .annotate(average_gain_kg=Cast('total_gain_kg', FloatField()) / F('assets'))
+        .order_by('month', 'breed')
+    )
@@ -0,0 +1,72 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from assetservice.duplicates import (
+    find_duplicate_candidates, get_duplicate_setting, hamming, split_hash, to_signed, to_unsigned
+)
+from assetservice.models import Asset, AssetImageHash
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Time duplicate-photo lookups against N synthetic fingerprints, using the chunk indexes versus "
+            "scanning every hash. Runs inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--queries', type=int, default=50)
+
+    def handle(self, *args, **options):
+        asset = Asset.objects.order_by('id').first()
+        if asset is None:
+            self.stderr.write("Needs at least one asset to attach the synthetic fingerprints to.")
+            return
+        rng = random.Random(0)
+        try:
+            with transaction.atomic():
+                AssetImageHash.objects.all().delete()
+                hashes = [rng.getrandbits(64) for _ in range(options['rows'])]
+                started = time.perf_counter()
+                # All rows hang off one asset; distinct field values keep them clear of the unique constraint
+                AssetImageHash.objects.bulk_create(
+                    [AssetImageHash(asset_id=asset.pk, field=str(i), image='', hash=to_signed(value),
+                                    **{f'chunk{c}': chunk for c, chunk in enumerate(split_hash(value))})
+                     for i, value in enumerate(hashes)],
+                    batch_size=5000,
+                )
+                self.stdout.write(f"Inserted {len(hashes)} fingerprints in {time.perf_counter() - started:.1f}s")
+
+                max_distance = get_duplicate_setting('MAX_DISTANCE')
+                probes = []
+                for _ in range(options['queries']):
+                    probe = rng.choice(hashes)
+                    for bit in rng.sample(range(64), rng.randint(0, max_distance)):
+                        probe ^= 1 << bit
+                    probes.append(probe)
+
+                self.run("chunk index", probes, lambda probe: find_duplicate_candidates({'left_side_image': probe}))
+                self.run("full scan", probes[:5], lambda probe: [
+                    value for value in AssetImageHash.objects.values_list('hash', flat=True).iterator(chunk_size=10000)
+                    if hamming(probe, to_unsigned(value)) <= max_distance
+                ])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, label, probes, lookup):
+        timings, found = [], 0
+        for probe in probes:
+            started = time.perf_counter()
+            found += bool(lookup(probe))
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"{label:>12}: median {timings[len(timings) // 2]:8.2f} ms, max {timings[-1]:8.2f} ms, "
+            f"{found}/{len(probes)} probes found their source"
+        )
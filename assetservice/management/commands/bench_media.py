@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.views.static import serve
+
+from Insurecow.media import serve_file
+
+
+def consume(response):
+    """Read the body the way a WSGI server would; returns the number of bytes sent."""
+    sent = 0
+    if response.streaming:
+        for block in response.streaming_content:
+            sent += len(block)
+    else:
+        sent = len(response.content)
+    response.close()
+    return sent
+
+
+class Command(BaseCommand):
+    help = ("Compare django.views.static.serve with Insurecow.media.serve_file on a muzzle-video sized file: "
+            "full downloads, seeks (1 MiB ranges), revalidation and X-Accel-Redirect.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size-mb', type=int, default=32)
+        parser.add_argument('--requests', type=int, default=20)
+
+    def handle(self, *args, **options):
+        root = tempfile.mkdtemp(prefix='bench_media_')
+        name = 'muzzle.mp4'
+        size = options['size_mb'] * 1024 * 1024
+        with open(os.path.join(root, name), 'wb') as f:
+            f.write(os.urandom(size))
+
+        factory = RequestFactory()
+        plain = factory.get(f'/media/{name}')
+        seek = factory.get(f'/media/{name}', HTTP_RANGE=f'bytes={size // 2}-{size // 2 + 1024 * 1024 - 1}')
+        etag = serve_file(plain, name, root)['ETag']
+        revalidate = factory.get(f'/media/{name}', HTTP_IF_NONE_MATCH=etag)
+
+        legacy = lambda request: serve(request, name, document_root=root)
+        current = lambda request: serve_file(request, name, root, '/protected-media/')
+        try:
+            self.run('static.serve full', legacy, plain, options['requests'])
+            self.run('serve_file full', current, plain, options['requests'])
+            # static.serve ignores Range, so a seek downloads the whole file
+            self.run('static.serve seek', legacy, seek, options['requests'])
+            self.run('serve_file seek', current, seek, options['requests'])
+            self.run('static.serve revalidate', legacy, revalidate, options['requests'])
+            self.run('serve_file revalidate', current, revalidate, options['requests'])
+            with override_settings(MEDIA_SERVING={'OFFLOAD': 'x-accel-redirect'}):
+                self.run('serve_file x-accel', current, plain, options['requests'])
+        finally:
+            shutil.rmtree(root)
+
+    def run(self, label, view, request, count):
+        consume(view(request))  # warm up the page cache
+        sent = 0
+        started = time.perf_counter()
+        for _ in range(count):
+            response = view(request)
+            status = response.status_code
+            sent += consume(response)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f"{label:>24}: {status} {count / elapsed:9,.1f} req/s, "
+            f"{sent / count / 1024 / 1024:7.2f} MiB/req sent by Python, {sent / elapsed / 1024 / 1024:9,.1f} MiB/s"
+        )
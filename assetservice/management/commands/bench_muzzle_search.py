@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from assetservice.muzzle import MuzzleIndex, normalize
+
+
+class Command(BaseCommand):
+    help = ("Build a throwaway memory-mapped muzzle index of random vectors and time top-k searches: "
+            "one query at a time, batched queries, and a per-vector Python loop for reference.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--vectors', type=int, default=1000000)
+        parser.add_argument('--dims', type=int, default=128)
+        parser.add_argument('--queries', type=int, default=64)
+        parser.add_argument('--k', type=int, default=10)
+        parser.add_argument('--block-rows', type=int, default=65536)
+
+    def handle(self, *args, **options):
+        count, dims = options['vectors'], options['dims']
+        rng = np.random.default_rng(0)
+        path = tempfile.mkdtemp(prefix='bench_muzzle_')
+        try:
+            index = MuzzleIndex(path, dims)
+            started = time.perf_counter()
+            batch = 100000
+            index.rebuild(
+                (list(range(start + 1, min(start + batch, count) + 1)),
+                 rng.standard_normal((min(batch, count - start), dims), dtype=np.float32))
+                for start in range(0, count, batch)
+            )
+            size = os.path.getsize(os.path.join(path, 'vectors.f32')) / 1024 / 1024
+            self.stdout.write(f"Indexed {count:,} x {dims} vectors ({size:,.0f} MiB) in {time.perf_counter() - started:.1f}s")
+
+            # Queries are noisy copies of indexed vectors, so each should find its source first
+            _, vectors, ids = index.mapped()
+            sources = rng.integers(0, count, options['queries'])
+            queries = np.asarray(vectors[sources]) + rng.normal(0, 0.02, (len(sources), dims)).astype(np.float32)
+            expected = np.asarray(ids[sources])
+
+            with override_settings(MUZZLE_INDEX={'BLOCK_ROWS': options['block_rows'], 'DIMENSIONS': dims}):
+                index.search(queries[:1], options['k'])  # fault the matrix into the page cache
+                started = time.perf_counter()
+                single = [index.search(query, options['k'])[0] for query in queries]
+                self.report("one at a time", started, len(queries), single, expected)
+
+                started = time.perf_counter()
+                batched = index.search(queries, options['k'])
+                self.report(f"batch of {len(queries)}", started, len(queries), batched, expected)
+
+            loop = min(20000, count)
+            normalized = normalize(queries[0], dims)[0]
+            started = time.perf_counter()
+            scores = [float(np.dot(vectors[i], normalized)) for i in range(loop)]
+            per_query = (time.perf_counter() - started) * count / loop
+            self.stdout.write(f"{'python loop':>16}: ~{per_query * 1000:10.1f} ms/query (extrapolated from {loop:,} rows)")
+        finally:
+            shutil.rmtree(path)
+
+    def report(self, label, started, queries, results, expected):
+        elapsed = time.perf_counter() - started
+        hits = sum(1 for matches, source in zip(results, expected) if matches and matches[0][0] == source)
+        self.stdout.write(
+            f"{label:>16}: {elapsed / queries * 1000:10.2f} ms/query, {queries / elapsed:8.1f} queries/s, "
+            f"top-1 recall {hits}/{queries}"
+        )
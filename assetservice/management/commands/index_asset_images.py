@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from assetservice.duplicates import index_asset_images
+from assetservice.models import Asset, ASSET_IMAGE_FIELDS
+
+
+class Command(BaseCommand):
+    help = "Fingerprint asset photos that are not in the duplicate-photo index yet (or changed since)."
+
+    def handle(self, *args, **options):
+        assets = Asset.objects.only('id', *ASSET_IMAGE_FIELDS).order_by('id')
+        count = 0
+        for asset in assets.iterator(chunk_size=500):
+            index_asset_images(asset)
+            count += 1
+        self.stdout.write(f"Checked {count} assets")
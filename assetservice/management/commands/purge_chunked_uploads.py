@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from assetservice.uploads import purge_expired_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads (and their temp files) that have not been touched for a while."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=None,
+                            help="Age in hours; defaults to CHUNKED_UPLOAD['EXPIRY_HOURS'].")
+
+    def handle(self, *args, **options):
+        removed = purge_expired_uploads(options['hours'])
+        self.stdout.write(f"Removed {removed} expired uploads")
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from assetservice.muzzle import get_muzzle_index
+
+
+class Command(BaseCommand):
+    help = "Bring the memory-mapped muzzle index up to date with MuzzleVector, or rebuild it (dropping removed rows)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true')
+
+    def handle(self, *args, **options):
+        index = get_muzzle_index()
+        started = time.perf_counter()
+        if options['rebuild']:
+            count = index.rebuild()
+            self.stdout.write(f"Rebuilt the muzzle index with {count} vectors in {time.perf_counter() - started:.2f}s")
+        else:
+            count = index.sync()
+            self.stdout.write(f"Indexed {count} vectors in {time.perf_counter() - started:.2f}s")
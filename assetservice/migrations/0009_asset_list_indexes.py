@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assetservice', '0008_alter_asset_refernce_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['-created_at', 'id'], name='asset_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='asset',
+            index=models.Index(fields=['owner', '-created_at'], name='asset_owner_created_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assetservice', '0010_chunked_upload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AssetImageHash',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=30)),
+                ('image', models.CharField(max_length=255)),
+                ('hash', models.BigIntegerField()),
+                ('chunk0', models.IntegerField()),
+                ('chunk1', models.IntegerField()),
+                ('chunk2', models.IntegerField()),
+                ('chunk3', models.IntegerField()),
+                ('asset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_hashes', to='assetservice.asset')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['chunk0'], name='asset_image_hash_chunk0_idx'), models.Index(fields=['chunk1'], name='asset_image_hash_chunk1_idx'), models.Index(fields=['chunk2'], name='asset_image_hash_chunk2_idx'), models.Index(fields=['chunk3'], name='asset_image_hash_chunk3_idx')],
+                'constraints': [models.UniqueConstraint(fields=('asset', 'field'), name='asset_image_hash_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assetservice', '0011_asset_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MuzzleVector',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vector', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True)),
+                ('asset', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='muzzle_vector', to='assetservice.asset')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('assetservice', '0012_muzzle_vector'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assethistory',
+            name='weight_change',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=6, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='assethistory',
+            index=models.Index(fields=['asset', 'changed_at'], name='asset_history_asset_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='assethistory',
+            index=models.Index(fields=['changed_at'], name='asset_history_time_idx'),
+        ),
+    ]
@@ -1,5 +1,10 @@
+import uuid
+from decimal import Decimal
+
 from django.conf import settings
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
 
 
 def asset_upload_path(instance, filename):
@@ -7,6 +12,14 @@ def asset_upload_path(instance, filename):
     return f'assets/{instance.id}/{filename}'
 
 
+ASSET_MEDIA_FIELDS = (
+    'muzzle_video', 'left_side_image', 'right_side_image',
+    'challan_paper', 'vet_certificate', 'chairman_certificate',
+)
+# Media with thumbnail/medium renditions (see Insurecow.renditions)
+ASSET_IMAGE_FIELDS = ('left_side_image', 'right_side_image')
+
+
 class AssetType(models.Model):
     name = models.CharField(max_length=100, unique=True)
 
@@ -76,13 +89,31 @@ class Asset(models.Model):
     vet_certificate = models.FileField(upload_to=asset_upload_path)
     chairman_certificate = models.FileField(upload_to=asset_upload_path)
 
+    # Every change to these is appended to AssetHistory (see record_asset_history)
+    HISTORY_FIELDS = ('weight_kg', 'vaccination_status_id', 'deworming_status_id')
 
     class Meta:
             ordering = ['-created_at']
+            indexes = [
+                models.Index(fields=['-created_at', 'id'], name='asset_created_id_idx'),
+                models.Index(fields=['owner', '-created_at'], name='asset_owner_created_idx'),
+            ]
 
     def __str__(self):
         return f"{self.asset_type.name if self.asset_type else 'Unknown Type'} - {self.owner.mobile_number}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: getattr(instance, name) for name in cls.HISTORY_FIELDS if name in instance.__dict__
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = {name: getattr(self, name) for name in self.HISTORY_FIELDS if name in self.__dict__}
+
     def get_media(self, media_type=None):
         """Retrieve media files associated with the asset, filtered by type."""
         if media_type:
@@ -90,17 +121,177 @@ class Asset(models.Model):
         return self.media_files.all()
 
 
+class AssetImageHash(models.Model):
+    """
+    Perceptual fingerprint (dHash) of one asset photo, split into four indexed 16-bit chunks for
+    near-duplicate lookups; see assetservice.duplicates.
+    """
+    asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name="image_hashes")
+    field = models.CharField(max_length=30)
+    image = models.CharField(max_length=255)
+    hash = models.BigIntegerField()
+    chunk0 = models.IntegerField()
+    chunk1 = models.IntegerField()
+    chunk2 = models.IntegerField()
+    chunk3 = models.IntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['asset', 'field'], name='asset_image_hash_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['chunk0'], name='asset_image_hash_chunk0_idx'),
+            models.Index(fields=['chunk1'], name='asset_image_hash_chunk1_idx'),
+            models.Index(fields=['chunk2'], name='asset_image_hash_chunk2_idx'),
+            models.Index(fields=['chunk3'], name='asset_image_hash_chunk3_idx'),
+        ]
+
+    def __str__(self):
+        return f"Asset ID {self.asset_id} {self.field} {self.hash:x}"
+
+
+class MuzzleVector(models.Model):
+    """
+    Muzzle-print feature vector of an asset (float32 bytes, MUZZLE_INDEX['DIMENSIONS'] long).
+    Searched through the memory-mapped index in assetservice.muzzle, which mirrors these rows.
+    """
+    asset = models.OneToOneField(Asset, on_delete=models.CASCADE, related_name="muzzle_vector")
+    vector = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return f"Muzzle vector of asset ID {self.asset_id}"
+
+
+class ChunkedUploadStatus(models.TextChoices):
+    UPLOADING = "uploading", "Uploading"
+    COMPLETE = "complete", "Complete"
+
+
+class ChunkedUpload(models.Model):
+    """
+    A file sent in chunks by assetservice.uploads. Bytes go to a temp file until ``offset`` reaches
+    ``size``; the completed upload is then referenced by id when creating or updating an Asset.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="chunked_uploads")
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
+    checksum = models.CharField(max_length=64, blank=True, help_text="Expected SHA-256, verified on completion")
+    status = models.CharField(max_length=10, choices=ChunkedUploadStatus.choices, default=ChunkedUploadStatus.UPLOADING)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at'], name='chunked_upload_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size}, {self.status})"
+
+
 class AssetHistory(models.Model):
     asset = models.ForeignKey(Asset, on_delete=models.CASCADE, related_name="history_records")
     changed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name="asset_change_logs")
     changed_at = models.DateTimeField(auto_now_add=True)
+    # Only set when the weight was recorded or changed; statuses are recorded on every record
     weight_kg = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
     vaccination_status = models.ForeignKey(VaccinationStatus, on_delete=models.SET_NULL, null=True, blank=True, related_name="history_vaccinations")
     deworming_status = models.ForeignKey(DewormingStatus, on_delete=models.SET_NULL, null=True, blank=True, related_name="history_dewormings")
+    # Weight difference from the previous record; None for the first one. Summed for herd weight gain.
+    weight_change = models.DecimalField(max_digits=6, decimal_places=2, null=True, blank=True)
     remarks = models.TextField(blank=True, null=True)
 
     class Meta:
         ordering = ['-changed_at']
+        indexes = [
+            models.Index(fields=['asset', 'changed_at'], name='asset_history_asset_time_idx'),
+            models.Index(fields=['changed_at'], name='asset_history_time_idx'),
+        ]
 
     def __str__(self):
         return f"Asset ID {self.asset.id} - Change by {self.changed_by.mobile_number if self.changed_by else 'Unknown'}"
+
+
+@receiver(post_save, sender=AssetType)
+@receiver(post_delete, sender=AssetType)
+@receiver(post_save, sender=Breed)
+@receiver(post_delete, sender=Breed)
+@receiver(post_save, sender=Color)
+@receiver(post_delete, sender=Color)
+@receiver(post_save, sender=VaccinationStatus)
+@receiver(post_delete, sender=VaccinationStatus)
+@receiver(post_save, sender=DewormingStatus)
+@receiver(post_delete, sender=DewormingStatus)
+@receiver(post_save, sender='authservice.Role')
+@receiver(post_delete, sender='authservice.Role')
+def invalidate_reference_bundle(sender, instance, **kwargs):
+    from .reference import invalidate_reference_data
+
+    # After commit, so a rebuild cannot pick up rows that are later rolled back
+    transaction.on_commit(invalidate_reference_data)
+
+
+@receiver(post_save, sender=Asset)
+def update_asset_image_hashes(sender, instance, created, **kwargs):
+    from .duplicates import index_asset_images
+
+    index_asset_images(instance, created=created)
+
+
+@receiver(post_save, sender=MuzzleVector)
+def index_muzzle_vector(sender, instance, **kwargs):
+    from .muzzle import sync_muzzle_index
+
+    transaction.on_commit(lambda: sync_muzzle_index([instance.asset_id]))
+
+
+@receiver(post_delete, sender=MuzzleVector)
+def unindex_muzzle_vector(sender, instance, **kwargs):
+    from .muzzle import remove_from_muzzle_index
+
+    transaction.on_commit(lambda: remove_from_muzzle_index([instance.asset_id]))
+
+
+@receiver(post_save, sender=Asset)
+def record_asset_history(sender, instance, created, **kwargs):
+    # save() refreshes _loaded_values only after post_save, so these are still the previous values
+    loaded = getattr(instance, '_loaded_values', None)
+    changed = Asset.HISTORY_FIELDS
+    if not created and loaded is not None:
+        changed = [
+            name for name in Asset.HISTORY_FIELDS
+            if name in instance.__dict__ and (name not in loaded or loaded[name] != getattr(instance, name))
+        ]
+        if not changed:
+            return
+
+    # A status-only change is not a weight reading; repeating the weight would skew the averages
+    weight_kg = instance.weight_kg if 'weight_kg' in changed else None
+    weight_change = None
+    previous_weight = (loaded or {}).get('weight_kg')
+    if not created and previous_weight is not None and weight_kg is not None:
+        weight_change = Decimal(str(weight_kg)) - Decimal(str(previous_weight))
+
+    AssetHistory.objects.create(
+        asset=instance,
+        changed_by_id=instance.updated_by_id or instance.created_by_id,
+        weight_kg=weight_kg,
+        vaccination_status_id=instance.vaccination_status_id,
+        deworming_status_id=instance.deworming_status_id,
+        weight_change=weight_change,
+        remarks="Asset registered" if created else None,
+    )
+
+
+@receiver(post_migrate)
+def ensure_asset_search_index(sender, using, plan=None, **kwargs):
+    # Not after unapplying migrations, which may have dropped the index on purpose
+    if sender.name != 'assetservice' or any(backwards for _, backwards in plan or []):
+        return
+    from .search import ensure_search_index
+
+    ensure_search_index(connections[using])
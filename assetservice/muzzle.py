@@ -0,0 +1,325 @@
+"""
+Local muzzle-print matching: nearest assets for a muzzle feature vector.
+
+Vectors (one per asset, DIMENSIONS float32 values from the muzzle embedding model) are kept in
+MuzzleVector rows, the source of truth, and mirrored into a memory-mapped matrix under
+MUZZLE_INDEX['DIR'] that every worker process maps read-only:
+
+    vectors.f32   capacity x DIMENSIONS float32, L2-normalised so a dot product is the cosine
+    ids.i64       asset id per row, -1 for removed rows
+    meta.json     row count, capacity, generation and the sync watermark
+
+Searches multiply the matrix by the query batch block by block and keep the top k per block.
+Writers (sync/remove/rebuild) hold an exclusive file lock; readers remap when meta.json changes.
+"""
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import now
+
+DEFAULT_MUZZLE_INDEX_SETTINGS = {
+    'DIR': None,  # defaults to BASE_DIR/muzzle_index, outside MEDIA_ROOT
+    'DIMENSIONS': 128,
+    'BLOCK_ROWS': 65536,  # matrix rows scored per step; bounds the temporary score matrix
+    'INITIAL_CAPACITY': 1024,
+    'SYNC_OVERLAP_SECONDS': 300,
+}
+
+
+def get_muzzle_setting(name):
+    return getattr(settings, 'MUZZLE_INDEX', {}).get(name, DEFAULT_MUZZLE_INDEX_SETTINGS[name])
+
+
+class MuzzleIndexError(Exception):
+    pass
+
+
+def normalize(vectors, dims):
+    """Validate and L2-normalise one vector or a batch; returns a 2-D float32 array."""
+    try:
+        array = np.asarray(vectors, dtype=np.float32)
+    except (TypeError, ValueError):
+        raise MuzzleIndexError("Vectors must be lists of numbers.")
+    if array.ndim == 1:
+        array = array[np.newaxis, :]
+    if array.ndim != 2 or array.shape[1] != dims:
+        raise MuzzleIndexError(f"Vectors must have {dims} dimensions.")
+    if not np.isfinite(array).all():
+        raise MuzzleIndexError("Vectors must not contain NaN or infinity.")
+    norms = np.linalg.norm(array, axis=1, keepdims=True)
+    if (norms == 0).any():
+        raise MuzzleIndexError("Vectors must not be all zeros.")
+    return array / norms
+
+
+class MuzzleIndex:
+    def __init__(self, path, dims):
+        self.path = path
+        self.dims = dims
+        self._mapped = None  # (meta mtime_ns, meta, vectors, ids)
+        self._map_lock = threading.Lock()
+
+    def file(self, name):
+        return os.path.join(self.path, name)
+
+    # -- file layout ---------------------------------------------------------------------
+
+    def read_meta(self):
+        try:
+            with open(self.file('meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'count': 0, 'capacity': 0, 'dims': self.dims, 'generation': 0, 'synced_at': None}
+
+    def write_meta(self, meta):
+        temp = self.file('meta.json.tmp')
+        with open(temp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(temp, self.file('meta.json'))
+
+    @contextmanager
+    def write_lock(self):
+        os.makedirs(self.path, exist_ok=True)
+        with open(self.file('lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def open_arrays(self, meta, mode, suffix=''):
+        if not meta['capacity']:
+            return np.zeros((0, self.dims), np.float32), np.zeros(0, np.int64)
+        vectors = np.memmap(self.file('vectors.f32' + suffix), np.float32, mode, shape=(meta['capacity'], self.dims))
+        ids = np.memmap(self.file('ids.i64' + suffix), np.int64, mode, shape=(meta['capacity'],))
+        return vectors, ids
+
+    def grow(self, meta, needed, suffix=''):
+        """Make room for ``needed`` rows by extending the files; existing rows stay where they are."""
+        if needed <= meta['capacity']:
+            return
+        capacity = max(needed, meta['capacity'] * 2, get_muzzle_setting('INITIAL_CAPACITY'))
+        for name, itemsize in (('vectors.f32', 4 * self.dims), ('ids.i64', 8)):
+            with open(self.file(name + suffix), 'ab') as f:
+                f.truncate(capacity * itemsize)
+        meta['capacity'] = capacity
+        # New id slots must read as "removed" until written
+        _, ids = self.open_arrays(meta, 'r+', suffix)
+        ids[meta['count']:] = -1
+        ids.flush()
+
+    def mapped(self):
+        """(meta, vectors, ids) for searching, remapped whenever a writer has published changes."""
+        try:
+            mtime = os.stat(self.file('meta.json')).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        mapped = self._mapped
+        if mapped is None or mapped[0] != mtime:
+            with self._map_lock:
+                mapped = self._mapped
+                if mapped is None or mapped[0] != mtime:
+                    meta = self.read_meta()
+                    if meta['dims'] != self.dims:
+                        raise MuzzleIndexError("The index was built with a different DIMENSIONS; rebuild it.")
+                    mapped = self._mapped = (mtime, meta, *self.open_arrays(meta, 'r'))
+        return mapped[1:]
+
+    # -- writing -------------------------------------------------------------------------
+
+    def upsert(self, asset_ids, vectors, meta):
+        """Overwrite the rows of assets already indexed and append the rest. Caller holds the lock."""
+        vectors = normalize(vectors, self.dims)
+        _, current_ids = self.open_arrays(meta, 'r+')
+        wanted = np.asarray(asset_ids, dtype=np.int64)
+        found = np.flatnonzero(np.isin(current_ids[:meta['count']], wanted))
+        slots = dict(zip(current_ids[found].tolist(), found.tolist()))
+
+        self.grow(meta, meta['count'] + len(set(asset_ids) - slots.keys()))
+        current_vectors, current_ids = self.open_arrays(meta, 'r+')
+        for i, asset_id in enumerate(asset_ids):
+            slot = slots.get(asset_id)
+            if slot is None:
+                slot = slots[asset_id] = meta['count']
+                meta['count'] += 1
+                current_ids[slot] = asset_id
+            current_vectors[slot] = vectors[i]
+        current_vectors.flush()
+        current_ids.flush()
+
+    def sync(self, asset_ids=None):
+        """
+        Index the MuzzleVector rows of ``asset_ids``, or every row saved since the last full sync
+        (less SYNC_OVERLAP_SECONDS, for transactions that committed late). Returns rows written.
+        """
+        from .models import MuzzleVector
+
+        with self.write_lock():
+            meta = self.read_meta()
+            rows = MuzzleVector.objects.order_by('updated_at')
+            if asset_ids is not None:
+                rows = rows.filter(asset_id__in=list(asset_ids))
+            elif meta['synced_at']:
+                overlap = timedelta(seconds=get_muzzle_setting('SYNC_OVERLAP_SECONDS'))
+                rows = rows.filter(updated_at__gte=parse_datetime(meta['synced_at']) - overlap)
+            watermark = meta['synced_at']
+            written = 0
+            batch_ids, batch_vectors = [], []
+            for asset_id, vector, updated_at in rows.values_list('asset_id', 'vector', 'updated_at').iterator(chunk_size=5000):
+                batch_ids.append(asset_id)
+                batch_vectors.append(np.frombuffer(vector, dtype=np.float32))
+                watermark = max(watermark or '', updated_at.isoformat())
+                if len(batch_ids) >= 5000:
+                    self.upsert(batch_ids, batch_vectors, meta)
+                    written += len(batch_ids)
+                    batch_ids, batch_vectors = [], []
+            if batch_ids:
+                self.upsert(batch_ids, batch_vectors, meta)
+                written += len(batch_ids)
+            if asset_ids is None:
+                meta['synced_at'] = watermark or None
+            if written or asset_ids is None:
+                self.write_meta(meta)
+            return written
+
+    def remove(self, asset_ids):
+        with self.write_lock():
+            meta = self.read_meta()
+            if not meta['count']:
+                return
+            _, ids = self.open_arrays(meta, 'r+')
+            hits = np.isin(ids[:meta['count']], np.asarray(list(asset_ids), dtype=np.int64))
+            if hits.any():
+                ids[:meta['count']][hits] = -1
+                ids.flush()
+                self.write_meta(meta)
+
+    def rebuild(self, rows=None):
+        """
+        Rewrite the files from scratch (dropping removed rows), from MuzzleVector or from an
+        iterable of (asset_id, vector) batches. Readers keep the old files until they remap.
+        """
+        with self.write_lock():
+            started = now()
+            from_database = rows is None
+            if from_database:
+                rows = self._database_batches()
+            meta = {'count': 0, 'capacity': 0, 'dims': self.dims,
+                    'generation': self.read_meta()['generation'] + 1, 'synced_at': None}
+            suffix = '.new'
+            for name in ('vectors.f32', 'ids.i64'):
+                open(self.file(name + suffix), 'wb').close()
+            for asset_ids, vectors in rows:
+                vectors = normalize(vectors, self.dims)
+                start = meta['count']
+                self.grow(meta, start + len(asset_ids), suffix)
+                new_vectors, new_ids = self.open_arrays(meta, 'r+', suffix)
+                new_vectors[start:start + len(asset_ids)] = vectors
+                new_ids[start:start + len(asset_ids)] = asset_ids
+                new_vectors.flush()
+                new_ids.flush()
+                meta['count'] += len(asset_ids)
+            # No slack in a fresh build; the next append grows the files again
+            for name, itemsize in (('vectors.f32', 4 * self.dims), ('ids.i64', 8)):
+                with open(self.file(name + suffix), 'ab') as f:
+                    f.truncate(meta['count'] * itemsize)
+                os.replace(self.file(name + suffix), self.file(name))
+            meta['capacity'] = meta['count']
+            # Rows saved while rebuilding are picked up by the next sync
+            meta['synced_at'] = started.isoformat() if from_database else None
+            self.write_meta(meta)
+            return meta['count']
+
+    def _database_batches(self, batch_size=5000):
+        from .models import MuzzleVector
+
+        asset_ids, vectors = [], []
+        for asset_id, vector in MuzzleVector.objects.order_by('asset_id').values_list('asset_id', 'vector').iterator(chunk_size=batch_size):
+            asset_ids.append(asset_id)
+            vectors.append(np.frombuffer(vector, dtype=np.float32))
+            if len(asset_ids) >= batch_size:
+                yield asset_ids, vectors
+                asset_ids, vectors = [], []
+        if asset_ids:
+            yield asset_ids, vectors
+
+    # -- searching -----------------------------------------------------------------------
+
+    def search(self, queries, k=10, exclude_asset_ids=None):
+        """
+        Top ``k`` assets by cosine similarity for each query vector (one vector or a batch).
+        Returns one [(asset_id, score)] list per query, best first.
+        """
+        queries = normalize(queries, self.dims)
+        meta, vectors, ids = self.mapped()
+        count = meta['count']
+        if not count or k <= 0:
+            return [[] for _ in range(len(queries))]
+
+        exclude = np.asarray(sorted(exclude_asset_ids or ()), dtype=np.int64)
+        block_rows = get_muzzle_setting('BLOCK_ROWS')
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_ids = np.zeros((len(queries), 0), dtype=np.int64)
+        for start in range(0, count, block_rows):
+            block_ids = np.asarray(ids[start:start + block_rows])
+            scores = queries @ np.asarray(vectors[start:start + block_rows]).T  # (queries, block)
+            dead = block_ids < 0
+            if len(exclude):
+                dead |= np.isin(block_ids, exclude)
+            if dead.any():
+                scores[:, dead] = -np.inf
+            if scores.shape[1] > k:
+                top = np.argpartition(scores, -k, axis=1)[:, -k:]
+                scores = np.take_along_axis(scores, top, axis=1)
+                found = block_ids[top]
+            else:
+                found = np.broadcast_to(block_ids, scores.shape)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_ids = np.concatenate([best_ids, found], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(best_scores, -k, axis=1)[:, -k:]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_ids = np.take_along_axis(best_ids, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        results = []
+        for row_scores, row_ids, row_order in zip(best_scores, best_ids, order):
+            results.append([
+                (int(row_ids[i]), float(row_scores[i])) for i in row_order if np.isfinite(row_scores[i])
+            ])
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_muzzle_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = get_muzzle_setting('DIR') or os.path.join(settings.BASE_DIR, 'muzzle_index')
+                _index = MuzzleIndex(str(path), get_muzzle_setting('DIMENSIONS'))
+    return _index
+
+
+def sync_muzzle_index(asset_ids=None):
+    try:
+        get_muzzle_index().sync(asset_ids)
+    except (OSError, MuzzleIndexError) as e:
+        print(f"Error syncing muzzle index: {str(e)}")
+
+
+def remove_from_muzzle_index(asset_ids):
+    try:
+        get_muzzle_index().remove(asset_ids)
+    except (OSError, MuzzleIndexError) as e:
+        print(f"Error updating muzzle index: {str(e)}")
@@ -0,0 +1,85 @@
+import hashlib
+import json
+import threading
+
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from Insurecow.cache import bounded_timeout, new_version
+from authservice.models import Role
+from authservice.serializers import RoleSerializer
+from .models import AssetType, Breed, Color, VaccinationStatus, DewormingStatus
+from .serializers import (
+    AssetTypeSerializer, BreedSerializer, ColorSerializer, VaccinationStatusSerializer, DewormingStatusSerializer
+)
+
+REFERENCE_VERSION_KEY = 'reference_data_version'
+
+# Bundle key -> (model, serializer); the same shapes the individual list views return
+REFERENCE_TABLES = {
+    'asset_types': (AssetType, AssetTypeSerializer),
+    'breeds': (Breed, BreedSerializer),
+    'colors': (Color, ColorSerializer),
+    'vaccination_statuses': (VaccinationStatus, VaccinationStatusSerializer),
+    'deworming_statuses': (DewormingStatus, DewormingStatusSerializer),
+    'roles': (Role, RoleSerializer),
+}
+
+_bundle = None
+_bundle_lock = threading.Lock()
+# model -> (version, {pk: instance}), used for foreign key validation
+_instances = {}
+
+
+def get_reference_version():
+    """
+    The shared version of the reference data. On a per-process cache the key expires after
+    PROCESS_LOCAL_TIMEOUT, so the in-process bundle is rebuilt at least that often.
+    """
+    version = cache.get(REFERENCE_VERSION_KEY)
+    if version is None:
+        version = new_version()
+        cache.add(REFERENCE_VERSION_KEY, version, timeout=bounded_timeout(cache, None))
+        version = cache.get(REFERENCE_VERSION_KEY, version)
+    return version
+
+
+def invalidate_reference_data():
+    """Drop this process's bundle and move to a new shared version so other processes rebuild too."""
+    global _bundle
+    _bundle = None
+    _instances.clear()
+    cache.set(REFERENCE_VERSION_KEY, new_version(), timeout=bounded_timeout(cache, None))
+
+
+def build_reference_bundle(version):
+    tables = {
+        key: serializer(model.objects.order_by('id'), many=True).data
+        for key, (model, serializer) in REFERENCE_TABLES.items()
+    }
+    content = json.dumps(tables, cls=DjangoJSONEncoder, sort_keys=True)
+    # Derived from the content, so every process agrees on it regardless of the version counter
+    etag = f'"{hashlib.sha256(content.encode()).hexdigest()[:32]}"'
+    return {'version': version, 'etag': etag, 'tables': tables}
+
+
+def get_reference_bundle():
+    """Return {'version', 'etag', 'tables'}, rebuilt only when the shared version has moved on."""
+    global _bundle
+    version = get_reference_version()
+    bundle = _bundle
+    if bundle is None or bundle['version'] != version:
+        with _bundle_lock:
+            bundle = _bundle
+            if bundle is None or bundle['version'] != version:
+                bundle = _bundle = build_reference_bundle(version)
+    return bundle
+
+
+def get_reference_instances(model):
+    """{pk: instance} for one of the reference tables, reloaded when the shared version moves on."""
+    version = get_reference_version()
+    entry = _instances.get(model)
+    if entry is None or entry[0] != version:
+        entry = _instances[model] = (version, model.objects.in_bulk())
+    return entry[1]
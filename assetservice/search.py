@@ -0,0 +1,149 @@
+"""
+Full-text search over Asset.special_mark, health_issues and remarks.
+
+The index lives in the database and is maintained by it, so every write path (save,
+queryset.update, bulk_create) keeps it current row by row:
+
+- PostgreSQL: a stored generated ``search_vector`` tsvector column with a GIN index; special
+  marks weigh more than health issues, which weigh more than remarks.
+- SQLite: an FTS5 table with the asset table as external content, kept in sync by triggers.
+- Anything else: case-insensitive substring matching, unranked.
+
+The DDL is applied by migration 0014_asset_search.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'assetservice_asset_fts'
+
+POSTGRES_SQL = [
+    f"""
+    ALTER TABLE assetservice_asset ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(special_mark, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(health_issues, '')), 'B') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(remarks, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX asset_search_vector_idx ON assetservice_asset USING gin (search_vector)",
+]
+POSTGRES_REVERSE_SQL = [
+    "DROP INDEX IF EXISTS asset_search_vector_idx",
+    "ALTER TABLE assetservice_asset DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_SQL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        special_mark, health_issues, remarks,
+        content='assetservice_asset', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON assetservice_asset BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, special_mark, health_issues, remarks)
+        VALUES (new.id, new.special_mark, new.health_issues, new.remarks);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON assetservice_asset BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, special_mark, health_issues, remarks)
+        VALUES ('delete', old.id, old.special_mark, old.health_issues, old.remarks);
+    END
+    """,
+    # Only when an indexed column changes; weight or status updates leave the index alone
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF special_mark, health_issues, remarks
+    ON assetservice_asset BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, special_mark, health_issues, remarks)
+        VALUES ('delete', old.id, old.special_mark, old.health_issues, old.remarks);
+        INSERT INTO {FTS_TABLE}(rowid, special_mark, health_issues, remarks)
+        VALUES (new.id, new.special_mark, new.health_issues, new.remarks);
+    END
+    """,
+]
+SQLITE_REVERSE_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+SQLITE_REBUILD_SQL = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+
+
+def create_search_index(connection):
+    if connection.vendor == 'postgresql':
+        statements = POSTGRES_SQL
+    elif connection.vendor == 'sqlite':
+        statements = SQLITE_SQL + [SQLITE_REBUILD_SQL]
+    else:
+        return
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def drop_search_index(connection):
+    statements = {'postgresql': POSTGRES_REVERSE_SQL, 'sqlite': SQLITE_REVERSE_SQL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def ensure_search_index(connection):
+    """
+    Create whatever part of the SQLite index is missing: test databases built without migrations
+    have none of it, and SQLite alters a table by copying it, which drops its triggers. Reindexes
+    afterwards, since writes in the meantime were not tracked.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    expected = {FTS_TABLE, f"{FTS_TABLE}_insert", f"{FTS_TABLE}_delete", f"{FTS_TABLE}_update"}
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE %s",
+                       [f"{FTS_TABLE}%"])
+        if expected <= {row[0] for row in cursor.fetchall()}:
+            return
+        for statement in SQLITE_SQL + [SQLITE_REBUILD_SQL]:
+            cursor.execute(statement)
+
+
+TERM = re.compile(r'[^\s"]+')
+
+
+def fts5_query(text):
+    """User text as an FTS5 query: every word must match, punctuation is never FTS5 syntax."""
+    return ' '.join(f'"{term}"' for term in TERM.findall(text))
+
+
+def search_assets(assets, text):
+    """``assets`` matching ``text``, annotated with ``rank`` (higher is better) and ordered by it."""
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        query = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+        assets = assets.filter(
+            RawSQL(f"assetservice_asset.search_vector @@ {query}", [text], output_field=BooleanField())
+        ).annotate(rank=RawSQL(f"ts_rank_cd(assetservice_asset.search_vector, {query})", [text],
+                               output_field=FloatField()))
+    elif vendor == 'sqlite':
+        query = fts5_query(text)
+        if not query:
+            return assets.none()
+        # Matches come from the FTS index; bm25 (lower is better) is then only computed for those rows,
+        # with special marks counting three times and health issues twice
+        assets = assets.filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [query])
+        ).annotate(rank=RawSQL(
+            f"SELECT -bm25({FTS_TABLE}, 3.0, 2.0, 1.0) FROM {FTS_TABLE} "
+            f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = assetservice_asset.id",
+            [query], output_field=FloatField()
+        ))
+    else:
+        condition = Q()
+        for term in text.split():
+            condition &= Q(special_mark__icontains=term) | Q(health_issues__icontains=term) | Q(remarks__icontains=term)
+        assets = assets.filter(condition).annotate(rank=Value(0.0, output_field=FloatField()))
+    return assets.order_by(F('rank').desc(), 'id')
@@ -45,29 +45,275 @@ class AssetHistorySerializer(serializers.ModelSerializer):
         model = AssetHistory
         fields = '__all__'
 
+import copy
+import uuid
+from collections.abc import Mapping
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from rest_framework import serializers
-from .models import Asset, AssetType, Breed, Color, VaccinationStatus, DewormingStatus
+from rest_framework.fields import get_error_detail
+from rest_framework.validators import UniqueValidator
+
+from Insurecow.renditions import RenditionsField
+from .models import Asset, AssetType, Breed, Color, VaccinationStatus, DewormingStatus, ASSET_MEDIA_FIELDS, \
+    ASSET_IMAGE_FIELDS, ChunkedUpload
 from django.contrib.auth import get_user_model
 
 
+def parse_pk(field, data):
+    if isinstance(data, bool):
+        field.fail('incorrect_type', data_type=type(data).__name__)
+    try:
+        return int(data)
+    except (TypeError, ValueError):
+        field.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class CachedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """For the small reference tables: resolves ids from the in-process reference cache, no SELECT."""
+
+    def to_internal_value(self, data):
+        from .reference import get_reference_instances
+
+        instances = get_reference_instances(self.get_queryset().model)
+        instance = instances.get(parse_pk(self, data))
+        if instance is None:
+            # Added since the map was loaded (possibly by another process): look it up and remember it
+            instance = super().to_internal_value(data)
+            instances[instance.pk] = instance
+        # Callers may modify the instance; keep the cached one clean
+        return copy.copy(instance)
+
+
+class OwnerField(serializers.PrimaryKeyRelatedField):
+    """Uses the owners AssetListSerializer loaded for the whole batch when validating many=True."""
+
+    def to_internal_value(self, data):
+        owners = getattr(self.root, '_owners', None)
+        if owners is None:
+            return super().to_internal_value(data)
+        owner = owners.get(parse_pk(self, data))
+        if owner is None:
+            self.fail('does_not_exist', pk_value=data)
+        return owner
+
+
+class AssetListSerializer(serializers.ListSerializer):
+    def prepare_batch(self, data):
+        # One IN query for every owner in the batch instead of one SELECT per row
+        owner_ids = set()
+        for item in data:
+            value = item.get('owner') if isinstance(item, Mapping) else None
+            if isinstance(value, (int, str)) and not isinstance(value, bool) and str(value).isdigit():
+                owner_ids.add(int(value))
+        self._owners = get_user_model().objects.in_bulk(owner_ids)
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.prepare_batch(data)
+        return super().to_internal_value(data)
+
+    def validate_rows(self):
+        """
+        Validate every row of ``initial_data`` on its own, so one bad row does not reject the rest
+        (bulk registration). Returns [(validated_data or None, errors or None, duplicate_candidates)].
+        A row's duplicate candidates include earlier valid rows of the batch with a similar photo,
+        identified by ``index`` rather than ``asset_id``.
+
+        Owners, chunked uploads and taken reference ids are looked up once for the whole batch, and
+        each upload is checked once however many rows use it; rows get the ChunkedUpload in place
+        of the file (see assetservice.bulk).
+        """
+        from .duplicates import find_batch_duplicates, get_duplicate_setting
+        from .uploads import get_completed_uploads
+
+        rows = self.initial_data
+        self.prepare_batch(rows)
+        upload_ids = set()
+        references = set()
+        for item in rows:
+            if not isinstance(item, Mapping):
+                continue
+            for field in ASSET_MEDIA_FIELDS:
+                try:
+                    upload_ids.add(uuid.UUID(str(item.get(f"{field}_upload"))))
+                except ValueError:
+                    pass
+            if item.get('refernce_id'):
+                references.add(str(item['refernce_id']))
+        self._completed_uploads = get_completed_uploads(self.context['request'].user, upload_ids)
+        self._checked_uploads = {}
+        taken = set(Asset.objects.filter(refernce_id__in=references).values_list('refernce_id', flat=True))
+
+        # Uniqueness is checked against ``taken`` instead of with a query per row
+        reference_field = self.child.fields['refernce_id']
+        reference_field.validators = [v for v in reference_field.validators if not isinstance(v, UniqueValidator)]
+
+        results = []
+        fingerprinted = []
+        for index, item in enumerate(rows):
+            try:
+                attrs = self.child.run_validation(item)
+                if attrs['refernce_id'] in taken:
+                    raise serializers.ValidationError({'refernce_id': ["asset with this refernce id already exists."]})
+                taken.add(attrs['refernce_id'])
+                fingerprints = self.child.fingerprints
+                candidates = self.child.duplicate_candidates
+                if fingerprints and fingerprinted:
+                    candidates = sorted(
+                        candidates + find_batch_duplicates(fingerprints, fingerprinted),
+                        key=lambda candidate: candidate['distance']
+                    )[:get_duplicate_setting('MAX_CANDIDATES')]
+                if fingerprints:
+                    fingerprinted.append((index, fingerprints))
+                results.append((attrs, None, candidates))
+            except serializers.ValidationError as e:
+                results.append((None, e.detail, []))
+        return results
+
+
 class AssetSerializer(serializers.ModelSerializer):
-    owner = serializers.PrimaryKeyRelatedField(queryset=get_user_model().objects.all(), required=False)
-    asset_type = serializers.PrimaryKeyRelatedField(queryset=AssetType.objects.all(), required=True)
-    breed = serializers.PrimaryKeyRelatedField(queryset=Breed.objects.all(), required=True)
-    color = serializers.PrimaryKeyRelatedField(queryset=Color.objects.all(), required=True)
-    vaccination_status = serializers.PrimaryKeyRelatedField(queryset=VaccinationStatus.objects.all(), required=True)
-    deworming_status = serializers.PrimaryKeyRelatedField(queryset=DewormingStatus.objects.all(), required=True)
-    muzzle_video = serializers.FileField(required=True)
-    left_side_image = serializers.ImageField(required=True)
-    right_side_image = serializers.ImageField(required=True)
-    challan_paper = serializers.FileField(required=True)
-    vet_certificate = serializers.FileField(required=True)
-    chairman_certificate = serializers.FileField(required=True)
+    owner = OwnerField(queryset=get_user_model().objects.all(), required=False)
+    asset_type = CachedPrimaryKeyRelatedField(queryset=AssetType.objects.all(), required=True)
+    breed = CachedPrimaryKeyRelatedField(queryset=Breed.objects.all(), required=True)
+    color = CachedPrimaryKeyRelatedField(queryset=Color.objects.all(), required=True)
+    vaccination_status = CachedPrimaryKeyRelatedField(queryset=VaccinationStatus.objects.all(), required=True)
+    deworming_status = CachedPrimaryKeyRelatedField(queryset=DewormingStatus.objects.all(), required=True)
+    # Media is required, either as a file in this request or as the id of a completed chunked upload
+    muzzle_video = serializers.FileField(required=False)
+    left_side_image = serializers.ImageField(required=False)
+    right_side_image = serializers.ImageField(required=False)
+    challan_paper = serializers.FileField(required=False)
+    vet_certificate = serializers.FileField(required=False)
+    chairman_certificate = serializers.FileField(required=False)
+    muzzle_video_upload = serializers.UUIDField(required=False, write_only=True)
+    left_side_image_upload = serializers.UUIDField(required=False, write_only=True)
+    right_side_image_upload = serializers.UUIDField(required=False, write_only=True)
+    challan_paper_upload = serializers.UUIDField(required=False, write_only=True)
+    vet_certificate_upload = serializers.UUIDField(required=False, write_only=True)
+    chairman_certificate_upload = serializers.UUIDField(required=False, write_only=True)
+    left_side_image_renditions = RenditionsField('left_side_image')
+    right_side_image_renditions = RenditionsField('right_side_image')
 
     class Meta:
         model = Asset
         fields = '__all__'
         read_only_fields = ['created_by', 'updated_by', 'created_at', 'updated_at']
+        list_serializer_class = AssetListSerializer
+
+    def __init__(self, *args, **kwargs):
+        include_media = kwargs.pop('include_media', True)
+        super().__init__(*args, **kwargs)
+        self._uploads = []
+        self.duplicate_candidates = []
+        self.fingerprints = {}
+        if not include_media:
+            for field in ASSET_MEDIA_FIELDS:
+                self.fields.pop(field, None)
+                self.fields.pop(f"{field}_upload", None)
+
+    def resolve_uploads(self, attrs, user):
+        """Swap ``<field>_upload`` ids for the completed chunked uploads' files."""
+        from .uploads import get_completed_uploads, open_upload
+
+        upload_ids = {}
+        for field in ASSET_MEDIA_FIELDS:
+            upload_id = attrs.pop(f"{field}_upload", None)
+            if upload_id:
+                if attrs.get(field):
+                    raise serializers.ValidationError({field: "Send either the file or an upload id, not both."})
+                upload_ids[field] = upload_id
+
+        if upload_ids:
+            uploads = getattr(self.root, '_completed_uploads', None)
+            if uploads is None:
+                uploads = get_completed_uploads(user, upload_ids.values())
+            for field, upload_id in upload_ids.items():
+                upload = uploads.get(upload_id)
+                if upload is None:
+                    raise serializers.ValidationError({f"{field}_upload": "Upload not found or not complete."})
+                # Same checks as a file sent inline (e.g. that images are images)
+                try:
+                    checked = getattr(self.root, '_checked_uploads', None)
+                    if checked is None:
+                        file = open_upload(upload)
+                        self._uploads.append((upload, file))
+                        attrs[field] = self.fields[field].run_validation(file)
+                    else:
+                        attrs[field] = self.check_upload(field, upload, checked)
+                except serializers.ValidationError as e:
+                    raise serializers.ValidationError({f"{field}_upload": e.detail})
+                except DjangoValidationError as e:
+                    raise serializers.ValidationError({f"{field}_upload": get_error_detail(e)})
+
+        if not self.partial:
+            for field in ASSET_MEDIA_FIELDS:
+                if field in self.fields and not attrs.get(field):
+                    raise serializers.ValidationError({field: "This field is required."})
+
+    def check_upload(self, field, upload, checked):
+        """
+        Validate ``upload`` for ``field`` once per batch and return the upload itself; the file is
+        closed again straight away. Images are fingerprinted while open (``upload._dhash``).
+        """
+        from .duplicates import image_fingerprint
+        from .uploads import open_upload
+
+        is_image = field in ASSET_IMAGE_FIELDS
+        key = (upload.pk, is_image)
+        if key not in checked:
+            error = None
+            with open_upload(upload) as file:
+                try:
+                    self.fields[field].run_validation(file)
+                except (serializers.ValidationError, DjangoValidationError) as e:
+                    error = e
+                if is_image and error is None:
+                    try:
+                        upload._dhash = image_fingerprint(file)
+                    except (OSError, ValueError) as e:
+                        print(f"Error fingerprinting upload {upload.pk}: {str(e)}")
+                        upload._dhash = None
+            checked[key] = error
+        if checked[key] is not None:
+            raise checked[key]
+        return upload
+
+    def release_uploads(self):
+        """Close the upload files once the asset is saved and remove them after commit."""
+        from .uploads import discard_upload
+
+        for upload, file in self._uploads:
+            file.close()
+            transaction.on_commit(lambda upload=upload: discard_upload(upload))
+        self._uploads = []
+
+    def close_uploads(self):
+        """Close the upload files without removing the uploads, when validation or saving fails."""
+        for _, file in self._uploads:
+            file.close()
+        self._uploads = []
+
+    def check_duplicates(self, attrs):
+        """Other assets whose photos look like the ones being uploaded (possible re-registration)."""
+        from .duplicates import find_duplicate_candidates, image_fingerprint
+
+        fingerprints = {}
+        for field in ASSET_IMAGE_FIELDS:
+            if isinstance(attrs.get(field), ChunkedUpload):
+                # Fingerprinted by check_upload
+                if attrs[field]._dhash is not None:
+                    fingerprints[field] = attrs[field]._dhash
+            elif attrs.get(field):
+                try:
+                    fingerprints[field] = image_fingerprint(attrs[field])
+                except (OSError, ValueError) as e:
+                    print(f"Error fingerprinting {field}: {str(e)}")
+        self.fingerprints = fingerprints
+        self.duplicate_candidates = find_duplicate_candidates(
+            fingerprints, exclude_asset_id=self.instance.pk if self.instance else None
+        ) if fingerprints else []
 
     def validate(self, attrs):
         user = self.context['request'].user
@@ -99,8 +345,23 @@ class AssetSerializer(serializers.ModelSerializer):
             if attrs['owner'] == user:
                 raise serializers.ValidationError({"owner": "You cannot assign the asset to yourself."})
 
+        # Last, so that no upload file is opened for a request the checks above reject
+        try:
+            self.resolve_uploads(attrs, user)
+            self.check_duplicates(attrs)
+        except BaseException:
+            self.close_uploads()
+            raise
+
         return attrs
 
+    def save(self, **kwargs):
+        try:
+            return super().save(**kwargs)
+        finally:
+            # No-op once create()/update() released them
+            self.close_uploads()
+
     def create(self, validated_data):
         user = self.context['request'].user
         validated_data['created_by'] = user
@@ -108,6 +369,7 @@ class AssetSerializer(serializers.ModelSerializer):
 
         # Create the asset
         asset = super().create(validated_data)
+        self.release_uploads()
 
         return asset
 
@@ -141,7 +403,92 @@ class AssetSerializer(serializers.ModelSerializer):
 
         # Save the updated instance
         instance.save()
+        self.release_uploads()
 
         return instance
 
 
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ChunkedUpload
+        fields = ['id', 'filename', 'size', 'offset', 'checksum', 'status', 'created_at', 'completed_at']
+        read_only_fields = ['id', 'offset', 'status', 'created_at', 'completed_at']
+
+    def validate_size(self, value):
+        from .uploads import get_upload_setting
+
+        if value <= 0:
+            raise serializers.ValidationError("Size must be greater than zero.")
+        if value > get_upload_setting('MAX_SIZE'):
+            raise serializers.ValidationError(f"Uploads are limited to {get_upload_setting('MAX_SIZE')} bytes.")
+        return value
+
+    def validate_checksum(self, value):
+        if value and (len(value) != 64 or any(c not in '0123456789abcdef' for c in value.lower())):
+            raise serializers.ValidationError("Checksum must be a hex SHA-256 digest.")
+        return value.lower()
+
+
+class MuzzleVectorSerializer(serializers.Serializer):
+    vector = serializers.ListField(child=serializers.FloatField(), allow_empty=False)
+
+    def validate_vector(self, value):
+        from .muzzle import MuzzleIndexError, get_muzzle_setting, normalize
+
+        try:
+            normalize(value, get_muzzle_setting('DIMENSIONS'))
+        except MuzzleIndexError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+
+
+class MuzzleSearchSerializer(serializers.Serializer):
+    """One ``vector`` or a batch of ``vectors``; each gets its own top ``k`` list."""
+    vector = serializers.ListField(child=serializers.FloatField(), required=False, allow_empty=False)
+    vectors = serializers.ListField(
+        child=serializers.ListField(child=serializers.FloatField(), allow_empty=False),
+        required=False, allow_empty=False, max_length=256
+    )
+    k = serializers.IntegerField(required=False, default=10, min_value=1, max_value=100)
+    min_score = serializers.FloatField(required=False, min_value=-1, max_value=1)
+    exclude_asset = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        from .muzzle import MuzzleIndexError, get_muzzle_setting, normalize
+
+        if ('vector' in attrs) == ('vectors' in attrs):
+            raise serializers.ValidationError("Send either vector or vectors.")
+        try:
+            normalize(attrs.get('vectors') or attrs['vector'], get_muzzle_setting('DIMENSIONS'))
+        except MuzzleIndexError as e:
+            raise serializers.ValidationError({'vectors' if 'vectors' in attrs else 'vector': str(e)})
+        return attrs
+
+
+class AssetHistoryQuerySerializer(serializers.Serializer):
+    bucket = serializers.ChoiceField(choices=['day', 'week', 'month'], required=False, default='week')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if attrs.get('start') and attrs.get('end') and attrs['start'] > attrs['end']:
+            raise serializers.ValidationError({'end': "end must not be before start."})
+        return attrs
+
+
+class AssetBulkCreateSerializer(serializers.Serializer):
+    """
+    A manifest of assets to register at once. Each row takes the same fields as create-asset, with
+    media given as ``<field>_upload`` ids of completed chunked uploads.
+    """
+    assets = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+    all_or_nothing = serializers.BooleanField(required=False, default=False)
+
+    def validate_assets(self, value):
+        from .bulk import get_bulk_asset_setting
+
+        if len(value) > get_bulk_asset_setting('MAX_ROWS'):
+            raise serializers.ValidationError(
+                f"At most {get_bulk_asset_setting('MAX_ROWS')} assets can be registered per request."
+            )
+        return value
@@ -1,3 +1,310 @@
-from django.test import TestCase
+import datetime
+import io
+import random
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from administrator.models import AuditLog, MediaBlob
+from authservice.models import Role, User
+from insuranceservice.models import AssetInsurance, InsuranceCompany
+from .history import status_timeline, weight_timeline
+from .models import (
+    Asset, AssetHistory, AssetImageHash, AssetType, Breed, ChunkedUpload, Color, DewormingStatus, VaccinationStatus
+)
+from . import uploads
+from .uploads import append_chunk, create_upload
+
+
+def create_asset(owner, reference, **fields):
+    attrs = {
+        'asset_type': AssetType.objects.get_or_create(name='Cow')[0],
+        'breed': Breed.objects.get_or_create(name='Local')[0],
+        'color': Color.objects.get_or_create(name='Red')[0],
+        'vaccination_status': VaccinationStatus.objects.get_or_create(name='Done')[0],
+        'deworming_status': DewormingStatus.objects.get_or_create(name='Done')[0],
+        'age_in_months': 12, 'weight_kg': 150, 'special_mark': 'none', 'health_issues': 'none',
+        'muzzle_video': 'muzzle.mp4', 'left_side_image': 'left.jpg', 'right_side_image': 'right.jpg',
+        'challan_paper': 'challan.pdf', 'vet_certificate': 'vet.pdf', 'chairman_certificate': 'chairman.pdf',
+    }
+    attrs.update(fields)
+    return Asset.objects.create(owner=owner, created_by=owner, refernce_id=reference, **attrs)
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AssetSearchScopeTest(TestCase):
+    url = '/api/v1/asset/asset-search/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('farmer', 'manager', 'insurer'):
+            Role.objects.create(name=name)
+        cls.manager = User.objects.create_user(mobile_number='01900000009', password='x', role_id=2)
+        cls.farmer = User.objects.create_user(mobile_number='01900000001', password='x', role_id=1,
+                                              managed_by=cls.manager)
+        cls.other_farmer = User.objects.create_user(mobile_number='01900000002', password='x', role_id=1)
+        cls.insurer = User.objects.create_user(mobile_number='01900000003', password='x', role_id=3)
+
+        cls.insured = create_asset(cls.farmer, 'insured', special_mark='white patch on forehead')
+        cls.uninsured = create_asset(cls.farmer, 'uninsured', special_mark='white tail')
+        cls.others = create_asset(cls.other_farmer, 'others', special_mark='white forehead')
+        today = datetime.date.today()
+        AssetInsurance.objects.create(
+            asset=cls.insured, insurance_provider=InsuranceCompany.objects.get(user=cls.insurer),
+            insurance_number='INS-1', sum_insured=1000, insurance_start_date=today, insurance_end_date=today,
+        )
+
+    def search(self, user, text):
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(self.url, {'q': text})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()['data']
+        return data['count'], [asset['id'] for asset in data['results']]
+
+    def test_insurer_sees_each_insured_asset_once(self):
+        # The owner has two hierarchy rows (itself and its manager)
+        self.assertEqual(self.search(self.insurer, 'white'), (1, [self.insured.pk]))
+
+    def test_manager_sees_managed_assets(self):
+        count, ids = self.search(self.manager, 'white')
+        self.assertEqual(count, 2)
+        self.assertCountEqual(ids, [self.insured.pk, self.uninsured.pk])
+
+    def test_farmer_sees_own_assets(self):
+        self.assertEqual(self.search(self.other_farmer, 'forehead'), (1, [self.others.pk]))
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AssetHistoryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('farmer', 'manager', 'insurer'):
+            Role.objects.create(name=name)
+        cls.manager = User.objects.create_user(mobile_number='01900000009', password='x', role_id=2)
+        cls.farmer = User.objects.create_user(mobile_number='01900000001', password='x', role_id=1,
+                                              managed_by=cls.manager)
+        cls.other_farmer = User.objects.create_user(mobile_number='01900000002', password='x', role_id=1)
+        cls.pending = VaccinationStatus.objects.create(name='Pending')
+        cls.done = VaccinationStatus.objects.create(name='Vaccinated')
+
+    def update(self, asset, **fields):
+        asset = Asset.objects.get(pk=asset.pk)
+        for name, value in fields.items():
+            setattr(asset, name, value)
+        asset.save()
+        return asset
+
+    def records(self, asset):
+        return list(AssetHistory.objects.filter(asset=asset).order_by('id').values_list(
+            'weight_kg', 'weight_change', 'vaccination_status_id'
+        ))
+
+    def spread(self, asset, start):
+        """Move the asset's records a month apart, oldest first, from ``start``."""
+        for months, pk in enumerate(AssetHistory.objects.filter(asset=asset).order_by('id').values_list('pk', flat=True)):
+            AssetHistory.objects.filter(pk=pk).update(changed_at=start + datetime.timedelta(days=31 * months))
+
+    def test_status_only_change_records_no_weight(self):
+        asset = create_asset(self.farmer, 'a1', vaccination_status=self.pending)
+        self.update(asset, vaccination_status=self.done)
+        self.update(asset, special_mark='not tracked')
+        self.assertEqual(self.records(asset), [
+            (Decimal('150.00'), None, self.pending.pk),
+            (None, None, self.done.pk),
+        ])
+
+    def test_weight_change_records_difference(self):
+        asset = create_asset(self.farmer, 'a1', vaccination_status=self.pending)
+        self.update(asset, weight_kg=Decimal('162.5'))
+        self.update(asset, weight_kg=Decimal('160'), vaccination_status=self.done)
+        self.assertEqual(self.records(asset), [
+            (Decimal('150.00'), None, self.pending.pk),
+            (Decimal('162.50'), Decimal('12.50'), self.pending.pk),
+            (Decimal('160.00'), Decimal('-2.50'), self.done.pk),
+        ])
+
+    def test_status_cleared_and_set_again(self):
+        asset = create_asset(self.farmer, 'a1', vaccination_status=self.pending)
+        self.update(asset, vaccination_status=None)
+        self.update(asset, weight_kg=Decimal('170'))
+        self.update(asset, vaccination_status=self.done)
+        self.spread(asset, timezone.now() - datetime.timedelta(days=200))
+
+        history = AssetHistory.objects.filter(asset=asset)
+        records = list(history.order_by('id').values_list('changed_at', 'vaccination_status_id'))
+        # The weight-only record keeps the status cleared, so it is not a change
+        self.assertEqual(
+            [(record['changed_at'], record['status_id']) for record in status_timeline(history, 'vaccination_status')],
+            [records[0], records[1], records[3]],
+        )
+        weights = weight_timeline(history, 'day')
+        self.assertEqual([(point['average_kg'], point['readings']) for point in weights],
+                         [(Decimal('150'), 1), (Decimal('170'), 1)])
+
+    def test_weight_gain_by_breed_over_manager_hierarchy(self):
+        local = Breed.objects.create(name='Local')
+        sahiwal = Breed.objects.create(name='Sahiwal')
+        start = timezone.now() - datetime.timedelta(days=120)
+        for reference, owner, breed, weights in (
+            ('a1', self.farmer, local, ['160', '175']),
+            ('a2', self.farmer, local, ['150', '170']),
+            ('a3', self.farmer, sahiwal, ['140', '145']),
+            ('a4', self.other_farmer, local, ['200', '300']),
+        ):
+            asset = create_asset(owner, reference, breed=breed)
+            for weight in weights:
+                self.update(asset, weight_kg=Decimal(weight))
+            self.spread(asset, start)
+
+        client = APIClient()
+        client.force_authenticate(self.manager)
+        response = client.get('/api/v1/asset/assets/history/weight-gain/')
+        self.assertEqual(response.status_code, 200)
+        gains = [(row['breed'], row['assets'], row['total_gain_kg'], row['average_gain_kg'])
+                 for row in response.json()['data']['results']]
+        # a2 was registered at 150, so its first update is not a change; a4 is outside the hierarchy
+        self.assertEqual(gains, [
+            ('Local', 2, 30.0, 15.0),
+            ('Sahiwal', 1, -10.0, -10.0),
+            ('Local', 1, 15.0, 15.0),
+            ('Sahiwal', 1, 5.0, 5.0),
+        ])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+                   AUDIT_LOG={'MODE': 'sync'}, IMAGE_RENDITIONS={'WORKERS': 0})
+class AssetBulkCreateTest(TestCase):
+    url = '/api/v1/asset/bulk-create-asset/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('farmer', 'manager', 'insurer'):
+            Role.objects.create(name=name)
+        cls.manager = User.objects.create_user(mobile_number='01900000009', password='x', role_id=2)
+        cls.farmer = User.objects.create_user(mobile_number='01900000001', password='x', role_id=1,
+                                              managed_by=cls.manager)
+        cls.references = {
+            'asset_type': AssetType.objects.create(name='Cow').pk,
+            'breed': Breed.objects.create(name='Local').pk,
+            'color': Color.objects.create(name='Red').pk,
+            'vaccination_status': VaccinationStatus.objects.create(name='Done').pk,
+            'deworming_status': DewormingStatus.objects.create(name='Done').pk,
+        }
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        storage = override_settings(MEDIA_ROOT=f'{directory}/media', CHUNKED_UPLOAD={'TEMP_DIR': f'{directory}/uploads'})
+        storage.enable()
+        self.addCleanup(storage.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+        self.shared = {field: self.upload(f'{field}.pdf', b'%PDF ' + field.encode())
+                       for field in ('challan_paper', 'vet_certificate', 'chairman_certificate')}
+
+    def upload(self, filename, data):
+        upload = create_upload(self.manager, filename, len(data))
+        return str(append_chunk(upload.pk, self.manager, 0, SimpleUploadedFile(filename, data)).pk)
+
+    def photo(self, seed):
+        from PIL import Image
+
+        rng = random.Random(seed)
+        image = Image.new('L', (40, 30))
+        image.putdata([rng.randrange(256) for _ in range(1200)])
+        buffer = io.BytesIO()
+        image.resize((320, 240)).convert('RGB').save(buffer, 'JPEG')
+        return buffer.getvalue()
+
+    def row(self, index, **fields):
+        row = {
+            **self.references, 'owner': self.farmer.pk, 'age_in_months': 6, 'weight_kg': '120.50',
+            'special_mark': 'white patch', 'health_issues': 'none', 'refernce_id': f'herd-{index}',
+            'muzzle_video_upload': self.upload('muzzle.mp4', b'video %d' % index),
+            'left_side_image_upload': self.upload('left.jpg', self.photo(index)),
+            'right_side_image_upload': self.upload('right.jpg', self.photo(1000 + index)),
+            **{f'{field}_upload': upload for field, upload in self.shared.items()},
+        }
+        row.update(fields)
+        return row
+
+    def post(self, rows, all_or_nothing=False):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, {'assets': rows, 'all_or_nothing': all_or_nothing}, format='json')
+
+    def test_valid_rows_are_created_and_invalid_rows_reported(self):
+        rows = [self.row(0), self.row(1, muzzle_video_upload='not an upload'), self.row(2, refernce_id='herd-0')]
+        response = self.post(rows)
+
+        self.assertEqual(response.status_code, 201)
+        data = response.json()['data']
+        self.assertEqual((data['created'], data['failed']), (1, 2))
+        self.assertEqual([sorted(result) for result in data['results']], [
+            ['duplicate_candidates', 'id', 'index', 'refernce_id'], ['errors', 'index'], ['errors', 'index'],
+        ])
+        self.assertIn('muzzle_video_upload', data['results'][1]['errors'])
+        self.assertEqual(data['results'][2]['errors'], {'refernce_id': ['asset with this refernce id already exists.']})
+        self.assertEqual(list(Asset.objects.values_list('refernce_id', flat=True)), ['herd-0'])
+
+    def test_all_or_nothing_creates_nothing_when_a_row_fails(self):
+        response = self.post([self.row(0), self.row(1, breed=999)], all_or_nothing=True)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['data']['details']['results'][0]['index'], 1)
+        self.assertFalse(Asset.objects.exists())
+        self.assertFalse(MediaBlob.objects.exists())
+
+    def test_each_asset_gets_history_fingerprints_and_audit_entry(self):
+        response = self.post([self.row(0), self.row(1), self.row(2)])
+
+        self.assertEqual(response.status_code, 201)
+        assets = list(Asset.objects.order_by('id'))
+        self.assertEqual([asset.refernce_id for asset in assets], ['herd-0', 'herd-1', 'herd-2'])
+        for asset in assets:
+            history = AssetHistory.objects.get(asset=asset)
+            self.assertEqual((history.weight_kg, history.remarks, history.changed_by_id),
+                             (Decimal('120.50'), 'Asset registered', self.manager.pk))
+            self.assertEqual(set(AssetImageHash.objects.filter(asset=asset).values_list('field', flat=True)),
+                             {'left_side_image', 'right_side_image'})
+            self.assertEqual(list(AuditLog.objects.filter(model_name='Asset', instance_id=asset.pk)
+                                  .values_list('action', flat=True)), ['create'])
+        self.assertFalse(ChunkedUpload.objects.exists())
+
+    def test_shared_upload_is_stored_once(self):
+        response = self.post([self.row(0), self.row(1), self.row(2)])
+
+        self.assertEqual(response.status_code, 201)
+        names = set(Asset.objects.values_list('challan_paper', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(MediaBlob.objects.get(name=names.pop()).ref_count, 3)
+        self.assertEqual(MediaBlob.objects.get(name=Asset.objects.first().left_side_image.name).ref_count, 1)
+
+    def test_single_create_closes_uploads_when_validation_fails(self):
+        opened = []
+
+        def open_upload(upload):
+            opened.append(open_upload.wrapped(upload))
+            return opened[-1]
+        open_upload.wrapped = uploads.open_upload
+
+        rows = [
+            # The second image is not one, after the first was opened
+            self.row(0, right_side_image_upload=self.upload('right.jpg', b'not an image')),
+            # Every upload is fine, but no owner is given
+            {key: value for key, value in self.row(1).items() if key != 'owner'},
+        ]
+        with mock.patch.object(uploads, 'open_upload', open_upload):
+            for row in rows:
+                response = self.client.post('/api/v1/asset/create-asset/', row, format='json')
+                self.assertEqual(response.status_code, 400)
+
+        self.assertTrue(opened)
+        self.assertTrue(all(file.closed for file in opened))
+        self.assertFalse(Asset.objects.exists())
@@ -0,0 +1,188 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import ChunkedUpload, ChunkedUploadStatus
+
+DEFAULT_CHUNKED_UPLOAD_SETTINGS = {
+    'TEMP_DIR': None,  # defaults to FILE_UPLOAD_TEMP_DIR or the system temp dir
+    'MAX_SIZE': 200 * 1024 * 1024,
+    'CHUNK_SIZE': 1024 * 1024,  # suggested to clients; any chunk size is accepted
+    'EXPIRY_HOURS': 24,
+}
+
+
+def get_upload_setting(name):
+    return getattr(settings, 'CHUNKED_UPLOAD', {}).get(name, DEFAULT_CHUNKED_UPLOAD_SETTINGS[name])
+
+
+class UploadError(Exception):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    """The chunk does not start where the upload currently ends; the client should resume from ``offset``."""
+
+    def __init__(self, offset):
+        super().__init__(f"Offset mismatch, the upload continues at byte {offset}.")
+        self.offset = offset
+
+
+def get_temp_dir():
+    temp_dir = get_upload_setting('TEMP_DIR') or os.path.join(
+        settings.FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir(), 'insurecow_uploads'
+    )
+    os.makedirs(temp_dir, exist_ok=True)
+    return temp_dir
+
+
+def temp_path(upload):
+    return os.path.join(get_temp_dir(), f"{upload.pk}.part")
+
+
+# Running SHA-256 per upload, so each chunk only hashes its own bytes. Another worker (or a
+# restart) rebuilds the state from the temp file once and carries on incrementally.
+_hashers = OrderedDict()
+_hashers_lock = threading.Lock()
+MAX_CACHED_HASHERS = 1000
+
+
+def _get_hasher(upload, path):
+    with _hashers_lock:
+        cached = _hashers.pop(upload.pk, None)
+    if cached is not None and cached[0] == upload.offset:
+        return cached[1]
+
+    hasher = hashlib.sha256()
+    remaining = upload.offset
+    with open(path, 'rb') as f:
+        while remaining:
+            block = f.read(min(remaining, 1024 * 1024))
+            if not block:
+                raise UploadError("The partial upload is missing data; start a new upload.")
+            hasher.update(block)
+            remaining -= len(block)
+    return hasher
+
+
+def _store_hasher(upload, hasher):
+    with _hashers_lock:
+        _hashers[upload.pk] = (upload.offset, hasher)
+        while len(_hashers) > MAX_CACHED_HASHERS:
+            _hashers.popitem(last=False)
+
+
+def create_upload(user, filename, size, checksum=''):
+    if size > get_upload_setting('MAX_SIZE'):
+        raise UploadError(f"Uploads are limited to {get_upload_setting('MAX_SIZE')} bytes.")
+    upload = ChunkedUpload.objects.create(user=user, filename=os.path.basename(filename), size=size,
+                                          checksum=(checksum or '').lower())
+    open(temp_path(upload), 'wb').close()
+    return upload
+
+
+def append_chunk(upload_id, user, offset, chunk, chunk_checksum=None):
+    """
+    Append ``chunk`` (an uploaded file) at ``offset`` and return the updated upload.
+
+    The row is locked for the duration so concurrent retries of the same chunk cannot interleave.
+    A chunk that fails its checksum is discarded and the offset stays where it was.
+    """
+    with transaction.atomic():
+        try:
+            upload = ChunkedUpload.objects.select_for_update().get(pk=upload_id, user=user)
+        except ChunkedUpload.DoesNotExist:
+            raise UploadError("Upload not found.")
+        if upload.status == ChunkedUploadStatus.COMPLETE:
+            raise UploadError("Upload is already complete.")
+        if offset != upload.offset:
+            raise OffsetMismatch(upload.offset)
+
+        path = temp_path(upload)
+        if not os.path.exists(path):
+            raise UploadError("The partial upload is missing; start a new upload.")
+        hasher = _get_hasher(upload, path).copy()
+        chunk_hasher = hashlib.sha256()
+        written = 0
+        with open(path, 'r+b') as f:
+            f.seek(offset)
+            for block in chunk.chunks():
+                written += len(block)
+                if offset + written > upload.size:
+                    f.truncate(offset)
+                    raise UploadError("Chunk runs past the declared upload size.")
+                f.write(block)
+                hasher.update(block)
+                chunk_hasher.update(block)
+            # Drop anything left behind by an earlier attempt that never got recorded
+            f.truncate(offset + written)
+
+            if chunk_checksum and chunk_checksum.lower() != chunk_hasher.hexdigest():
+                f.truncate(offset)
+                raise UploadError("Chunk checksum mismatch.")
+
+        upload.offset = offset + written
+        corrupt = False
+        if upload.offset == upload.size:
+            digest = hasher.hexdigest()
+            if upload.checksum and upload.checksum != digest:
+                # The whole file is bad; make the client start over
+                open(path, 'wb').close()
+                upload.offset = 0
+                corrupt = True
+            else:
+                upload.checksum = digest
+                upload.status = ChunkedUploadStatus.COMPLETE
+                upload.completed_at = now()
+        else:
+            _store_hasher(upload, hasher)
+        upload.save(update_fields=['offset', 'checksum', 'status', 'completed_at', 'updated_at'])
+
+    if corrupt:
+        raise UploadError("File checksum mismatch; the upload was reset.")
+    return upload
+
+
+def get_completed_uploads(user, upload_ids):
+    """{id: upload} for the given ids that belong to ``user`` and are complete."""
+    return ChunkedUpload.objects.filter(
+        pk__in=list(upload_ids), user=user, status=ChunkedUploadStatus.COMPLETE
+    ).in_bulk()
+
+
+def open_upload(upload):
+    """The completed upload as a File, ready to assign to a FileField/ImageField."""
+    return File(open(temp_path(upload), 'rb'), name=upload.filename)
+
+
+def discard_upload(upload):
+    discard_uploads([upload])
+
+
+def discard_uploads(uploads):
+    """Remove the temp files and rows of ``uploads``, with a single DELETE."""
+    for upload in uploads:
+        try:
+            os.remove(temp_path(upload))
+        except FileNotFoundError:
+            pass
+        with _hashers_lock:
+            _hashers.pop(upload.pk, None)
+    ChunkedUpload.objects.filter(pk__in=[upload.pk for upload in uploads]).delete()
+
+
+def purge_expired_uploads(hours=None):
+    """Remove uploads (finished or not) untouched for EXPIRY_HOURS. Returns how many were removed."""
+    cutoff = now() - timedelta(hours=get_upload_setting('EXPIRY_HOURS') if hours is None else hours)
+    expired = list(ChunkedUpload.objects.filter(updated_at__lt=cutoff))
+    if expired:
+        discard_uploads(expired)
+    return len(expired)
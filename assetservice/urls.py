@@ -29,9 +29,20 @@ urlpatterns = [
 
 
 
+    path('reference-data/', ReferenceDataAPIView.as_view(), name='reference-data'),
+
+    path('uploads/', ChunkedUploadCreateAPIView.as_view(), name='chunked-upload-create'),
+    path('uploads/<uuid:upload_id>/', ChunkedUploadDetailAPIView.as_view(), name='chunked-upload-detail'),
+
     path('asset-list/', AssetListAPIView.as_view(), name='asset-list'),
+    path('asset-search/', AssetSearchAPIView.as_view(), name='asset-search'),
     path('create-asset/', AssetCreateAPIView.as_view(), name='asset-create'),
+    path('bulk-create-asset/', AssetBulkCreateAPIView.as_view(), name='asset-bulk-create'),
     path('assets/<int:pk>/', AssetDetailAPIView.as_view(), name='asset-detail'),
+    path('assets/<int:pk>/history/', AssetHistoryAPIView.as_view(), name='asset-history'),
+    path('assets/history/weight-gain/', HerdWeightGainAPIView.as_view(), name='herd-weight-gain'),
+    path('assets/<int:pk>/muzzle-vector/', AssetMuzzleVectorAPIView.as_view(), name='asset-muzzle-vector'),
+    path('muzzle-search/', MuzzleSearchAPIView.as_view(), name='muzzle-search'),
 
     # path('assets/create-on-behalf/', AssetCreateOnBehalfAPIView.as_view(), name='create_asset_on_behalf'),
 
@@ -1,18 +1,32 @@
+import numpy as np
 from rest_framework import serializers
 from rest_framework.generics import get_object_or_404
 from .models import Breed, Color, VaccinationStatus, DewormingStatus
 from .serializers import BreedSerializer, ColorSerializer, VaccinationStatusSerializer, DewormingStatusSerializer
 from django.shortcuts import get_object_or_404
+from django.db import IntegrityError
+from django.db.models import Q
+from django.utils.http import parse_etags
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from .models import Asset, AssetHistory, AssetType
+from .models import Asset, AssetHistory, AssetType, ASSET_MEDIA_FIELDS, ASSET_IMAGE_FIELDS
 from .serializers import AssetSerializer, AssetTypeSerializer
 from rest_framework.permissions import BasePermission
 from Insurecow.utils import success_response, handle_serializer_error, validation_error_from_serializer, error_response
+from Insurecow.pagination import KeysetPagination, RankedPagination
+from .reference import get_reference_bundle
+from .models import ChunkedUpload, MuzzleVector
+from .serializers import ChunkedUploadSerializer, MuzzleSearchSerializer, MuzzleVectorSerializer
+from .serializers import AssetBulkCreateSerializer, AssetHistoryQuerySerializer
+from .bulk import register_assets
+from .search import search_assets
+from .history import filter_period, status_timeline, weight_gain_by_breed, weight_timeline
+from .muzzle import MuzzleIndexError, get_muzzle_index
+from .uploads import OffsetMismatch, UploadError, append_chunk, create_upload, discard_upload, get_upload_setting
 from administrator.views import IsSuperUser
-from authservice.models import User
+from authservice.models import User, UserHierarchy
 
 
 class AssetTypeListAPIView(APIView):
@@ -291,6 +305,33 @@ class DewormingStatusDetailAPIView(APIView):
 
 
 
+class ReferenceDataAPIView(APIView):
+    """
+    All lookup tables (asset types, breeds, colors, vaccination/deworming statuses, roles) in one
+    response. Send the returned ETag back in If-None-Match to get a 304 while nothing changed.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        bundle = get_reference_bundle()
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = [etag.removeprefix('W/') for etag in parse_etags(if_none_match)]
+            if '*' in etags or bundle['etag'] in etags:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+                response['ETag'] = bundle['etag']
+                return response
+
+        response = success_response(
+            "Reference Data Retrieved successfully",
+            data={"version": bundle['version'], **bundle['tables']},
+            status_code=status.HTTP_200_OK
+        )
+        response['ETag'] = bundle['etag']
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+
 class AssetListAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -300,16 +341,62 @@ class AssetListAPIView(APIView):
         else:
             assets = Asset.objects.filter(owner=request.user)
 
-        serializer = AssetSerializer(assets, many=True)
+        assets = assets.select_related(
+            'asset_type', 'breed', 'color', 'vaccination_status', 'deworming_status', 'owner'
+        )
+        include_media = request.query_params.get('include_media', '').lower() in ('1', 'true', 'yes')
+        if not include_media:
+            # Image names stay loaded: the rendition (thumbnail) URLs are listed either way
+            assets = assets.defer(*(field for field in ASSET_MEDIA_FIELDS if field not in ASSET_IMAGE_FIELDS))
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(assets, request, view=self)
+        serializer = AssetSerializer(page, many=True, include_media=include_media, context={'request': request})
         try:
             return success_response(
                 "Asset List Retrieved successfully",
-                data=serializer.data,
+                data=paginator.get_paginated_data(serializer.data),
                 status_code=status.HTTP_200_OK
             )
         except serializers.ValidationError as e:
             return handle_serializer_error(e)
 
+class AssetSearchAPIView(APIView):
+    """
+    ``?q=white patch forehead``: assets whose special mark, health issues or remarks match every
+    word, best matches first. Covers the user's own assets, those of the users they manage and
+    those insured by their company; superusers search everything.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        from insuranceservice.models import AssetInsurance
+
+        text = request.query_params.get('q', '').strip()
+        if not text:
+            return error_response("Search text (q) is required.", status_code=status.HTTP_400_BAD_REQUEST)
+
+        assets = Asset.objects.all()
+        if not request.user.is_superuser:
+            # Subqueries rather than a join on the hierarchy, which would repeat an insured asset
+            # once per ancestor of its owner
+            assets = assets.filter(
+                Q(owner_id__in=UserHierarchy.objects.filter(ancestor_id=request.user.pk).values('descendant_id')) |
+                Q(pk__in=AssetInsurance.objects.filter(insurance_provider__user_id=request.user.pk).values('asset_id'))
+            )
+        assets = search_assets(assets, text).select_related(
+            'asset_type', 'breed', 'color', 'vaccination_status', 'deworming_status', 'owner'
+        ).defer(*(field for field in ASSET_MEDIA_FIELDS if field not in ASSET_IMAGE_FIELDS))
+
+        paginator = RankedPagination()
+        page = paginator.paginate_queryset(assets, request, view=self)
+        serializer = AssetSerializer(page, many=True, include_media=False, context={'request': request})
+        data = serializer.data
+        for item, asset in zip(data, page):
+            item['rank'] = asset.rank
+        return success_response("Asset search completed successfully.", data=paginator.get_paginated_data(data))
+
+
 class AssetCreateAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -318,12 +405,61 @@ class AssetCreateAPIView(APIView):
         if serializer.is_valid():
             try:
                 serializer.save()
-                return success_response("Asset Created successfully.", data=serializer.data, status_code=status.HTTP_201_CREATED)
+                return success_response(
+                    "Asset Created successfully.",
+                    data={**serializer.data, "duplicate_candidates": serializer.duplicate_candidates},
+                    status_code=status.HTTP_201_CREATED
+                )
             except serializers.ValidationError as e:
                 return handle_serializer_error(e)
 
         return validation_error_from_serializer(serializer)
 
+class AssetBulkCreateAPIView(APIView):
+    """
+    Register a herd in one request: ``{"assets": [...], "all_or_nothing": false}``. Rows are validated
+    together and the valid ones created; the response reports each row by its index in the manifest.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        manifest = AssetBulkCreateSerializer(data=request.data)
+        if not manifest.is_valid():
+            return validation_error_from_serializer(manifest)
+
+        serializer = AssetSerializer(data=manifest.validated_data['assets'], many=True, context={'request': request})
+        rows = serializer.validate_rows()
+        results = [{"index": index, "errors": errors} for index, (attrs, errors, _) in enumerate(rows) if errors]
+        valid = [(index, attrs, candidates) for index, (attrs, _, candidates) in enumerate(rows) if attrs is not None]
+        if not valid or (results and manifest.validated_data['all_or_nothing']):
+            first = results[0]
+            field, errors = next(iter(first["errors"].items())) if isinstance(first["errors"], dict) else ("", first["errors"])
+            return Response({
+                "statusCode": "400",
+                "statusMessage": "Validation Error",
+                "data": {
+                    "details": {"created": 0, "failed": len(results), "results": results},
+                    "message": f"Item {first['index'] + 1} - {field}: {errors[0] if isinstance(errors, list) else errors}"
+                }
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            assets = register_assets([attrs for _, attrs, _ in valid], request.user)
+        except IntegrityError as e:
+            # A reference id taken by a concurrent request
+            return error_response(f"No assets were created: {str(e)}", status_code=status.HTTP_409_CONFLICT)
+
+        for (index, _, candidates), asset in zip(valid, assets):
+            results.append({"index": index, "id": asset.pk, "refernce_id": asset.refernce_id,
+                            "duplicate_candidates": candidates})
+        results.sort(key=lambda result: result["index"])
+        return success_response(
+            "Assets Created successfully." if len(assets) == len(rows) else "Some assets could not be created.",
+            data={"created": len(assets), "failed": len(rows) - len(assets), "results": results},
+            status_code=status.HTTP_201_CREATED
+        )
+
+
 class AssetDetailAPIView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -359,7 +495,10 @@ class AssetDetailAPIView(APIView):
             if serializer.is_valid():
                 try:
                     serializer.save()
-                    return success_response("Asset Updated successfully", data=serializer.data)
+                    return success_response(
+                        "Asset Updated successfully",
+                        data={**serializer.data, "duplicate_candidates": serializer.duplicate_candidates}
+                    )
                 except serializers.ValidationError as e:
                     return handle_serializer_error(e)
             return validation_error_from_serializer(serializer)
@@ -387,4 +526,170 @@ class AssetDetailAPIView(APIView):
             return error_response(f"Attribute error: {str(e)}", status_code=status.HTTP_404_NOT_FOUND)
 
         except serializers.ValidationError as e:
-            return handle_serializer_error(e)
\ No newline at end of file
+            return handle_serializer_error(e)
+
+
+class AssetHistoryAPIView(APIView):
+    """
+    The asset's weight timeline downsampled to ``?bucket=day|week|month`` and its vaccination and
+    deworming changes, optionally limited to ``?start=`` / ``?end=`` (dates).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        if request.user.is_superuser:
+            asset = get_object_or_404(Asset.objects.only('id'), pk=pk)
+        else:
+            asset = get_object_or_404(Asset.objects.only('id'), pk=pk, owner=request.user)
+        query = AssetHistoryQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return validation_error_from_serializer(query)
+
+        params = query.validated_data
+        history = filter_period(AssetHistory.objects.filter(asset=asset), params.get('start'), params.get('end'))
+        return success_response("Asset history retrieved successfully.", data={
+            "asset_id": asset.pk,
+            "bucket": params['bucket'],
+            "weight": weight_timeline(history, params['bucket']),
+            "vaccination": status_timeline(history, 'vaccination_status'),
+            "deworming": status_timeline(history, 'deworming_status'),
+        })
+
+
+class HerdWeightGainAPIView(APIView):
+    """Average monthly weight gain per breed over the user's own assets and those of users they manage."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = AssetHistoryQuerySerializer(data=request.query_params)
+        if not query.is_valid():
+            return validation_error_from_serializer(query)
+
+        params = query.validated_data
+        history = AssetHistory.objects.all()
+        if not request.user.is_superuser:
+            history = history.filter(asset__owner__ancestor_links__ancestor_id=request.user.pk)
+        history = filter_period(history, params.get('start'), params.get('end'))
+        return success_response("Herd weight gain retrieved successfully.", data=weight_gain_by_breed(history))
+
+
+class ChunkedUploadCreateAPIView(APIView):
+    """Start a resumable upload: POST filename, size and optionally the file's SHA-256 checksum."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = ChunkedUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return validation_error_from_serializer(serializer)
+        try:
+            upload = create_upload(request.user, **serializer.validated_data)
+        except UploadError as e:
+            return error_response(str(e), status_code=status.HTTP_400_BAD_REQUEST)
+        return success_response(
+            "Upload started successfully.",
+            data={**ChunkedUploadSerializer(upload).data, "chunk_size": get_upload_setting('CHUNK_SIZE')},
+            status_code=status.HTTP_201_CREATED
+        )
+
+
+class ChunkedUploadDetailAPIView(APIView):
+    """
+    GET returns the current offset to resume from. PUT appends one chunk: multipart ``chunk`` file
+    plus ``offset`` (or an Upload-Offset header) and an optional ``chunk_checksum`` (SHA-256).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, upload_id):
+        upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+        return success_response("Upload status retrieved successfully.", data=ChunkedUploadSerializer(upload).data)
+
+    def put(self, request, upload_id):
+        chunk = request.FILES.get('chunk')
+        offset = request.data.get('offset', request.headers.get('Upload-Offset'))
+        if chunk is None or offset is None or not str(offset).isdigit():
+            return error_response("A chunk file and a numeric offset are required.",
+                                  status_code=status.HTTP_400_BAD_REQUEST)
+        try:
+            upload = append_chunk(upload_id, request.user, int(offset), chunk,
+                                  chunk_checksum=request.data.get('chunk_checksum'))
+        except OffsetMismatch as e:
+            response = error_response(str(e), status_code=status.HTTP_409_CONFLICT)
+            response['Upload-Offset'] = str(e.offset)
+            return response
+        except UploadError as e:
+            return error_response(str(e), status_code=status.HTTP_400_BAD_REQUEST)
+
+        response = success_response("Chunk received successfully.", data=ChunkedUploadSerializer(upload).data)
+        response['Upload-Offset'] = str(upload.offset)
+        return response
+
+    def delete(self, request, upload_id):
+        upload = get_object_or_404(ChunkedUpload, pk=upload_id, user=request.user)
+        discard_upload(upload)
+        return success_response("Upload cancelled successfully.", status_code=status.HTTP_204_NO_CONTENT)
+
+
+def muzzle_matches(matches, min_score=None):
+    return [
+        {"asset_id": asset_id, "score": round(score, 6)}
+        for asset_id, score in matches if min_score is None or score >= min_score
+    ]
+
+
+class AssetMuzzleVectorAPIView(APIView):
+    """
+    PUT stores the asset's muzzle-print vector and returns the closest other assets, so a cow
+    that is already registered shows up straight away. GET tells whether a vector is stored.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get_asset(self, request, pk):
+        if request.user.is_superuser:
+            return get_object_or_404(Asset, pk=pk)
+        return get_object_or_404(Asset, pk=pk, owner=request.user)
+
+    def get(self, request, pk):
+        asset = self.get_asset(request, pk)
+        updated_at = MuzzleVector.objects.filter(asset=asset).values_list('updated_at', flat=True).first()
+        return success_response("Muzzle vector status retrieved successfully.",
+                                data={"asset_id": asset.pk, "has_vector": updated_at is not None, "updated_at": updated_at})
+
+    def put(self, request, pk):
+        asset = self.get_asset(request, pk)
+        serializer = MuzzleVectorSerializer(data=request.data)
+        if not serializer.is_valid():
+            return validation_error_from_serializer(serializer)
+
+        vector = serializer.validated_data['vector']
+        MuzzleVector.objects.update_or_create(
+            asset=asset, defaults={'vector': np.asarray(vector, dtype=np.float32).tobytes()}
+        )
+        try:
+            matches = get_muzzle_index().search(vector, k=5, exclude_asset_ids=[asset.pk])[0]
+        except (OSError, MuzzleIndexError) as e:
+            print(f"Error searching muzzle index: {str(e)}")
+            matches = []
+        return success_response("Muzzle vector saved successfully.",
+                                data={"asset_id": asset.pk, "matches": muzzle_matches(matches)})
+
+
+class MuzzleSearchAPIView(APIView):
+    """POST a muzzle vector (or a batch) and get the most similar registered assets by cosine similarity."""
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = MuzzleSearchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return validation_error_from_serializer(serializer)
+
+        data = serializer.validated_data
+        exclude = [data['exclude_asset']] if data.get('exclude_asset') else None
+        try:
+            results = get_muzzle_index().search(data.get('vectors') or data['vector'], k=data['k'],
+                                                exclude_asset_ids=exclude)
+        except (OSError, MuzzleIndexError) as e:
+            return error_response(f"Muzzle search failed: {str(e)}", status_code=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        results = [muzzle_matches(matches, data.get('min_score')) for matches in results]
+        return success_response("Muzzle search completed successfully.",
+                                data={"results": results} if 'vectors' in data else {"matches": results[0]})
@@ -6,6 +6,7 @@ admin.site.register(User)
 admin.site.register(TempUser)
 admin.site.register(OTPLimit)
 admin.site.register(OTPRequestLog)
+admin.site.register(OTPOutbox)
 admin.site.register(OTPVerification)
 admin.site.register(UserLocation)
 admin.site.register(UserPersonalInfo)
@@ -0,0 +1,53 @@
+"""
+Helpers for the UserHierarchy closure table over User.managed_by.
+
+They take the model classes as arguments so the migration that creates the table
+can run them with historical models.
+"""
+
+
+def closure_paths(parents):
+    """
+    Map every user in ``parents`` ({user_id: managed_by_id}) to its path up the tree,
+    (user_id, manager_id, ..., root_id). Returns (paths, cycles); users caught in a
+    managed_by cycle are treated as roots and listed in ``cycles``.
+    """
+    paths, cycles = {}, []
+    for user_id in parents:
+        if user_id in paths:
+            continue
+        # Walk up until we reach a user whose path is known, a root, or a cycle
+        chain, seen, node = [], set(), user_id
+        while node is not None and node not in paths and node not in seen:
+            seen.add(node)
+            chain.append(node)
+            node = parents.get(node)
+        if node is not None and node not in paths:
+            loop_start = chain.index(node)
+            cycles.append(chain[loop_start:])
+            for looped in chain[loop_start:]:
+                paths[looped] = (looped,)
+            chain = chain[:loop_start]
+        path = paths[node] if node is not None else ()
+        for descendant in reversed(chain):
+            path = (descendant,) + path
+            paths[descendant] = path
+    return paths, cycles
+
+
+def rebuild_user_hierarchy(User, UserHierarchy, batch_size=5000):
+    """Recreate every UserHierarchy row from User.managed_by. Returns (rows written, cycles)."""
+    parents = dict(User.objects.values_list('id', 'managed_by_id').iterator(chunk_size=batch_size))
+    paths, cycles = closure_paths(parents)
+
+    UserHierarchy.objects.all().delete()
+    batch, written = [], 0
+    for user_id, path in paths.items():
+        for depth, ancestor_id in enumerate(path):
+            batch.append(UserHierarchy(ancestor_id=ancestor_id, descendant_id=user_id, depth=depth))
+        if len(batch) >= batch_size:
+            UserHierarchy.objects.bulk_create(batch)
+            written += len(batch)
+            batch = []
+    UserHierarchy.objects.bulk_create(batch)
+    return written + len(batch), cycles
@@ -0,0 +1,76 @@
+import time
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth import authenticate
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.core.management.base import BaseCommand
+from rest_framework_simplejwt.tokens import AccessToken
+
+from authservice.models import User, Token
+from authservice.serializers import LoginSerializer
+from authservice.tokens import _executor
+
+BENCH_MOBILE = "00000000000"
+BENCH_PASSWORD = "bench-password"
+
+
+def legacy_login(mobile_number, password):
+    """The login flow before the fast path: authenticate(), Token row refresh, lazy role lookup."""
+    user = authenticate(mobile_number=mobile_number, password=password)
+    token_obj, _ = Token.objects.get_or_create(user=user)
+    token_obj.generate_tokens()
+    return {
+        'role': user.role.name if user.role else None,
+        'access_token': token_obj.access_token,
+        'refresh_token': token_obj.refresh_token,
+    }
+
+
+def fast_login(mobile_number, password):
+    serializer = LoginSerializer(data={'mobile_number': mobile_number, 'password': password})
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data
+
+
+class Command(BaseCommand):
+    help = "Measure single-core logins per second for the legacy and fast login paths."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=20)
+        parser.add_argument('--fast-hasher', action='store_true',
+                            help="Use MD5 password hashing to isolate database and token overhead.")
+
+    def handle(self, *args, **options):
+        hashers = ['django.contrib.auth.hashers.MD5PasswordHasher'] if options['fast_hasher'] else None
+        with override_settings(**({'PASSWORD_HASHERS': hashers} if hashers else {})):
+            User.objects.filter(mobile_number=BENCH_MOBILE).delete()
+            user = User.objects.create_user(mobile_number=BENCH_MOBILE, password=BENCH_PASSWORD)
+            try:
+                self.run("legacy", legacy_login, options['logins'])
+                # Stored access tokens expire hourly; this is the login that has to rewrite the Token row
+                Token.objects.filter(user=user).update(access_token='')
+                with mock.patch.object(AccessToken, 'lifetime', timedelta(0)):
+                    self.run("legacy/exp", legacy_login, options['logins'])
+                for store in ('sync', 'off', 'async'):
+                    with override_settings(LOGIN_TOKEN_STORE=store):
+                        self.run(f"fast/{store}", fast_login, options['logins'])
+            finally:
+                user.delete()
+
+    def run(self, name, login, count):
+        login(BENCH_MOBILE, BENCH_PASSWORD)  # warm up
+        with CaptureQueriesContext(connection) as queries:
+            login(BENCH_MOBILE, BENCH_PASSWORD)
+        with override_settings(DEBUG=False):
+            started = time.perf_counter()
+            for _ in range(count):
+                login(BENCH_MOBILE, BENCH_PASSWORD)
+            elapsed = time.perf_counter() - started
+        _executor.submit(lambda: None).result()
+        writes = sum(1 for q in queries.captured_queries if not q['sql'].lstrip().upper().startswith('SELECT'))
+        self.stdout.write(
+            f"{name:>11}: {count / elapsed:,.1f} logins/s per core, "
+            f"{len(queries.captured_queries)} queries ({writes} writes) per login"
+        )
@@ -0,0 +1,84 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from authservice.models import OTPCategory, OTPLimit, OTPRequestLog
+from authservice.ratelimit import DatabaseRateLimiter, MemoryRateLimiter, CacheRateLimiter
+
+
+class VirtualClock:
+    """Advances by 1/rate per tick so a run replays `rate` requests per simulated second."""
+
+    def __init__(self, rate):
+        self.step = 1.0 / rate
+        self.now = time.time()
+
+    def tick(self):
+        self.now += self.step
+
+    def __call__(self):
+        return self.now
+
+
+class Command(BaseCommand):
+    help = "Benchmark the OTP rate limiter backends against synthetic signup/SMS-pumping load."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100000)
+        parser.add_argument('--db-requests', type=int, default=2000,
+                            help="The database backend is slow enough that it gets a smaller run.")
+        parser.add_argument('--rate', type=int, default=10000, help="Simulated requests per second.")
+        parser.add_argument('--numbers', type=int, default=5000, help="Distinct mobile numbers.")
+        parser.add_argument('--attackers', type=int, default=20,
+                            help="Numbers that receive a large share of the traffic.")
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        numbers = [f"017{i:08d}" for i in range(options['numbers'])]
+        attackers = numbers[:options['attackers']]
+        category = OTPCategory.REGISTRATION
+        OTPLimit.get_limits(category)  # warm the limit cache so no backend pays for it
+
+        def workload(count):
+            # Half the traffic hammers a few numbers, the rest is spread like a signup campaign
+            return [rng.choice(attackers) if rng.random() < 0.5 else rng.choice(numbers) for _ in range(count)]
+
+        self.stdout.write(f"Target load: {options['rate']} requests/second")
+
+        clock = VirtualClock(options['rate'])
+        self.report("memory", MemoryRateLimiter(clock=clock), workload(options['requests']), category, clock, options)
+
+        clock = VirtualClock(options['rate'])
+        self.report("cache", CacheRateLimiter(clock=clock, require_shared=False), workload(options['requests']), category, clock, options)
+
+        with transaction.atomic():
+            self.report("database", DatabaseRateLimiter(), workload(options['db_requests']), category, None, options,
+                        record=True)
+            transaction.set_rollback(True)
+
+    def report(self, name, limiter, load, category, clock, options, record=False):
+        latencies = []
+        denied = 0
+        started = time.perf_counter()
+        for mobile_number in load:
+            t0 = time.perf_counter()
+            allowed = limiter.allow(mobile_number, category)
+            if allowed and record:
+                # The database backend counts logged requests, so log like RegisterStep1 does
+                OTPRequestLog.objects.create(mobile_number=mobile_number, otp_code="000000", category=category)
+            latencies.append(time.perf_counter() - t0)
+            denied += not allowed
+            if clock:
+                clock.tick()
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        throughput = len(load) / elapsed
+        self.stdout.write(
+            f"{name:>8}: {len(load)} requests in {elapsed:.2f}s = {throughput:,.0f} req/s "
+            f"(p50 {latencies[len(latencies) // 2] * 1e6:.0f}us, "
+            f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f}us, denied {denied}) "
+            f"{'sustains' if throughput >= options['rate'] else 'cannot sustain'} target"
+        )
@@ -0,0 +1,57 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authservice.models import User
+from authservice.onboarding import import_farmers, parse_rows
+
+
+class Command(BaseCommand):
+    help = "Create farmer accounts in bulk from a CSV or JSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json'], default=None,
+                            help="Defaults to the file extension.")
+        parser.add_argument('--manager', default=None, help="Mobile number of the managing user (role 2).")
+        parser.add_argument('--onboarded-by', default=None, help="Mobile number of the staff user onboarding them.")
+        parser.add_argument('--chunk-size', type=int, default=None)
+        parser.add_argument('--hash-workers', type=int, default=None,
+                            help="Processes used for password hashing; 0 hashes inline.")
+        parser.add_argument('--report', default=None, help="Write the per-row results to this JSON file.")
+
+    def get_user(self, mobile_number, **filters):
+        try:
+            return User.objects.get(mobile_number=mobile_number, **filters)
+        except User.DoesNotExist:
+            raise CommandError(f"User {mobile_number} not found or not allowed.")
+
+    def handle(self, *args, **options):
+        managed_by = self.get_user(options['manager'], role_id=2) if options['manager'] else None
+        onboarded_by = self.get_user(options['onboarded_by'], is_staff=True) if options['onboarded_by'] else None
+
+        file_format = options['format'] or options['path'].rsplit('.', 1)[-1].lower()
+        try:
+            with open(options['path'], 'rb') as f:
+                rows = parse_rows(f.read(), file_format)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {options['path']}: {str(e)}")
+
+        started = time.perf_counter()
+        results = import_farmers(
+            rows,
+            managed_by=managed_by,
+            onboarded_by=onboarded_by,
+            chunk_size=options['chunk_size'],
+            hash_workers=options['hash_workers'],
+        )
+        elapsed = time.perf_counter() - started
+
+        failed = [result for result in results if result['status'] != 'created']
+        for result in failed:
+            self.stderr.write(f"Row {result['row']}: {result['errors']}")
+        if options['report']:
+            with open(options['report'], 'w') as f:
+                json.dump(results, f, indent=2, default=str)
+        self.stdout.write(f"Created {len(results) - len(failed)} of {len(results)} users in {elapsed:.2f}s")
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from authservice.sms import drain_outbox
+
+
+class Command(BaseCommand):
+    help = "Deliver queued OTP messages through the configured SMS gateways."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the outbox once and exit.")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep when the outbox is empty.")
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            sent, failed = drain_outbox(options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f"Sent {sent}, failed {failed} in {time.perf_counter() - started:.2f}s")
+            if options['once']:
+                return
+            close_old_connections()
+            time.sleep(options['interval'])
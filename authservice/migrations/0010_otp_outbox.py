@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authservice', '0009_usernomineeinfo_update_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='otprequestlog',
+            name='delivered_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='otprequestlog',
+            name='delivery_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='ekyc_status',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='OTPOutbox',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('mobile_number', models.CharField(max_length=15)),
+                ('message', models.TextField()),
+                ('provider', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('sending', 'Sending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('claimed_at', models.DateTimeField(blank=True, null=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('provider_message_id', models.CharField(blank=True, max_length=100, null=True)),
+                ('last_error', models.TextField(blank=True, null=True)),
+                ('otp_request', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='authservice.otprequestlog')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='authservice_status_7f46a4_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:25
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Q
+
+
+def backfill_ekyc_flags(apps, schema_editor):
+    User = apps.get_model('authservice', 'User')
+    sections = {
+        'personal_info_complete': (apps.get_model('authservice', 'UserPersonalInfo'),
+                                   ~Q(first_name='') & ~Q(last_name='')),
+        'financial_info_complete': (apps.get_model('authservice', 'UserFinancialInfo'),
+                                    ~Q(bank_name='') & ~Q(account_number='')),
+        'nominee_info_complete': (apps.get_model('authservice', 'UserNomineeInfo'),
+                                  ~Q(nominee_name='') & ~Q(nid='')),
+        'organization_info_complete': (apps.get_model('authservice', 'OrganizationInfo'), ~Q(name='')),
+    }
+    User.objects.update(**{
+        flag: Exists(model.objects.filter(condition, user_id=OuterRef('pk')))
+        for flag, (model, condition) in sections.items()
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authservice', '0010_otp_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='financial_info_complete',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='nominee_info_complete',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='organization_info_complete',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='personal_info_complete',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(backfill_ekyc_flags, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from authservice.hierarchy import rebuild_user_hierarchy
+
+
+def build_user_hierarchy(apps, schema_editor):
+    rebuild_user_hierarchy(apps.get_model('authservice', 'User'), apps.get_model('authservice', 'UserHierarchy'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('authservice', '0012_user_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserHierarchy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('depth', models.PositiveIntegerField()),
+                ('ancestor', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='descendant_links', to=settings.AUTH_USER_MODEL)),
+                ('descendant', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ancestor_links', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ancestor', 'depth', 'descendant'], name='user_hier_ancestor_idx')],
+                'constraints': [models.UniqueConstraint(fields=('descendant', 'ancestor'), name='user_hierarchy_unique_pair')],
+            },
+        ),
+        migrations.RunPython(build_user_hierarchy, migrations.RunPython.noop),
+    ]
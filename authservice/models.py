@@ -1,14 +1,20 @@
+from collections import defaultdict
 from datetime import timedelta
 
+from django.core.cache import cache
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, OuterRef, Q, Value, When
+from django.db.models.functions import Cast, Coalesce
 from django.utils.timezone import now
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken, TokenError
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db.models.signals import post_save, post_delete, pre_save
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete
 from django.dispatch import receiver
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from Insurecow.authentication import user_cache
+from Insurecow.cache import bounded_timeout
 from insuranceservice.models import InsuranceCompany
 
 
@@ -85,20 +91,53 @@ class User(AbstractBaseUser, PermissionsMixin):
     is_staff = models.BooleanField(default=False)
     date_joined = models.DateTimeField(auto_now_add=True)
     ekyc_status = models.IntegerField(default=0)
+    # Per-section eKYC completeness, maintained by the profile models' post_save/post_delete hooks
+    personal_info_complete = models.BooleanField(default=False)
+    financial_info_complete = models.BooleanField(default=False)
+    nominee_info_complete = models.BooleanField(default=False)
+    organization_info_complete = models.BooleanField(default=False)
 
     objects = UserManager()
 
     USERNAME_FIELD = "mobile_number"
     REQUIRED_FIELDS = []
 
+    EKYC_FIELDS = ('personal_info_complete', 'financial_info_complete', 'nominee_info_complete',
+                   'organization_info_complete', 'ekyc_status')
+    # Fields whose change requires full_clean() / an eKYC recalculation on save
+    CLEAN_DEPENDENCIES = {'mobile_number', 'role_id', 'managed_by_id', 'onboarded_by_id', 'is_superuser'}
+    EKYC_DEPENDENCIES = {'role_id', 'is_superuser'}
+
     def __str__(self):
         return self.mobile_number
 
     class Meta:
         indexes = [
             models.Index(fields=["mobile_number"]),
+            # Admin user list: keyset ordering, alone and behind each equality filter.
+            # Mobile number prefixes use the unique index (plus its _like index on PostgreSQL).
+            models.Index(fields=["-date_joined", "id"], name="user_joined_id_idx"),
+            models.Index(fields=["role", "-date_joined"], name="user_role_joined_idx"),
+            models.Index(fields=["ekyc_status", "-date_joined"], name="user_ekyc_joined_idx"),
+            models.Index(fields=["is_active", "-date_joined"], name="user_active_joined_idx"),
+            models.Index(fields=["managed_by", "-date_joined"], name="user_manager_joined_idx"),
         ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = {
+            name: getattr(instance, name) for name in cls.CLEAN_DEPENDENCIES if name in instance.__dict__
+        }
+        return instance
+
+    def changed_dependencies(self):
+        """Attnames from CLEAN_DEPENDENCIES that differ from the loaded row (all of them for unsaved users)."""
+        loaded = getattr(self, '_loaded_values', None)
+        if self._state.adding or loaded is None:
+            return set(self.CLEAN_DEPENDENCIES)
+        return {name for name in self.CLEAN_DEPENDENCIES if name not in loaded or loaded[name] != getattr(self, name)}
+
     def clean(self):
         if self.is_superuser:
             return  # Skip validation for superusers
@@ -106,60 +145,232 @@ class User(AbstractBaseUser, PermissionsMixin):
         if self.managed_by and self.managed_by.role_id != 2:
             raise ValidationError("The manager must have role_id = 2.")
 
+        if self.pk and self.managed_by_id and UserHierarchy.objects.filter(
+                ancestor_id=self.pk, descendant_id=self.managed_by_id).exists():
+            raise ValidationError("A user cannot be managed by one of their own sub-users.")
+
         if self.onboarded_by and not (self.onboarded_by.is_staff or self.onboarded_by.is_superuser):
             raise ValidationError("Onboarded_by must be a staff or superuser.")
 
     def calculate_ekyc_status(self):
-        """Calculate the eKYC completion status based on user role."""
+        """Calculate the eKYC completion status from the per-section flags."""
         # Skip calculation for superusers
         if self.is_superuser:
             self.ekyc_status = 100
             return
 
-        # Determine the required models based on the user role
-        related_models = [
-            hasattr(self, 'personal_info') and bool(self.personal_info.first_name) and bool(
-                self.personal_info.last_name),
-            hasattr(self, 'financial_info') and bool(self.financial_info.bank_name) and bool(
-                self.financial_info.account_number),
-            hasattr(self, 'nominee_info') and bool(self.nominee_info.nominee_name) and bool(self.nominee_info.nid),
-        ]
+        related_models = [self.personal_info_complete, self.financial_info_complete, self.nominee_info_complete]
 
         # If the user role is 2 or 3 (organization or business), include OrganizationInfo
         if self.role_id in [2, 3]:
-            related_models.append(
-                hasattr(self, 'organization_info') and bool(self.organization_info.name)
-            )
+            related_models.append(self.organization_info_complete)
 
         # Calculate the completion percentage
         completed_count = sum(1 for x in related_models if x)  # Count only True values
         total_count = len(related_models)
         self.ekyc_status = int((completed_count / total_count) * 100)
 
+    @classmethod
+    def ekyc_status_expression(cls, **flags):
+        """SQL equivalent of calculate_ekyc_status, with ``flags`` overriding the stored section flags."""
+        def flag(name):
+            if name in flags:
+                return Value(int(flags[name]))
+            return Cast(F(name), models.IntegerField())
+
+        is_organization = Q(role_id__in=[2, 3])
+        completed = (
+            flag('personal_info_complete') + flag('financial_info_complete') + flag('nominee_info_complete') +
+            Case(When(is_organization, then=flag('organization_info_complete')), default=Value(0))
+        )
+        total = Case(When(is_organization, then=Value(4)), default=Value(3))
+        return Case(
+            When(is_superuser=True, then=Value(100)),
+            default=completed * Value(100) / total,
+            output_field=models.IntegerField(),
+        )
+
+    def set_profile_data(self, **sections):
+        """
+        Attach personal/financial/nominee/organization info for an unsaved user. provision_users()
+        writes the sections along with the user, and the eKYC flags are set up front to match.
+        """
+        self._profile_data = sections
+        for related_name, data in sections.items():
+            model = PROFILE_MODELS[related_name]
+            setattr(self, model.EKYC_FLAG, bool(data) and model(**data).is_ekyc_complete())
+
     def save(self, *args, **kwargs):
-        self.full_clean()
-        self.calculate_ekyc_status()# triggers clean()
+        cached_values = self.__dict__.pop('_cached_values', None)
+        if kwargs.get('update_fields') is not None or self._state.adding:
+            cached_values = None
+        changed = self.changed_dependencies()
+        if changed:
+            self.full_clean()  # triggers clean()
+        if changed & self.EKYC_DEPENDENCIES:
+            if not self._state.adding:
+                # Pick up flags written by the profile hooks since this instance was loaded
+                self.refresh_from_db(fields=self.EKYC_FIELDS[:-1])
+            self.calculate_ekyc_status()
+        elif kwargs.get('update_fields') is None and not self._state.adding:
+            # The eKYC fields are maintained by the profile hooks; don't overwrite them with stale values
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.EKYC_FIELDS
+            ]
+        if cached_values is not None:
+            # request.user from the authentication cache may be AUTH_USER_CACHE_TTL seconds old:
+            # write only what changed since, not the whole snapshot over newer writes
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and getattr(self, field.attname) != cached_values[field.attname]
+            ]
         super().save(*args, **kwargs)
+        self._loaded_values = {name: getattr(self, name) for name in self.CLEAN_DEPENDENCIES}
+
+    def get_descendants(self, max_depth=None, include_self=False):
+        """Users below this one in the managed_by tree, optionally limited to ``max_depth`` levels."""
+        filters = {'ancestor_links__ancestor_id': self.pk, 'ancestor_links__depth__gte': 0 if include_self else 1}
+        if max_depth is not None:
+            filters['ancestor_links__depth__lte'] = max_depth
+        return User.objects.filter(**filters)
+
+    def get_ancestors(self):
+        """This user's managers, nearest first."""
+        return User.objects.filter(
+            descendant_links__descendant_id=self.pk, descendant_links__depth__gt=0
+        ).order_by('descendant_links__depth')
+
+    def descendant_counts(self):
+        """{depth: number of users} for this user's subtree."""
+        return dict(
+            UserHierarchy.objects.filter(ancestor_id=self.pk, depth__gt=0)
+            .values_list('depth').annotate(count=models.Count('id')).order_by('depth')
+        )
+
+    @classmethod
+    def subtree_size_expression(cls):
+        """Annotation with the number of users below each user, e.g. ``.annotate(sub_user_count=...)``."""
+        return Coalesce(models.Subquery(
+            UserHierarchy.objects.filter(ancestor_id=OuterRef('pk'), depth__gt=0)
+            .values('ancestor_id').annotate(count=models.Count('id')).values('count'),
+            output_field=models.IntegerField(),
+        ), 0)
+
+
+class UserHierarchy(models.Model):
+    """
+    Closure table over User.managed_by: one row per (ancestor, descendant) pair, plus each
+    user paired with itself at depth 0. Kept in step by provision_users() and the User
+    signals below; ``manage.py rebuild_user_hierarchy`` recreates it from scratch.
+    """
+    # The unique constraint and index below cover lookups on either column
+    ancestor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='descendant_links', db_index=False)
+    descendant = models.ForeignKey(User, on_delete=models.CASCADE, related_name='ancestor_links', db_index=False)
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['descendant', 'ancestor'], name='user_hierarchy_unique_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['ancestor', 'depth', 'descendant'], name='user_hier_ancestor_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ancestor_id} -> {self.descendant_id} ({self.depth})"
+
+    @classmethod
+    def link_new_users(cls, users):
+        """Add the rows for freshly inserted users, which cannot have sub-users yet."""
+        parent_ids = {user.managed_by_id for user in users if user.managed_by_id}
+        ancestors = defaultdict(list)
+        for ancestor_id, descendant_id, depth in cls.objects.filter(descendant_id__in=parent_ids).values_list(
+                'ancestor_id', 'descendant_id', 'depth'):
+            ancestors[descendant_id].append((ancestor_id, depth))
+
+        rows = []
+        for user in users:
+            rows.append(cls(ancestor_id=user.pk, descendant_id=user.pk, depth=0))
+            rows.extend(cls(ancestor_id=ancestor_id, descendant_id=user.pk, depth=depth + 1)
+                        for ancestor_id, depth in ancestors.get(user.managed_by_id, ()))
+        cls.objects.bulk_create(rows, ignore_conflicts=True)
+
+    @classmethod
+    def detach_subtree(cls, user_id):
+        """Drop the links between a user's subtree and everyone above the user."""
+        cls.objects.filter(
+            descendant_id__in=cls.objects.filter(ancestor_id=user_id).values('descendant_id'),
+            ancestor_id__in=cls.objects.filter(descendant_id=user_id, depth__gt=0).values('ancestor_id'),
+        ).delete()
+
+    @classmethod
+    def move_subtree(cls, user_id, parent_id):
+        """Re-hang a user, with everyone below them, under ``parent_id`` (None makes them a root)."""
+        with transaction.atomic():
+            cls.detach_subtree(user_id)
+            if parent_id is None:
+                return
+            subtree = list(cls.objects.filter(ancestor_id=user_id).values_list('descendant_id', 'depth'))
+            if not subtree:
+                subtree = [(user_id, 0)]
+                cls.objects.create(ancestor_id=user_id, descendant_id=user_id, depth=0)
+            ancestors = list(cls.objects.filter(descendant_id=parent_id).values_list('ancestor_id', 'depth'))
+            cls.objects.bulk_create([
+                cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=up + down + 1)
+                for ancestor_id, up in ancestors
+                for descendant_id, down in subtree
+            ])
+
 
 class OTPCategory(models.TextChoices):
     REGISTRATION = "registration", "Registration"
     PASSWORD_RESET = "password_reset", "Password Reset"
     LOGIN = "login", "Login"
 
+class OTPDeliveryStatus(models.TextChoices):
+    PENDING = "pending", "Pending"
+    SENDING = "sending", "Sending"
+    SENT = "sent", "Sent"
+    FAILED = "failed", "Failed"
+
 class OTPLimit(TimestampModel):
     category = models.CharField(max_length=20, choices=OTPCategory.choices, unique=True)
     max_attempts = models.PositiveIntegerField(default=5)
     time_window = models.PositiveIntegerField(default=10)
 
+    DEFAULT_MAX_ATTEMPTS = 5
+    DEFAULT_TIME_WINDOW = 5  # in minutes
+    CACHE_KEY = 'otp_limit:{}'
+
     def __str__(self):
         return f"{self.category} - {self.max_attempts} OTPs in {self.time_window} minutes"
 
+    @classmethod
+    def get_limits(cls, category):
+        """
+        Return (max_attempts, time_window_minutes) for a category, cached until the limit changes.
+        With a per-process cache, other workers see an edit within PROCESS_LOCAL_TIMEOUT.
+        """
+        key = cls.CACHE_KEY.format(category)
+        limits = cache.get(key)
+        if limits is None:
+            try:
+                otp_limit = cls.objects.get(category=category)
+                limits = (otp_limit.max_attempts, otp_limit.time_window)
+            except cls.DoesNotExist:
+                limits = (cls.DEFAULT_MAX_ATTEMPTS, cls.DEFAULT_TIME_WINDOW)
+            cache.set(key, limits, timeout=bounded_timeout(cache, None))
+        return limits
+
 class OTPRequestLog(TimestampModel):
     mobile_number = models.CharField(max_length=15)
     otp_code = models.CharField(max_length=6)
     category = models.CharField(max_length=20, choices=OTPCategory.choices)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(null=True, blank=True)
+    delivery_status = models.CharField(max_length=10, choices=OTPDeliveryStatus.choices, default=OTPDeliveryStatus.PENDING)
+    delivered_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.mobile_number} - {self.otp_code} ({self.category}) @ {self.created_at}"
@@ -173,25 +384,40 @@ class OTPRequestLog(TimestampModel):
 
     @classmethod
     def request_limit_exceeded(cls, mobile_number, category):
-        default_max_attempts = 5
-        default_time_window = 5  # in minutes
-
-        try:
-            otp_limit = OTPLimit.objects.get(category=category)
-            max_attempts = otp_limit.max_attempts
-            time_window = otp_limit.time_window
-        except OTPLimit.DoesNotExist:
-            max_attempts = default_max_attempts
-            time_window = default_time_window
+        # Counts (and records) the attempt in the configured limiter; see authservice.ratelimit
+        from .ratelimit import get_otp_rate_limiter
+        return not get_otp_rate_limiter().allow(mobile_number, category)
 
+    @classmethod
+    def recent_request_count(cls, mobile_number, category, time_window):
         time_threshold = now() - timedelta(minutes=time_window)
-        recent_requests = cls.objects.filter(
+        return cls.objects.filter(
             mobile_number=mobile_number,
             category=category,
             created_at__gte=time_threshold
         ).count()
 
-        return recent_requests >= max_attempts
+class OTPOutbox(TimestampModel):
+    """OTP messages waiting to be handed to an SMS gateway by the run_otp_outbox worker."""
+    otp_request = models.ForeignKey(OTPRequestLog, on_delete=models.CASCADE, null=True, blank=True, related_name="outbox")
+    mobile_number = models.CharField(max_length=15)
+    message = models.TextField()
+    provider = models.CharField(max_length=50)
+    status = models.CharField(max_length=10, choices=OTPDeliveryStatus.choices, default=OTPDeliveryStatus.PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=now)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    provider_message_id = models.CharField(max_length=100, null=True, blank=True)
+    last_error = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return f"OTP to {self.mobile_number} via {self.provider} ({self.status})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "next_attempt_at"]),
+        ]
 
 class OTPVerification(TimestampModel):
     otp = models.ForeignKey(OTPRequestLog, on_delete=models.CASCADE)
@@ -236,9 +462,14 @@ class UserPersonalInfo(TimestampModel):
 
     tin = models.CharField("TIN", max_length=50, null=True, blank=True)
 
+    EKYC_FLAG = 'personal_info_complete'
+
     def __str__(self):
         return f"Profile of {self.user.mobile_number}"
 
+    def is_ekyc_complete(self):
+        return bool(self.first_name) and bool(self.last_name)
+
 class OrganizationInfo(TimestampModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="organization_info")
     logo = models.ImageField(null=True, blank=True)
@@ -248,9 +479,14 @@ class OrganizationInfo(TimestampModel):
     bin = models.CharField("BIN", max_length=50, null=True, blank=True)
     update_count = models.PositiveIntegerField(default=0)
 
+    EKYC_FLAG = 'organization_info_complete'
+
     def __str__(self):
         return f"Profile of {self.user.mobile_number}"
 
+    def is_ekyc_complete(self):
+        return bool(self.name)
+
 class UserFinancialInfo(TimestampModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="financial_info")
     bank_name = models.CharField(max_length=100)
@@ -259,9 +495,14 @@ class UserFinancialInfo(TimestampModel):
     account_number = models.CharField(max_length=50)
     update_count = models.PositiveIntegerField(default=0)
 
+    EKYC_FLAG = 'financial_info_complete'
+
     def __str__(self):
         return f"Financial Info for {self.user.mobile_number}"
 
+    def is_ekyc_complete(self):
+        return bool(self.bank_name) and bool(self.account_number)
+
 class UserNomineeInfo(TimestampModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="nominee_info")
     nominee_name = models.CharField(max_length=100)
@@ -270,9 +511,14 @@ class UserNomineeInfo(TimestampModel):
     nid = models.CharField(max_length=50)
     update_count = models.PositiveIntegerField(default=0)
 
+    EKYC_FLAG = 'nominee_info_complete'
+
     def __str__(self):
         return f"Nominee Info for {self.user.mobile_number}"
 
+    def is_ekyc_complete(self):
+        return bool(self.nominee_name) and bool(self.nid)
+
 class Token(TimestampModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name="token")
     access_token = models.TextField()
@@ -296,37 +542,96 @@ class Token(TimestampModel):
         return f"Token for {self.user.mobile_number}"
 
 
-@receiver(post_save, sender=User)
-def create_user_token(sender, instance, created, **kwargs):
-    if created:
-        token, token_created = Token.objects.get_or_create(user=instance)
-        if token_created or not token.access_token or not token.refresh_token or not token.is_token_valid():
-            token.generate_tokens()
-            print(f"Tokens generated for {instance.mobile_number}")
+# Profile sections created for every new user, keyed by their related_name on User
+PROFILE_MODELS = {
+    'personal_info': UserPersonalInfo,
+    'financial_info': UserFinancialInfo,
+    'nominee_info': UserNomineeInfo,
+    'organization_info': OrganizationInfo,
+}
+
+
+def provision_users(users):
+    """
+    Create the Token and profile rows for freshly inserted users in one transaction,
+    with one bulk INSERT per table. Newly created users cannot have any of these rows
+    yet, so nothing is looked up first. The created objects are cached on each user.
+
+    Profile sections attached with User.set_profile_data() are written with their data.
+    """
+    users = [user for user in users if user.pk is not None]
+    if not users:
+        return
+
+    tokens, personal, financial, nominee, organizations, companies = [], [], [], [], [], []
+    for user in users:
+        data = getattr(user, '_profile_data', None) or {}
+        refresh = RefreshToken.for_user(user)
+        tokens.append(Token(user=user, access_token=str(refresh.access_token), refresh_token=str(refresh)))
+        personal.append(UserPersonalInfo(user=user, **data.get('personal_info', {})))
+        financial.append(UserFinancialInfo(user=user, **data.get('financial_info', {})))
+        nominee.append(UserNomineeInfo(user=user, **data.get('nominee_info', {})))
+        if user.role_id in (2, 3):
+            organization = OrganizationInfo(user=user, **data.get('organization_info', {}))
+            organizations.append(organization)
+        if user.role_id == 3:
+            companies.append(InsuranceCompany(user=user, name=organization.name, logo=organization.logo.name))
+        user._profile_data = None
+
+    with transaction.atomic():
+        UserHierarchy.link_new_users(users)
+        for model, objs in ((Token, tokens), (UserPersonalInfo, personal), (UserFinancialInfo, financial),
+                            (UserNomineeInfo, nominee), (OrganizationInfo, organizations),
+                            (InsuranceCompany, companies)):
+            if objs:
+                model.objects.bulk_create(objs)
+        if companies:
+            # bulk_create sends no post_save, so the catalog receiver would not see the new companies
+            from insuranceservice.catalog import invalidate_catalog
+            transaction.on_commit(invalidate_catalog)
+
+    # Cache what exists (and what does not) so later accesses do not query for it
+    related_names = ('token', 'personal_info', 'financial_info', 'nominee_info', 'organization_info', 'insurance_company')
+    for user in users:
+        for related_name in related_names:
+            user._state.fields_cache[related_name] = None
+    for objs, related_name in zip((tokens, personal, financial, nominee, organizations, companies), related_names):
+        for obj in objs:
+            obj.user._state.fields_cache[related_name] = obj
+
+    if len(users) == 1:
+        print(f"Tokens and profiles created for {users[0].mobile_number}")
+    else:
+        print(f"Tokens and profiles created for {len(users)} users")
+
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
-        # Safely create related profiles only if they don't already exist
-        if not hasattr(instance, 'personal_info'):
-            UserPersonalInfo.objects.create(user=instance)
-
-        if not hasattr(instance, 'financial_info'):
-            UserFinancialInfo.objects.create(user=instance)
+        provision_users([instance])
 
-        if not hasattr(instance, 'nominee_info'):
-            UserNomineeInfo.objects.create(user=instance)
 
-        print(f"User profile created for {instance.mobile_number}")
-
-        if instance.role_id in (2, 3):
-            if not hasattr(instance, 'organization_info'):
-                OrganizationInfo.objects.create(user=instance)
-                print(f"Organization profile created for {instance.mobile_number}")
-
-        if instance.role_id == 3:
-            if not hasattr(instance, 'insurance_company'):
-                InsuranceCompany.objects.create(user=instance)
+@receiver(post_save, sender=User)
+def update_user_hierarchy(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return  # Linked by provision_users()
+    if update_fields is not None and 'managed_by' not in update_fields:
+        return
+
+    loaded = getattr(instance, '_loaded_values', None)
+    if loaded is not None and 'managed_by_id' in loaded:
+        # save() refreshes _loaded_values only after post_save, so this is still the old value
+        previous = loaded['managed_by_id']
+    else:
+        previous = UserHierarchy.objects.filter(descendant_id=instance.pk, depth=1).values_list(
+            'ancestor_id', flat=True).first()
+    if previous != instance.managed_by_id:
+        UserHierarchy.move_subtree(instance.pk, instance.managed_by_id)
+
+@receiver(pre_delete, sender=User)
+def detach_user_hierarchy(sender, instance, **kwargs):
+    # Sub-users become roots (managed_by is SET_NULL); their own links cascade with the user
+    UserHierarchy.detach_subtree(instance.pk)
 
 
 @receiver(post_save, sender=OrganizationInfo)
@@ -338,4 +643,59 @@ def update_insurance_company(sender, instance, created, **kwargs):
         insurance_company.save()
         print(f"Insurance company updated for user {instance.user.mobile_number}")
     except InsuranceCompany.DoesNotExist:
-        print(f"No InsuranceCompany found for user {instance.user.mobile_number}")
\ No newline at end of file
+        print(f"No InsuranceCompany found for user {instance.user.mobile_number}")
+
+
+@receiver(post_save, sender=OTPLimit)
+@receiver(post_delete, sender=OTPLimit)
+def clear_otp_limit_cache(sender, instance, **kwargs):
+    # The category itself may have been edited, so drop every cached limit
+    cache.delete_many([OTPLimit.CACHE_KEY.format(category) for category in OTPCategory.values])
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def clear_cached_auth_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+    # Again after commit, in case a concurrent request re-cached the pre-commit row
+    transaction.on_commit(lambda: user_cache.invalidate(instance.pk))
+
+@receiver(post_save, sender=Role)
+@receiver(post_delete, sender=Role)
+def clear_cached_auth_users(sender, instance, **kwargs):
+    user_cache.clear()
+    transaction.on_commit(user_cache.clear)
+
+
+def set_ekyc_flag(profile, complete):
+    flag = profile.EKYC_FLAG
+    User.objects.filter(pk=profile.user_id).update(**{
+        flag: complete,
+        'ekyc_status': User.ekyc_status_expression(**{flag: complete}),
+    })
+    # update() sends no post_save, so drop the cached request.user here
+    user_cache.invalidate(profile.user_id)
+    transaction.on_commit(lambda: user_cache.invalidate(profile.user_id))
+
+    # Keep an already-loaded user in step so a later user.save() does not fall behind
+    user = profile._state.fields_cache.get('user')
+    if user is not None:
+        setattr(user, flag, complete)
+        user.calculate_ekyc_status()
+
+@receiver(post_save, sender=UserPersonalInfo)
+@receiver(post_save, sender=UserFinancialInfo)
+@receiver(post_save, sender=UserNomineeInfo)
+@receiver(post_save, sender=OrganizationInfo)
+def update_ekyc_flag(sender, instance, created, **kwargs):
+    complete = instance.is_ekyc_complete()
+    if created and not complete:
+        return  # A fresh, incomplete section leaves the flag at its default
+    set_ekyc_flag(instance, complete)
+
+@receiver(post_delete, sender=UserPersonalInfo)
+@receiver(post_delete, sender=UserFinancialInfo)
+@receiver(post_delete, sender=UserNomineeInfo)
+@receiver(post_delete, sender=OrganizationInfo)
+def clear_ekyc_flag(sender, instance, **kwargs):
+    set_ekyc_flag(instance, False)
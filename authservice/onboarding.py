@@ -0,0 +1,198 @@
+import csv
+import io
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+
+from .models import TempUser, User, provision_users
+from .serializers import FarmerImportRowSerializer
+
+DEFAULT_ONBOARDING_SETTINGS = {
+    'MAX_ROWS': 5000,  # per API request; the onboard_farmers command is not capped
+    'CHUNK_SIZE': 500,
+    'HASH_WORKERS': None,  # None = one per CPU, 0 = hash in the calling process
+    'MIN_POOL_ROWS': 8,  # smaller imports are hashed inline; starting the pool costs more
+}
+
+FARMER_ROLE_ID = 1
+PROFILE_SECTIONS = ('personal_info', 'financial_info', 'nominee_info')
+
+
+def get_onboarding_setting(name):
+    return getattr(settings, 'ONBOARDING', {}).get(name, DEFAULT_ONBOARDING_SETTINGS[name])
+
+
+def parse_rows(content, file_format):
+    """
+    Parse an import file into a list of row dicts.
+
+    JSON is a list of objects (or {"users": [...]}) with nested personal_info, financial_info
+    and nominee_info objects. CSV uses dotted headers for the nested fields, e.g.
+    ``personal_info.first_name``; empty cells are left out.
+    """
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+
+    if file_format == 'json':
+        rows = json.loads(content)
+        if isinstance(rows, dict):
+            rows = rows.get('users', [])
+        if not isinstance(rows, list):
+            raise ValueError("Expected a list of users.")
+        return rows
+
+    if file_format == 'csv':
+        rows = []
+        for record in csv.DictReader(io.StringIO(content)):
+            row = {}
+            for column, value in record.items():
+                if column is None or value is None or value.strip() == '':
+                    continue
+                section, _, field = column.strip().partition('.')
+                if field:
+                    row.setdefault(section, {})[field] = value.strip()
+                else:
+                    row[section] = value.strip()
+            rows.append(row)
+        return rows
+
+    raise ValueError(f"Unsupported format: {file_format}")
+
+
+_hash_pools = {}
+_hash_pools_lock = threading.Lock()
+
+
+def get_hash_pool(workers):
+    """A long-lived pool per size, started once per process rather than once per import."""
+    pool = _hash_pools.get(workers)
+    if pool is None:
+        with _hash_pools_lock:
+            pool = _hash_pools.get(workers)
+            if pool is None:
+                # spawn, not fork: a forked worker would inherit the audit and token threads' locks
+                # and the parent's database connections. A spawned worker imports nothing of this
+                # module (which needs the app registry), only django.setup and make_password.
+                pool = _hash_pools[workers] = ProcessPoolExecutor(
+                    max_workers=workers, initializer=django.setup,
+                    mp_context=multiprocessing.get_context('spawn'),
+                )
+    return pool
+
+
+def hash_passwords(passwords, workers=None):
+    """make_password() for every entry, spread over a process pool for larger batches."""
+    workers = get_onboarding_setting('HASH_WORKERS') if workers is None else workers
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or len(passwords) < get_onboarding_setting('MIN_POOL_ROWS'):
+        return [make_password(password) for password in passwords]
+
+    pool = get_hash_pool(workers)
+    return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def validate_rows(rows, context=None):
+    """
+    Validate every row and return (valid, errors).
+
+    valid is a list of (row index, validated data); errors maps row index to an error dict.
+    Field validation runs per row without touching the database; mobile number clashes,
+    within the file and with existing users, are then checked for all rows at once.
+    """
+    valid, errors = [], {}
+    for index, row in enumerate(rows):
+        serializer = FarmerImportRowSerializer(data=row, context=context or {})
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            errors[index] = serializer.errors
+
+    first_row = {}
+    for index, data in valid:
+        first_row.setdefault(data['mobile_number'], index)
+    mobile_numbers = list(first_row)
+    taken = set(User.objects.filter(mobile_number__in=mobile_numbers).values_list('mobile_number', flat=True))
+    taken.update(TempUser.objects.filter(mobile_number__in=mobile_numbers, is_verified=True)
+                 .values_list('mobile_number', flat=True))
+
+    checked = []
+    for index, data in valid:
+        mobile_number = data['mobile_number']
+        if mobile_number in taken:
+            errors[index] = {'mobile_number': ["User already exists."]}
+        elif first_row[mobile_number] != index:
+            errors[index] = {'mobile_number': [f"Duplicate of row {first_row[mobile_number] + 1}."]}
+        else:
+            checked.append((index, data))
+    return checked, errors
+
+
+def build_user(data, managed_by=None, onboarded_by=None):
+    user = User(
+        mobile_number=data['mobile_number'],
+        role_id=FARMER_ROLE_ID,
+        managed_by=managed_by,
+        onboarded_by=onboarded_by,
+    )
+    user.set_profile_data(**{section: dict(data[section]) for section in PROFILE_SECTIONS if section in data})
+    user.calculate_ekyc_status()
+    return user
+
+
+def _insert_chunk(users):
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        provision_users(users)
+
+
+def import_farmers(rows, managed_by=None, onboarded_by=None, chunk_size=None, hash_workers=None, context=None):
+    """
+    Create farmer accounts for every valid row. Rows are inserted with bulk_create in chunks,
+    each chunk in its own transaction; a failing chunk is retried row by row so one bad
+    row does not take the others down.
+
+    Returns a list with one {"row", "status", "user_id" | "errors"} entry per input row.
+    """
+    chunk_size = chunk_size or get_onboarding_setting('CHUNK_SIZE')
+    valid, errors = validate_rows(rows, context=context)
+
+    hashed = hash_passwords([data['password'] for _, data in valid], workers=hash_workers)
+    pending = []
+    for (index, data), password in zip(valid, hashed):
+        user = build_user(data, managed_by=managed_by, onboarded_by=onboarded_by)
+        user.password = password
+        pending.append((index, user, data))
+
+    created = {}
+    for start in range(0, len(pending), chunk_size):
+        chunk = pending[start:start + chunk_size]
+        try:
+            _insert_chunk([user for _, user, _ in chunk])
+            created.update((index, user.pk) for index, user, _ in chunk)
+        except IntegrityError as e:
+            print(f"Error while importing rows {chunk[0][0] + 1}-{chunk[-1][0] + 1}, retrying one by one: {str(e)}")
+            for index, user, data in chunk:
+                # The failed bulk insert may have left state on the instances; start over
+                retry = build_user(data, managed_by=managed_by, onboarded_by=onboarded_by)
+                retry.password = user.password
+                try:
+                    _insert_chunk([retry])
+                    created[index] = retry.pk
+                except IntegrityError as e:
+                    errors[index] = {'detail': [f"Database integrity error: {str(e)}"]}
+
+    results = []
+    for index in range(len(rows)):
+        if index in created:
+            results.append({'row': index + 1, 'status': 'created', 'user_id': created[index]})
+        else:
+            results.append({'row': index + 1, 'status': 'failed', 'errors': errors.get(index, {})})
+    return results
@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from Insurecow.cache import is_shared_cache
+
+from .models import OTPLimit, OTPRequestLog
+
+DEFAULT_OTP_RATE_LIMIT = {
+    'BACKEND': 'authservice.ratelimit.CacheRateLimiter',
+    'CACHE_ALIAS': 'default',
+    'BUCKETS': 10,
+}
+
+
+def get_otp_rate_limit_setting(name):
+    return getattr(settings, 'OTP_RATE_LIMIT', {}).get(name, DEFAULT_OTP_RATE_LIMIT[name])
+
+
+class DatabaseRateLimiter:
+    """COUNT(*) over OTPRequestLog, the original behaviour. Used as the fallback."""
+
+    def allow(self, mobile_number, category):
+        max_attempts, time_window = OTPLimit.get_limits(category)
+        return OTPRequestLog.recent_request_count(mobile_number, category, time_window) < max_attempts
+
+
+class MemoryRateLimiter:
+    """Exact sliding-window log per (category, mobile number), local to one process."""
+
+    SWEEP_EVERY = 10000
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._hits = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def allow(self, mobile_number, category):
+        max_attempts, time_window = OTPLimit.get_limits(category)
+        window = time_window * 60
+        current = self.clock()
+        key = (category, mobile_number)
+
+        with self._lock:
+            self._calls += 1
+            if self._calls % self.SWEEP_EVERY == 0:
+                self._sweep(current, window)
+
+            hits = self._hits.setdefault(key, deque())
+            while hits and hits[0] <= current - window:
+                hits.popleft()
+            if len(hits) >= max_attempts:
+                return False
+            hits.append(current)
+            return True
+
+    def _sweep(self, current, window):
+        for key in [key for key, hits in self._hits.items() if not hits or hits[-1] <= current - window]:
+            del self._hits[key]
+
+
+class CacheRateLimiter:
+    """
+    Sliding-window counter kept in a shared Django cache, for multi-process deployments.
+
+    The window is split into BUCKETS sub-windows, each an atomic counter, so the
+    count is exact to within one bucket width. If the cache is unreachable the
+    check falls back to the database COUNT, and so does every check when the cache
+    is per-process (LocMem): each worker would otherwise allow the full limit.
+    """
+
+    def __init__(self, cache_alias=None, buckets=None, clock=time.time, fallback=None, require_shared=True):
+        self.cache = caches[cache_alias or get_otp_rate_limit_setting('CACHE_ALIAS')]
+        self.buckets = buckets or get_otp_rate_limit_setting('BUCKETS')
+        self.clock = clock
+        self.fallback = fallback or DatabaseRateLimiter()
+        self.use_fallback = require_shared and not is_shared_cache(self.cache)
+
+    def allow(self, mobile_number, category):
+        if self.use_fallback:
+            return self.fallback.allow(mobile_number, category)
+        max_attempts, time_window = OTPLimit.get_limits(category)
+        window = time_window * 60
+        bucket_width = max(window / self.buckets, 1)
+        current_bucket = int(self.clock() // bucket_width)
+        keys = [f"otp_rl:{category}:{mobile_number}:{bucket}"
+                for bucket in range(current_bucket - self.buckets + 1, current_bucket + 1)]
+
+        try:
+            counts = self.cache.get_many(keys)
+            if sum(counts.values()) >= max_attempts:
+                return False
+
+            current_key = keys[-1]
+            # add() is a no-op if the bucket exists; incr() is atomic on shared backends
+            self.cache.add(current_key, 0, timeout=int(window + bucket_width))
+            current_count = self.cache.incr(current_key)
+            if sum(counts.get(key, 0) for key in keys[:-1]) + current_count > max_attempts:
+                # Lost a race with a concurrent request; give the slot back
+                self.cache.decr(current_key)
+                return False
+            return True
+        except Exception as e:
+            print(f"OTP rate limiter cache unavailable, falling back to database: {str(e)}")
+            return self.fallback.allow(mobile_number, category)
+
+
+_limiter_lock = threading.Lock()
+_limiter = None
+
+
+def get_otp_rate_limiter():
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = import_string(get_otp_rate_limit_setting('BACKEND'))()
+    return _limiter
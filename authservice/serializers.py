@@ -1,16 +1,20 @@
 import random
 
-from django.contrib.auth import authenticate
-from django.db import IntegrityError, DatabaseError
+from django.db import IntegrityError, DatabaseError, transaction
 from django.utils import timezone
 from rest_framework import serializers
 from rest_framework.exceptions import AuthenticationFailed
 
+from Insurecow.renditions import RenditionsField
+
 from .models import TempUser, User, Role, OTPCategory, OTPRequestLog, OTPVerification, Token, UserPersonalInfo, \
     UserFinancialInfo, UserNomineeInfo, OrganizationInfo
 from django.utils.timezone import now
 from datetime import timedelta, datetime
 
+from .sms import enqueue_otp
+from .tokens import issue_login_tokens
+
 
 def validate_mobile_number(value):
     if User.objects.filter(mobile_number=value).exists():
@@ -23,25 +27,35 @@ class LoginSerializer(serializers.Serializer):
     mobile_number = serializers.CharField()
     password = serializers.CharField(write_only=True)
 
+    def get_user(self, mobile_number, password):
+        # One query for the user and role instead of authenticate() plus a lazy role lookup
+        try:
+            user = User.objects.select_related('role').get(mobile_number=mobile_number)
+        except User.DoesNotExist:
+            # Hash anyway so unknown numbers take as long as wrong passwords
+            User().set_password(password)
+            return None
+        if not user.check_password(password):
+            return None
+        return user
+
     def validate(self, attrs):
         mobile_number = attrs.get('mobile_number')
         password = attrs.get('password')
 
-        user = authenticate(mobile_number=mobile_number, password=password)
+        user = self.get_user(mobile_number, password)
         if not user:
             raise AuthenticationFailed("Invalid mobile number or password")
 
         if not user.is_active:
             raise AuthenticationFailed("This account is disabled.")
 
-        # Get or create token for user
-        token_obj, _ = Token.objects.get_or_create(user=user)
-        token_obj.generate_tokens()  # Will only regenerate if missing or invalid
+        access_token, refresh_token = issue_login_tokens(user)
 
         return {
             'role': user.role.name if user.role else None,
-            'access_token': token_obj.access_token,
-            'refresh_token': token_obj.refresh_token,
+            'access_token': access_token,
+            'refresh_token': refresh_token,
         }
 
 class Step1Serializer(serializers.Serializer):
@@ -108,8 +122,8 @@ class Step1Serializer(serializers.Serializer):
                 is_verified=False
             )
 
-            # Replace print with proper logging or SMS sending
-            print(f"OTP sent: {otp_code}")
+            # Delivered asynchronously by the run_otp_outbox worker
+            enqueue_otp(mobile_number, otp_code, otp_request=otp_instance)
             return temp_user
 
         except IntegrityError as e:
@@ -187,6 +201,9 @@ class SetPasswordSerializer(serializers.Serializer):
 
 class SetPersonalInfoSerializer(serializers.ModelSerializer):
     profile_image_url = serializers.SerializerMethodField()
+    profile_image_renditions = RenditionsField('profile_image')
+    nid_front_renditions = RenditionsField('nid_front')
+    nid_back_renditions = RenditionsField('nid_back')
 
     class Meta:
         model = UserPersonalInfo
@@ -200,7 +217,10 @@ class SetPersonalInfoSerializer(serializers.ModelSerializer):
             'gender',
             'tin',
             'nid_front',
-            'nid_back'
+            'nid_back',
+            'profile_image_renditions',
+            'nid_front_renditions',
+            'nid_back_renditions',
         ]
         extra_kwargs = {
             'profile_image': {'write_only': True}  # Only accept uploads, but don't show in GET
@@ -405,6 +425,10 @@ class RoleSerializer(serializers.ModelSerializer):
         fields = ['id', 'name',]
 
 class UserPersonalInfoSerializer(serializers.ModelSerializer):
+    profile_image_renditions = RenditionsField('profile_image')
+    nid_front_renditions = RenditionsField('nid_front')
+    nid_back_renditions = RenditionsField('nid_back')
+
     class Meta:
         model = UserPersonalInfo
         fields = '__all__'
@@ -433,6 +457,8 @@ class OrganizationInfoSerializer(serializers.ModelSerializer):
 
 
 class InsuranceCompanySerializer(serializers.ModelSerializer):
+    logo_renditions = RenditionsField('logo')
+
     class Meta:
         model = InsuranceCompany
         fields = '__all__'
@@ -482,55 +508,52 @@ class UserSerializer(serializers.ModelSerializer):
         financial_info_data = validated_data.pop('financial_info', None)
         nominee_info_data = validated_data.pop('nominee_info', None)
         organization_info_data = validated_data.pop('organization_info', None)
-        password = validated_data.get('password', None)
+        password = validated_data.pop('password', None)
 
         if not password:
             raise serializers.ValidationError({"password": ["This field cannot be blank..........."]})
 
-        # Create the user without nested data
-        user = User.objects.create(**validated_data)
+        # Write the user and, through provision_users(), each profile table once
+        user = User(**validated_data)
         user.set_password(password)
-        user.save()
-
-        # Create related objects after user creation
-
-        # Personal Info
-        if personal_info_data:
-            personal_info, created = UserPersonalInfo.objects.update_or_create(
-                user=user,
-                defaults=personal_info_data
-            )
-            user.personal_info = personal_info
+        user.set_profile_data(**{
+            section: data for section, data in (
+                ('personal_info', personal_info_data),
+                ('financial_info', financial_info_data),
+                ('nominee_info', nominee_info_data),
+                ('organization_info', organization_info_data),
+            ) if data
+        })
+        with transaction.atomic():
             user.save()
 
-        # Financial Info
-        if financial_info_data:
-            financial_info, created = UserFinancialInfo.objects.update_or_create(
-                user=user,
-                defaults=financial_info_data
-            )
-            user.financial_info = financial_info
-            user.save()
+        return user
 
-        # Nominee Info
-        if nominee_info_data:
-            nominee_info, created = UserNomineeInfo.objects.update_or_create(
-                user=user,
-                defaults=nominee_info_data
-            )
-            user.nominee_info = nominee_info
-            user.save()
 
-        # Organization Info (for roles 2 or 3 only)
-        if organization_info_data and user.role_id in (2, 3):
-            org_info, created = OrganizationInfo.objects.update_or_create(
-                user=user,
-                defaults=organization_info_data
-            )
-            user.organization_info = org_info
-            user.save()
+class FarmerImportRowSerializer(serializers.Serializer):
+    """One row of a bulk farmer import. Field checks only; see authservice.onboarding for the rest."""
+    mobile_number = serializers.CharField(max_length=15)
+    password = serializers.CharField(write_only=True)
+    personal_info = UserPersonalInfoSerializer(required=False)
+    financial_info = UserFinancialInfoSerializer(required=False)
+    nominee_info = UserNomineeInfoSerializer(required=False)
 
-        return user
+    def validate_password(self, value):
+        if not value:
+            raise serializers.ValidationError("Password cannot be blank.")
+        return value
+
+    def validate(self, data):
+        # The same AUTH_PASSWORD_VALIDATORS as a password change, against the user this row creates
+        personal_info = data.get('personal_info', {})
+        user = User(mobile_number=data['mobile_number'])
+        user.first_name = personal_info.get('first_name', '')
+        user.last_name = personal_info.get('last_name', '')
+        try:
+            validate_password(data['password'], user)
+        except ValidationError as e:
+            raise serializers.ValidationError({"password": e.messages})
+        return data
 
 
 class SubUserSerializer(serializers.ModelSerializer):
@@ -539,6 +562,14 @@ class SubUserSerializer(serializers.ModelSerializer):
         fields = ['id', 'mobile_number', 'role', 'is_active', 'date_joined']
 
 
+class SubUserTreeSerializer(SubUserSerializer):
+    depth = serializers.IntegerField(read_only=True)
+    sub_user_count = serializers.IntegerField(read_only=True, required=False)
+
+    class Meta(SubUserSerializer.Meta):
+        fields = SubUserSerializer.Meta.fields + ['managed_by', 'depth', 'sub_user_count']
+
+
 from rest_framework import serializers
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
@@ -0,0 +1,192 @@
+import random
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+from django.utils.timezone import now
+
+from .models import OTPOutbox, OTPRequestLog, OTPDeliveryStatus
+
+DEFAULT_SMS_SETTINGS = {
+    'DEFAULT_PROVIDER': 'fake',
+    'PROVIDERS': {
+        'fake': {'BACKEND': 'authservice.sms.FakeSMSGateway', 'OPTIONS': {}},
+    },
+    'BATCH_SIZE': 100,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF': 10,  # seconds, doubled on every failed attempt
+    'MAX_RETRY_BACKOFF': 600,
+    'CLAIM_TIMEOUT': 300,  # seconds before a row stuck in 'sending' is retried
+}
+
+OTP_MESSAGE = "Your InsureCow OTP is {otp_code}"
+
+
+def get_sms_setting(name):
+    return getattr(settings, 'SMS', {}).get(name, DEFAULT_SMS_SETTINGS[name])
+
+
+class SendResult:
+    def __init__(self, success, message_id=None, error=None):
+        self.success = success
+        self.message_id = message_id
+        self.error = error
+
+
+class BaseSMSGateway:
+    """Gateways send a batch of OTPOutbox rows and return one SendResult per row, in order."""
+
+    def __init__(self, **options):
+        self.options = options
+
+    def send_batch(self, messages):
+        raise NotImplementedError
+
+
+class FakeSMSGateway(BaseSMSGateway):
+    """
+    Offline gateway for development and load tests.
+
+    OPTIONS: LATENCY (seconds per batch), FAILURE_RATE (0..1), VERBOSE (print each message).
+    The last OUTBOX_SIZE sent messages are kept in FakeSMSGateway.outbox.
+    """
+    OUTBOX_SIZE = 1000
+    outbox = deque(maxlen=OUTBOX_SIZE)
+    _lock = threading.Lock()
+
+    def send_batch(self, messages):
+        time.sleep(self.options.get('LATENCY', 0))
+        failure_rate = self.options.get('FAILURE_RATE', 0)
+        results = []
+        for message in messages:
+            if random.random() < failure_rate:
+                results.append(SendResult(False, error="Simulated gateway failure"))
+                continue
+            if self.options.get('VERBOSE', False):
+                print(f"Sending OTP SMS to {message.mobile_number}: {message.message}")
+            with self._lock:
+                self.outbox.append((message.mobile_number, message.message))
+            results.append(SendResult(True, message_id=uuid.uuid4().hex))
+        return results
+
+
+_gateways = {}
+
+
+def get_gateway(provider):
+    if provider not in _gateways:
+        config = get_sms_setting('PROVIDERS')[provider]
+        _gateways[provider] = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _gateways[provider]
+
+
+def enqueue_otp(mobile_number, otp_code, otp_request=None, provider=None):
+    """Queue an OTP for delivery; it is written in the caller's transaction and sent by the worker."""
+    return OTPOutbox.objects.create(
+        otp_request=otp_request,
+        mobile_number=mobile_number,
+        message=OTP_MESSAGE.format(otp_code=otp_code),
+        provider=provider or get_sms_setting('DEFAULT_PROVIDER'),
+    )
+
+
+def claim_batch(batch_size):
+    """Lock a batch of due messages, mark them 'sending' and return them."""
+    current = now()
+    stale = current - timedelta(seconds=get_sms_setting('CLAIM_TIMEOUT'))
+    with transaction.atomic():
+        messages = list(
+            OTPOutbox.objects.select_for_update(skip_locked=True)
+            .filter(
+                Q(status=OTPDeliveryStatus.PENDING, next_attempt_at__lte=current) |
+                Q(status=OTPDeliveryStatus.SENDING, claimed_at__lt=stale)
+            )
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        for message in messages:
+            message.status = OTPDeliveryStatus.SENDING
+            message.claimed_at = current
+        OTPOutbox.objects.bulk_update(messages, ['status', 'claimed_at'])
+    return messages
+
+
+def retry_delay(attempts):
+    delay = get_sms_setting('RETRY_BACKOFF') * (2 ** (attempts - 1))
+    delay = min(delay, get_sms_setting('MAX_RETRY_BACKOFF'))
+    # Jitter so a burst of failures does not retry in lockstep
+    return delay * random.uniform(0.8, 1.2)
+
+
+def dispatch_batch(messages):
+    """Send claimed messages grouped by provider and record the outcome. Returns (sent, failed)."""
+    by_provider = defaultdict(list)
+    for message in messages:
+        by_provider[message.provider].append(message)
+
+    max_attempts = get_sms_setting('MAX_ATTEMPTS')
+    current = now()
+    delivered = defaultdict(list)
+    sent = failed = 0
+
+    for provider, provider_messages in by_provider.items():
+        try:
+            results = get_gateway(provider).send_batch(provider_messages)
+        except Exception as e:
+            results = [SendResult(False, error=str(e))] * len(provider_messages)
+        results = list(results)
+        if len(results) != len(provider_messages):
+            # Results are matched to messages by position; the ones without a result count as failed attempts
+            error = f"Gateway returned {len(results)} results for {len(provider_messages)} messages"
+            print(f"SMS provider {provider}: {error}")
+            results = results[:len(provider_messages)]
+            results += [SendResult(False, error=error)] * (len(provider_messages) - len(results))
+
+        for message, result in zip(provider_messages, results):
+            message.attempts += 1
+            message.claimed_at = None
+            if result.success:
+                message.status = OTPDeliveryStatus.SENT
+                message.sent_at = current
+                message.provider_message_id = result.message_id
+                message.last_error = None
+                sent += 1
+            else:
+                message.last_error = result.error
+                if message.attempts >= max_attempts:
+                    message.status = OTPDeliveryStatus.FAILED
+                    failed += 1
+                else:
+                    message.status = OTPDeliveryStatus.PENDING
+                    message.next_attempt_at = current + timedelta(seconds=retry_delay(message.attempts))
+            if message.otp_request_id and message.status != OTPDeliveryStatus.PENDING:
+                delivered[message.status].append(message.otp_request_id)
+
+    with transaction.atomic():
+        OTPOutbox.objects.bulk_update(messages, [
+            'attempts', 'status', 'claimed_at', 'sent_at', 'provider_message_id', 'last_error', 'next_attempt_at',
+        ])
+        for status, otp_request_ids in delivered.items():
+            OTPRequestLog.objects.filter(id__in=otp_request_ids).update(
+                delivery_status=status,
+                delivered_at=current if status == OTPDeliveryStatus.SENT else None,
+            )
+    return sent, failed
+
+
+def drain_outbox(batch_size=None):
+    """Send everything currently due. Returns (sent, failed) totals."""
+    batch_size = batch_size or get_sms_setting('BATCH_SIZE')
+    total_sent = total_failed = 0
+    while True:
+        messages = claim_batch(batch_size)
+        if not messages:
+            return total_sent, total_failed
+        sent, failed = dispatch_batch(messages)
+        total_sent += sent
+        total_failed += failed
@@ -1,3 +1,142 @@
-from django.test import TestCase
+import shutil
+import tempfile
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from Insurecow.authentication import user_cache
+from . import sms
+from .models import OTPCategory, OTPDeliveryStatus, OTPLimit, OTPOutbox, OTPRequestLog, Role, User
+from .ratelimit import CacheRateLimiter, DatabaseRateLimiter
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AdminCreateUserQueriesTest(TestCase):
+    url = '/api/v1/administrator/create-user/'
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('farmer', 'manager', 'insurer'):
+            Role.objects.create(name=name)
+        cls.admin = User.objects.create_superuser(mobile_number='01000000000', password='x', role_id=2)
+        cls.manager = User.objects.create_user(mobile_number='01700000000', password='x', role_id=2)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def payload(self, mobile_number, role):
+        return {
+            'mobile_number': mobile_number,
+            'password': 'pw',
+            'role': role,
+            'managed_by': self.manager.pk,
+            'onboarded_by': self.admin.pk,
+            'personal_info': {'first_name': 'A', 'last_name': 'B'},
+            'financial_info': {'bank_name': 'X', 'branch_name': 'Y', 'account_name': 'Z', 'account_number': '1'},
+            'nominee_info': {'nominee_name': 'N', 'phone': '1', 'nid': '2'},
+            'organization_info': {'name': 'Org'},
+        }
+
+    # Inside a TestCase the serializer's transaction and provision_users() run in savepoints,
+    # which add a SAVEPOINT and a RELEASE query each to the counts below
+
+    def test_farmer_with_every_section(self):
+        with self.assertNumQueries(20):
+            response = self.client.post(self.url, self.payload('01900000000', 1), format='json')
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(mobile_number='01900000000')
+        self.assertTrue(user.personal_info_complete)
+        self.assertEqual(user.nominee_info.nominee_name, 'N')
+
+    def test_insurer_with_every_section(self):
+        with self.assertNumQueries(22):
+            response = self.client.post(self.url, self.payload('01900000001', 3), format='json')
+        self.assertEqual(response.status_code, 201)
+        user = User.objects.get(mobile_number='01900000001')
+        self.assertEqual(user.organization_info.name, 'Org')
+        self.assertEqual(user.insurance_company.name, 'Org')
+
+
+class OTPRateLimitTest(TestCase):
+    category = OTPCategory.LOGIN
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        OTPLimit.objects.create(category=self.category, max_attempts=2, time_window=5)
+
+    def test_per_process_cache_falls_back_to_database(self):
+        limiter = CacheRateLimiter()
+        self.assertIsInstance(limiter.fallback, DatabaseRateLimiter)
+        for _ in range(2):
+            self.assertTrue(limiter.allow('01700000001', self.category))
+            OTPRequestLog.objects.create(mobile_number='01700000001', otp_code='000000', category=self.category)
+        self.assertFalse(limiter.allow('01700000001', self.category))
+        # A limiter in another worker sees the same count
+        self.assertFalse(CacheRateLimiter().allow('01700000001', self.category))
+        self.assertTrue(limiter.allow('01700000002', self.category))
+
+    def test_shared_cache_enforces_limit(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                                       'otp': shared}):
+            limiter = CacheRateLimiter(cache_alias='otp')
+            self.assertFalse(limiter.use_fallback)
+            self.assertEqual([limiter.allow('01700000001', self.category) for _ in range(3)], [True, True, False])
+            self.assertFalse(CacheRateLimiter(cache_alias='otp').allow('01700000001', self.category))
+            self.assertTrue(limiter.allow('01700000002', self.category))
+        self.assertFalse(OTPRequestLog.objects.exists())
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class CachedUserSaveTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('farmer', 'manager', 'insurer'):
+            Role.objects.create(name=name)
+        cls.user = User.objects.create_user(mobile_number='01900000001', password='x', role_id=1)
+
+    def setUp(self):
+        user_cache.clear()
+        self.addCleanup(user_cache.clear)
+
+    def test_save_writes_only_changed_columns(self):
+        user_cache.set(self.user.pk, User.objects.select_related('role').get(pk=self.user.pk))
+        # Another process changes the row while the cached copy is still fresh
+        User.objects.filter(pk=self.user.pk).update(role_id=3, is_active=False)
+
+        request_user = user_cache.get(self.user.pk)
+        request_user.set_password('new password')
+        request_user.save()
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertTrue(user.check_password('new password'))
+        self.assertEqual(user.role_id, 3)
+        self.assertFalse(user.is_active)
+
+
+class ShortSMSGateway(sms.BaseSMSGateway):
+    """Drops the result of the last message of every batch."""
+
+    def send_batch(self, messages):
+        return [sms.SendResult(True, message_id=str(message.pk)) for message in messages[:-1]]
+
+
+@override_settings(SMS={'DEFAULT_PROVIDER': 'short', 'MAX_ATTEMPTS': 1,
+                        'PROVIDERS': {'short': {'BACKEND': 'authservice.tests.ShortSMSGateway'}}})
+class OutboxDrainTest(TestCase):
+    def setUp(self):
+        self.addCleanup(sms._gateways.clear)
+
+    def test_messages_without_a_result_are_failed(self):
+        messages = [sms.enqueue_otp(f'0170000000{i}', '123456') for i in range(3)]
+
+        self.assertEqual(sms.drain_outbox(), (2, 1))
+        statuses = dict(OTPOutbox.objects.values_list('pk', 'status'))
+        self.assertEqual([statuses[message.pk] for message in messages],
+                         [OTPDeliveryStatus.SENT, OTPDeliveryStatus.SENT, OTPDeliveryStatus.FAILED])
+        self.assertIn('2 results for 3 messages', OTPOutbox.objects.get(pk=messages[2].pk).last_error)
@@ -0,0 +1,79 @@
+import atexit
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.utils.timezone import now
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .models import Token
+
+# 'sync'  - reuse/refresh the stored Token row inside the request (previous behaviour)
+# 'async' - mint fresh tokens and store them from a background thread
+# 'off'   - mint fresh tokens and never touch the Token table
+DEFAULT_LOGIN_TOKEN_STORE = 'async'
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='token-store')
+atexit.register(_executor.shutdown, wait=True)
+
+
+def get_login_token_store():
+    return getattr(settings, 'LOGIN_TOKEN_STORE', DEFAULT_LOGIN_TOKEN_STORE)
+
+
+_pending = {}
+_pending_lock = threading.Lock()
+# Logins arriving within this window are written together
+TOKEN_STORE_DELAY = 0.05
+
+
+def _store_pending_tokens():
+    """Write the latest tokens queued per user with one bulk update and one bulk insert."""
+    global _pending
+    time.sleep(TOKEN_STORE_DELAY)
+    with _pending_lock:
+        pending, _pending = _pending, {}
+    if not pending:
+        return
+    try:
+        existing = {token.user_id: token for token in Token.objects.filter(user_id__in=pending)}
+        missing = []
+        current = now()
+        for user_id, (access_token, refresh_token) in pending.items():
+            token = existing.get(user_id) or Token(user_id=user_id)
+            token.access_token = access_token
+            token.refresh_token = refresh_token
+            token.updated_at = current
+            if user_id not in existing:
+                missing.append(token)
+        Token.objects.bulk_update(existing.values(), ['access_token', 'refresh_token', 'updated_at'])
+        Token.objects.bulk_create(missing, ignore_conflicts=True)
+    except Exception as e:
+        print(f"Error while storing tokens for {len(pending)} users: {str(e)}")
+        # The worker thread keeps its connection between batches; drop it if it went bad
+        connection.close()
+
+
+def store_tokens_async(user_id, access_token, refresh_token):
+    with _pending_lock:
+        schedule = not _pending
+        _pending[user_id] = (access_token, refresh_token)
+    if schedule:
+        _executor.submit(_store_pending_tokens)
+
+
+def issue_login_tokens(user, store=None):
+    """Return (access_token, refresh_token) for a successful login."""
+    store = store or get_login_token_store()
+    if store == 'sync':
+        token_obj, _ = Token.objects.get_or_create(user=user)
+        token_obj.generate_tokens()  # Will only regenerate if missing or invalid
+        return token_obj.access_token, token_obj.refresh_token
+
+    refresh = RefreshToken.for_user(user)
+    access_token, refresh_token = str(refresh.access_token), str(refresh)
+    if store == 'async':
+        store_tokens_async(user.pk, access_token, refresh_token)
+    return access_token, refresh_token
@@ -6,12 +6,13 @@ from rest_framework.views import APIView
 from rest_framework.permissions import AllowAny, IsAuthenticated
 import jwt
 from django.conf import settings
+from django.db.models import F
 
 from administrator.views import IsSuperUser
-from .models import UserNomineeInfo, UserFinancialInfo, UserPersonalInfo, OrganizationInfo
+from .models import User, UserNomineeInfo, UserFinancialInfo, UserPersonalInfo, OrganizationInfo
 from .serializers import Step1Serializer, OTPVerifySerializer, SetPasswordSerializer, LoginSerializer, \
     SetPersonalInfoSerializer, SetFinancialInfoSerializer, SetNomineeInfoSerializer, SetOrganizationInfoSerializer, \
-    SubUserSerializer, ChangePasswordSerializer
+    SubUserSerializer, SubUserTreeSerializer, ChangePasswordSerializer
 from Insurecow.utils import handle_serializer_error, success_response, validation_error_from_serializer, error_response
 
 from rest_framework import status
@@ -314,8 +315,29 @@ class SubUsersAPIView(APIView):
                 status_code=status.HTTP_403_FORBIDDEN
             )
 
-        sub_users = current_user.sub_users.all()
-        serializer = SubUserSerializer(sub_users, many=True)
+        # ?depth=N (or "all") walks the hierarchy below the direct sub-users; ?counts=true adds subtree sizes
+        depth = request.query_params.get('depth')
+        with_counts = request.query_params.get('counts', '').lower() in ('1', 'true', 'yes')
+        if depth is None and not with_counts:
+            sub_users = current_user.sub_users.all()
+            serializer = SubUserSerializer(sub_users, many=True)
+            return success_response("User List retrieved successfully.", data=serializer.data)
+
+        if depth in (None, ''):
+            max_depth = 1
+        elif depth == 'all':
+            max_depth = None
+        elif depth.isdigit() and int(depth) > 0:
+            max_depth = int(depth)
+        else:
+            return error_response("depth must be a positive number or 'all'.", status_code=status.HTTP_400_BAD_REQUEST)
+
+        sub_users = current_user.get_descendants(max_depth=max_depth).annotate(
+            depth=F('ancestor_links__depth')
+        ).order_by('depth', 'id')
+        if with_counts:
+            sub_users = sub_users.annotate(sub_user_count=User.subtree_size_expression())
+        serializer = SubUserTreeSerializer(sub_users, many=True)
         return success_response("User List retrieved successfully.", data=serializer.data)
 
 class ChangePasswordAPIView(APIView):
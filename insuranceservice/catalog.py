@@ -0,0 +1,95 @@
+from collections import defaultdict
+
+from django.core.cache import cache
+
+from Insurecow.cache import bounded_timeout, new_version
+
+from .models import InsuranceCompany, InsuranceType, InsurancePeriod, PremiumPercentage
+
+CATALOG_CACHE_KEY = 'insurance_catalog'
+CATALOG_VERSION_KEY = 'insurance_catalog_version'
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = new_version()
+        cache.add(CATALOG_VERSION_KEY, version, timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def invalidate_catalog():
+    """Move the catalog to a new version so the next read rebuilds the tree."""
+    cache.set(CATALOG_VERSION_KEY, new_version(), timeout=None)
+
+
+def build_catalog():
+    """Build the company -> type -> period -> premium tree with one query per level."""
+    companies = InsuranceCompany.objects.order_by('id').values('id', 'name', 'logo')
+    insurance_types = InsuranceType.objects.order_by('id').values('id', 'name', 'company_id', 'category_id')
+    insurance_periods = InsurancePeriod.objects.order_by('id').values('id', 'name', 'company_id', 'category_id')
+    premiums = PremiumPercentage.objects.order_by('id').values(
+        'id', 'percentage', 'company_id', 'category_id', 'insurance_type_id', 'insurance_period_id'
+    )
+
+    types_by_company = defaultdict(list)
+    for insurance_type in insurance_types:
+        types_by_company[insurance_type['company_id']].append(insurance_type)
+
+    periods_by_category = defaultdict(list)
+    for period in insurance_periods:
+        periods_by_category[(period['company_id'], period['category_id'])].append(period)
+
+    premiums_by_key = defaultdict(list)
+    for premium in premiums:
+        key = (premium['company_id'], premium['category_id'],
+               premium['insurance_type_id'], premium['insurance_period_id'])
+        premiums_by_key[key].append({
+            "id": premium['id'],
+            "percentage": premium['percentage']
+        })
+
+    data = []
+    for company in companies:
+        company_data = {
+            "id": company['id'],
+            "name": company['name'],
+            "logo": InsuranceCompany.logo.field.storage.url(company['logo']) if company['logo'] else None,
+            "insurance_types": [],
+        }
+
+        for insurance_type in types_by_company[company['id']]:
+            category_id = insurance_type['category_id']
+            type_data = {
+                "id": insurance_type['id'],
+                "name": insurance_type['name'],
+                "periods": []
+            }
+
+            for period in periods_by_category[(company['id'], category_id)]:
+                type_data["periods"].append({
+                    "id": period['id'],
+                    "name": period['name'],
+                    "premiums": premiums_by_key[(company['id'], category_id, insurance_type['id'], period['id'])]
+                })
+
+            company_data["insurance_types"].append(type_data)
+
+        data.append(company_data)
+
+    return data
+
+
+def get_catalog():
+    """
+    Return the cached catalog tree, rebuilding it when the version has moved on. With a
+    per-process cache other workers pick up changes within PROCESS_LOCAL_TIMEOUT instead.
+    """
+    key = f"{CATALOG_CACHE_KEY}:{get_catalog_version()}"
+    data = cache.get(key)
+    if data is None:
+        data = build_catalog()
+        cache.set(key, data, timeout=bounded_timeout(cache, CATALOG_CACHE_TIMEOUT))
+    return data
@@ -1,8 +1,8 @@
 from datetime import date
 
 from django.conf import settings
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from assetservice.models import Asset
 
@@ -199,3 +199,18 @@ def create_or_update_insurance_product(sender, instance, created, **kwargs):
 
     except Exception as e:
         print(f"Error while creating/updating InsuranceProduct: {str(e)}")
+
+
+@receiver(post_save, sender=InsuranceCompany)
+@receiver(post_delete, sender=InsuranceCompany)
+@receiver(post_save, sender=InsuranceType)
+@receiver(post_delete, sender=InsuranceType)
+@receiver(post_save, sender=InsurancePeriod)
+@receiver(post_delete, sender=InsurancePeriod)
+@receiver(post_save, sender=PremiumPercentage)
+@receiver(post_delete, sender=PremiumPercentage)
+def invalidate_insurance_catalog(sender, instance, **kwargs):
+    from .catalog import invalidate_catalog
+
+    # Bump after commit so a concurrent rebuild cannot cache pre-commit rows under the new version
+    transaction.on_commit(invalidate_catalog)
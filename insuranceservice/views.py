@@ -1,5 +1,6 @@
 from Insurecow.utils import success_response, handle_serializer_error, validation_error_from_serializer
 from .serializers import AssetInsuranceSerializer, InsuranceClaimSerializer
+from .catalog import get_catalog
 from rest_framework.response import Response
 from rest_framework import status, serializers
 from .models import InsuranceCompany, InsuranceType, InsurancePeriod, PremiumPercentage, InsuranceCategory
@@ -103,55 +104,10 @@ class PremiumPercentageDetailAPIView(APIView):
 class CompanyWiseInsuranceAPIView(APIView):
     permission_classes = [IsAuthenticated]
     def get(self, request, *args, **kwargs):
-        companies = InsuranceCompany.objects.all()
-        data = []
-
-        for company in companies:
-            company_data = {
-                "id": company.id,
-                "name": company.name,
-                "logo": request.build_absolute_uri(company.logo.url) if company.logo else None,
-                "insurance_types": [],
-            }
-
-            insurance_types = InsuranceType.objects.filter(company=company)
-
-            for insurance_type in insurance_types:
-                type_data = {
-                    "id": insurance_type.id,
-                    "name": insurance_type.name,
-                    "periods": []
-                }
-
-                insurance_periods = InsurancePeriod.objects.filter(
-                    company=company,
-                    category=insurance_type.category
-                )
-
-                for period in insurance_periods:
-                    premiums = PremiumPercentage.objects.filter(
-                        company=company,
-                        category=insurance_type.category,
-                        insurance_type=insurance_type,
-                        insurance_period=period
-                    )
-
-                    premium_list = []
-                    for premium in premiums:
-                        premium_list.append({
-                            "id": premium.id,
-                            "percentage": premium.percentage
-                        })
-
-                    type_data["periods"].append({
-                        "id": period.id,
-                        "name": period.name,
-                        "premiums": premium_list
-                    })
-
-                company_data["insurance_types"].append(type_data)
-
-            data.append(company_data)
+        data = [
+            {**company, "logo": request.build_absolute_uri(company["logo"]) if company["logo"] else None}
+            for company in get_catalog()
+        ]
 
         return Response({
             "statusCode": str(status.HTTP_200_OK),